@@ -14,8 +14,13 @@ import cv2
 import numpy as np
 from pathlib import Path
 
-from edge_detection import EdgeDetector
+from edge_detection import OUTPUTS, DEFAULT_OUTPUTS
 from config_manager import ConfigManager
+from encoders import ImageEncoder
+from responses import negotiate_format, binary_response, select_layers, detection_params
+from result_cache import ResultCache, detect_encoded
+from job_store import JobStore, JobRunner
+from job_api import register_job_api, job_handler
 from logger import setup_logger
 
 # Initialize Flask app
@@ -27,14 +32,24 @@ config = ConfigManager()
 logger = setup_logger('web_app')
 
 # Configuration
-UPLOAD_FOLDER = 'uploads'
 RESULT_FOLDER = 'results'
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(RESULT_FOLDER, exist_ok=True)
 
 web_config = config.get_web_config()
 app.config['MAX_CONTENT_LENGTH'] = web_config['max_upload_size']
 ALLOWED_EXTENSIONS = set(web_config['allowed_extensions'])
+# Encodes response images; binary masks go out as 1-bit PNG
+ENCODER = ImageEncoder.from_config(config)
+# Layers the detection endpoints can return: the decoded upload (only when
+# asked for) and any detector output. Only requested layers are computed.
+LAYERS = ('original',) + OUTPUTS
+# Layers /api/compare returns by default
+COMPARE_LAYERS = ('sobel_x', 'sobel_y', 'sobel_combined', 'laplacian', 'canny')
+# Threads for tiling a single large upload; no point exceeding the core count
+MAX_WORKERS = min(config.get_performance_config()['max_workers'], os.cpu_count() or 1)
+# Encoded results by upload content and parameters; None if disabled. The
+# disk tier lives in RESULT_FOLDER, so all server workers share it.
+RESULT_CACHE = ResultCache.from_config(config, folder=RESULT_FOLDER)
 
 
 def allowed_file(filename: str) -> bool:
@@ -43,10 +58,21 @@ def allowed_file(filename: str) -> bool:
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-def image_to_base64(image: np.ndarray) -> str:
-    """Convert numpy image to base64 string."""
-    _, buffer = cv2.imencode('.jpg', image)
-    return base64.b64encode(buffer).decode('utf-8')
+# Asynchronous jobs, kept in RESULT_FOLDER so they survive restarts. Each
+# server worker starts its runner on its first job request; a job left by
+# a worker that exited is resumed by another once its lease expires.
+jobs_config = config.get_jobs_config()
+JOBS = JobStore.from_config(config, folder=RESULT_FOLDER)
+JOB_RUNNER = JobRunner(JOBS, job_handler(ENCODER, RESULT_CACHE, MAX_WORKERS),
+                       workers=jobs_config['workers'], logger=logger)
+register_job_api(app, JOBS, JOB_RUNNER, ENCODER, LAYERS, DEFAULT_OUTPUTS, ALLOWED_EXTENSIONS,
+                 logger)
+
+
+def image_to_base64(image, name: Optional[str] = None) -> str:
+    """Convert numpy image (or already encoded bytes) to base64 string in the configured output format."""
+    data = image if isinstance(image, bytes) else ENCODER.encode(image, name)
+    return base64.b64encode(data).decode('utf-8')
 
 
 @app.route('/')
@@ -70,8 +96,15 @@ def detect_edges():
     """
     Edge detection API endpoint.
     
-    Accepts: multipart/form-data with 'image' file
-    Returns: JSON with base64 encoded images
+    Accepts: multipart/form-data with 'image' file; optional 'outputs'
+             (comma-separated layers from LAYERS; default DEFAULT_OUTPUTS,
+             so the upload is only echoed back as 'original' on request)
+             and 'format'
+    Returns: JSON with base64 encoded images by default. format=multipart
+             (or Accept: multipart/mixed), zip (application/zip) or image
+             (image/png etc., exactly one output) return the encoded images as is.
+             'cached' tells whether the result came from RESULT_CACHE, in
+             which case timings_ms are those of the original computation
     """
     try:
         # Validate request
@@ -86,50 +119,59 @@ def detect_edges():
         if not allowed_file(file.filename):
             return jsonify({'error': f'File type not allowed. Allowed: {ALLOWED_EXTENSIONS}'}), 400
         
-        # Get parameters from request
-        params = request.form.to_dict()
-        sobel_kernel = int(params.get('sobel_kernel', 3))
-        laplacian_kernel = int(params.get('laplacian_kernel', 3))
-        canny_t1 = int(params.get('canny_threshold1', 50))
-        canny_t2 = int(params.get('canny_threshold2', 150))
-        blur_size = int(params.get('blur_kernel', 5))
+        # Response format (JSON by default) and the layers to return
+        try:
+            response_format = negotiate_format(request.values.get('format'),
+                                               request.accept_mimetypes)
+            layers = select_layers(request.values.get('outputs'), LAYERS, DEFAULT_OUTPUTS)
+            params = detection_params(request.form, layers)
+            if response_format == 'image' and len(layers) != 1:
+                raise ValueError("A raw image response needs exactly one output; "
+                                 "choose one with outputs=")
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         logger.info(f"Processing image: {file.filename}")
-        logger.debug(f"Parameters - Sobel: {sobel_kernel}, Laplacian: {laplacian_kernel}, Canny: ({canny_t1}, {canny_t2})")
+        logger.debug(f"Parameters: {params}")
         
-        # Save uploaded file
+        # Decode the upload in memory
         filename = secure_filename(file.filename)
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
+        data = file.read()
         
-        # Process image
-        detector = EdgeDetector(filepath)
-        detector.preprocess(blur_kernel_size=(blur_size, blur_size), sigma=1.4)
-        detector.apply_sobel(kernel_size=sobel_kernel)
-        detector.apply_laplacian(kernel_size=laplacian_kernel)
-        detector.apply_canny(threshold1=canny_t1, threshold2=canny_t2)
+        # Process image, or reuse the result of an identical request
+        encoded, details, cached = detect_encoded(
+            data, layers, ENCODER, RESULT_CACHE, name=filename, workers=MAX_WORKERS, **params
+        )
+        # None unless the Canny layer was computed
+        threshold1, threshold2 = details['canny_thresholds'] or (None, None)
         
-        # Convert results to base64
-        results = {
-            'original': image_to_base64(detector.original_image),
-            'grayscale': image_to_base64(detector.gray_image),
-            'blurred': image_to_base64(detector.blurred_image),
-            'sobel_x': image_to_base64(detector.sobel_x),
-            'sobel_y': image_to_base64(detector.sobel_y),
-            'sobel_combined': image_to_base64(detector.sobel_combined),
-            'laplacian': image_to_base64(detector.laplacian),
-            'canny': image_to_base64(detector.canny)
-        }
+        if response_format != 'json':
+            # Raw encoded images
+            return binary_response(response_format, encoded, {
+                'canny_thresholds': {'threshold1': threshold1, 'threshold2': threshold2,
+                                     'auto': params['canny_auto']},
+                'timings_ms': details['timings_ms'],
+                'cached': cached,
+                'filename': filename
+            }, ENCODER)
         
-        # Cleanup
-        os.remove(filepath)
+        # Convert results to base64
+        results = {name: image_to_base64(layer, name) for name, layer in encoded.items()}
         
-        logger.info(f"Successfully processed image: {filename}")
+        logger.info(f"Successfully processed image: {filename}"
+                    f"{' (cached)' if cached else ''}")
         
         return jsonify({
             'success': True,
             'message': 'Edge detection completed',
             'results': results,
+            'canny_thresholds': {
+                'threshold1': threshold1,
+                'threshold2': threshold2,
+                'auto': params['canny_auto']
+            },
+            'timings_ms': details['timings_ms'],
+            'cached': cached,
             'filename': filename
         })
     
@@ -159,7 +201,7 @@ def get_algorithms():
             {
                 'name': 'Canny',
                 'description': 'Multi-stage optimal edge detection',
-                'parameters': ['threshold1', 'threshold2']
+                'parameters': ['threshold1', 'threshold2', 'auto']
             }
         ]
     })
@@ -167,7 +209,12 @@ def get_algorithms():
 
 @app.route('/api/compare', methods=['POST'])
 def compare_algorithms():
-    """Compare different edge detection algorithms on an image."""
+    """
+    Compare different edge detection algorithms on an image.
+    
+    Accepts: multipart/form-data with 'image' file and optional 'outputs'
+             (comma-separated layers from LAYERS; default COMPARE_LAYERS)
+    """
     try:
         if 'image' not in request.files:
             return jsonify({'error': 'No image file provided'}), 400
@@ -178,26 +225,22 @@ def compare_algorithms():
             return jsonify({'error': 'File type not allowed'}), 400
         
         filename = secure_filename(file.filename)
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
         
-        detector = EdgeDetector(filepath)
-        detector.preprocess()
-        detector.apply_sobel()
-        detector.apply_laplacian()
-        detector.apply_canny()
+        try:
+            layers = select_layers(request.values.get('outputs'), LAYERS, COMPARE_LAYERS)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # Skip the color decode unless the upload itself is wanted back
+        encoded, _, _ = detect_encoded(
+            file.read(), layers, ENCODER, RESULT_CACHE, name=filename,
+            decode='color' if 'original' in layers else 'grayscale'
+        )
         
         results = {
-            'algorithms': {
-                'sobel_x': image_to_base64(detector.sobel_x),
-                'sobel_y': image_to_base64(detector.sobel_y),
-                'sobel_combined': image_to_base64(detector.sobel_combined),
-                'laplacian': image_to_base64(detector.laplacian),
-                'canny': image_to_base64(detector.canny)
-            }
+            'algorithms': {name: image_to_base64(layer, name) for name, layer in encoded.items()}
         }
         
-        os.remove(filepath)
         return jsonify(results)
     
     except Exception as e:
@@ -218,10 +261,11 @@ def analyze_image():
             return jsonify({'error': 'File type not allowed'}), 400
         
         filename = secure_filename(file.filename)
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
+        data = np.frombuffer(file.read(), dtype=np.uint8)
         
-        image = cv2.imread(filepath)
+        image = cv2.imdecode(data, cv2.IMREAD_COLOR)
+        if image is None:
+            return jsonify({'error': 'Could not decode image'}), 400
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         
         results = {
@@ -237,7 +281,6 @@ def analyze_image():
             }
         }
         
-        os.remove(filepath)
         return jsonify(results)
     
     except Exception as e:
@@ -245,6 +288,19 @@ def analyze_image():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/cache', methods=['GET'])
+def cache_stats():
+    """
+    Result cache statistics.
+    
+    Counters are those of the worker process that answers (see 'pid'); the
+    disk tier figures are shared by all workers.
+    """
+    if RESULT_CACHE is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(RESULT_CACHE.stats(), enabled=True))
+
+
 @app.route('/api/info', methods=['GET'])
 def get_info():
     """Get service information."""
@@ -0,0 +1,102 @@
+"""
+Batch Input Discovery
+Stream image paths from a directory tree with include/exclude globs
+"""
+
+import fnmatch
+import os
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff')
+
+
+def _matches(relative_path, patterns):
+    """Check a '/'-separated relative path against glob patterns."""
+    return any(fnmatch.fnmatchcase(relative_path, pattern) for pattern in patterns)
+
+
+def _pruned_folders(input_folder, folders):
+    """'/'-separated paths, relative to input_folder, of the folders under it."""
+    root = os.path.realpath(input_folder)
+    pruned = set()
+    for folder in folders:
+        try:
+            relative = os.path.relpath(os.path.realpath(folder), root)
+        except ValueError:
+            continue  # On another drive
+        # The root itself cannot be pruned; folders outside it are never walked
+        if relative != os.curdir and relative.split(os.sep)[0] != os.pardir:
+            pruned.add(relative.replace(os.sep, '/'))
+    return pruned
+
+
+def discover_images(input_folder, include=None, exclude=None, recursive=True,
+                    extensions=IMAGE_EXTENSIONS, skip_folders=()):
+    """
+    Yield image paths under a folder as they are found.
+    
+    Walks the tree depth-first with os.scandir, one directory listing at a
+    time, so the first image is available immediately and memory does not
+    grow with the size of the tree. Entries within a directory are yielded
+    in name order, files before subdirectories.
+    
+    Patterns are matched against the path relative to input_folder, with
+    '/' separators, using fnmatch ('*' also matches across '/'). A directory
+    matching an exclude pattern is not entered.
+    
+    Args:
+        input_folder (str): Root folder
+        include (list): Glob patterns a file must match one of, e.g.
+                        ['2024-*/*.jpg']; None includes every image
+        exclude (list): Glob patterns of files and folders to skip, e.g.
+                        ['*/thumbnails', '*_preview.*']
+        recursive (bool): Descend into subfolders
+        extensions (tuple): Lower-case file extensions to consider
+        skip_folders: Folders not to enter, e.g. the output folder when it is
+                      inside input_folder, so earlier results are not read back
+    
+    Yields:
+        str: Path of each image relative to input_folder (os.sep separated)
+    """
+    include = list(include or [])
+    exclude = list(exclude or [])
+    pruned = _pruned_folders(input_folder, skip_folders)
+    pending = ['']
+    
+    while pending:
+        folder = pending.pop()
+        try:
+            with os.scandir(os.path.join(input_folder, folder)) as scan:
+                entries = sorted(scan, key=lambda entry: entry.name)
+        except (PermissionError, FileNotFoundError):
+            continue
+        
+        subfolders = []
+        for entry in entries:
+            relative = f"{folder}/{entry.name}" if folder else entry.name
+            if exclude and _matches(relative, exclude):
+                continue
+            
+            if entry.is_dir(follow_symlinks=False):
+                if recursive and relative not in pruned:
+                    subfolders.append(relative)
+            elif (entry.name.lower().endswith(extensions)
+                  and (not include or _matches(relative, include))):
+                yield relative.replace('/', os.sep)
+        
+        # Reversed, so the stack visits subfolders in name order
+        pending.extend(reversed(subfolders))
+
+
+def mirrored_output_folder(relative_path, output_folder):
+    """
+    Output folder of an image, mirroring its subfolder under the input root.
+    
+    Args:
+        relative_path (str): Image path relative to the input root
+        output_folder (str): Output root
+    
+    Returns:
+        str: Folder to save the image's results in
+    """
+    return os.path.join(output_folder, os.path.dirname(relative_path))
@@ -0,0 +1,197 @@
+"""
+Batch Manifest
+Record processed inputs so interrupted or incremental batch runs skip
+unchanged images
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from edge_detection import DEFAULT_PARAMS
+
+
+MANIFEST_NAME = '.edge_manifest.sqlite'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    outputs TEXT NOT NULL,
+    completed REAL NOT NULL
+)
+"""
+
+
+def parameter_fingerprint(**settings):
+    """
+    Fingerprint of everything that determines the results of an input.
+    
+    Args:
+        **settings: JSON-serializable settings, e.g. outputs, decode mode
+                    and output format; the processing parameters
+                    (DEFAULT_PARAMS) are always included
+    
+    Returns:
+        str: Hex digest that changes whenever any setting does
+    """
+    settings = dict(settings, params=settings.get('params', DEFAULT_PARAMS))
+    text = json.dumps(settings, sort_keys=True, default=sorted)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """SHA-256 of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as stream:
+        while chunk := stream.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BatchManifest:
+    """
+    SQLite manifest of processed inputs, kept under the output folder.
+    
+    Each entry records an input's size, mtime, content hash, the parameter
+    fingerprint it was processed with and the result files written. An
+    input is up to date when its fingerprint matches and its results still
+    exist, and either its size and mtime are unchanged or, if they changed,
+    its content hash is (e.g. a file that was only touched or copied).
+    
+    Entries are committed one by one in WAL mode, so a run that dies keeps
+    everything finished before it. Safe to use from several threads.
+    """
+    
+    def __init__(self, output_folder, name=MANIFEST_NAME):
+        """
+        Open (or create) the manifest.
+        
+        Args:
+            output_folder (str): Folder holding the results and the manifest
+            name (str): Manifest file name
+        """
+        os.makedirs(output_folder, exist_ok=True)
+        self.path = os.path.join(output_folder, name)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(_SCHEMA)
+        self._db.commit()
+    
+    @staticmethod
+    def _key(path):
+        return os.path.abspath(path)
+    
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+    
+    def entry(self, path):
+        """
+        Recorded entry of an input.
+        
+        Returns:
+            dict: size, mtime_ns, sha256, fingerprint, outputs and completed,
+                  or None if the input was never recorded
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT size, mtime_ns, sha256, fingerprint, outputs, completed "
+                "FROM entries WHERE path = ?", (self._key(path),)).fetchone()
+        if row is None:
+            return None
+        return {'size': row[0], 'mtime_ns': row[1], 'sha256': row[2], 'fingerprint': row[3],
+                'outputs': json.loads(row[4]), 'completed': row[5]}
+    
+    def is_current(self, path, fingerprint):
+        """
+        Check whether an input's recorded results are up to date.
+        
+        Args:
+            path (str): Input path
+            fingerprint (str): Fingerprint of the current settings
+        
+        Returns:
+            bool: True if the input can be skipped; False as well if it cannot
+                  be read, so processing records the failure
+        """
+        entry = self.entry(path)
+        if entry is None or entry['fingerprint'] != fingerprint:
+            return False
+        if not all(os.path.exists(output) for output in entry['outputs']):
+            return False
+        
+        try:
+            stat = os.stat(path)
+            if stat.st_size == entry['size'] and stat.st_mtime_ns == entry['mtime_ns']:
+                return True
+            if stat.st_size != entry['size'] or file_sha256(path) != entry['sha256']:
+                return False
+        except OSError:
+            return False  # Removed or unreadable since it was found
+        
+        # Same content, new mtime: remember it so the next check is a stat only
+        self._update_stat(path, stat)
+        return True
+    
+    def pending(self, paths, fingerprint):
+        """
+        Yield the inputs that are not up to date.
+        
+        Args:
+            paths: Input paths
+            fingerprint (str): Fingerprint of the current settings
+        """
+        for path in paths:
+            if not self.is_current(path, fingerprint):
+                yield path
+    
+    def record(self, path, fingerprint, outputs):
+        """
+        Record a successfully processed input.
+        
+        Args:
+            path (str): Input path
+            fingerprint (str): Fingerprint of the settings it was processed with
+            outputs: Paths of the result files written
+        """
+        stat = os.stat(path)
+        sha256 = file_sha256(path)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self._key(path), stat.st_size, stat.st_mtime_ns, sha256, fingerprint,
+                 json.dumps(sorted(set(outputs))), time.time()))
+            self._db.commit()
+    
+    def forget(self, path):
+        """Remove an input's entry, e.g. after its results failed to write."""
+        with self._lock:
+            self._db.execute("DELETE FROM entries WHERE path = ?", (self._key(path),))
+            self._db.commit()
+    
+    def _update_stat(self, path, stat):
+        with self._lock:
+            self._db.execute("UPDATE entries SET size = ?, mtime_ns = ? WHERE path = ?",
+                             (stat.st_size, stat.st_mtime_ns, self._key(path)))
+            self._db.commit()
+    
+    def close(self):
+        """Close the database."""
+        with self._lock:
+            self._db.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
@@ -0,0 +1,193 @@
+"""
+Streaming Batch Pipeline
+Overlap decoding, edge detection and result writing across a batch with
+bounded queues and a memory budget counted in pixels
+"""
+
+import os
+import queue
+import threading
+
+from edge_detection import EdgeDetector
+from batch_discovery import mirrored_output_folder
+
+
+# Ends a stage's input queue
+_DONE = object()
+
+
+class PixelBudget:
+    """
+    Counting semaphore over image pixels.
+    
+    Caps the total size of the images in flight rather than their number,
+    so a few very large images block new work as well as many small ones.
+    An image larger than the whole budget is admitted when nothing else is
+    in flight, so it can never deadlock.
+    """
+    
+    def __init__(self, capacity):
+        """
+        Args:
+            capacity (int): Pixels allowed in flight at once
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1 pixel")
+        
+        self.capacity = capacity
+        self.in_flight = 0
+        self.peak = 0
+        self._changed = threading.Condition()
+    
+    def acquire(self, pixels):
+        """Block until pixels fit in the budget, then take them."""
+        with self._changed:
+            self._changed.wait_for(
+                lambda: self.in_flight == 0 or self.in_flight + pixels <= self.capacity)
+            self.in_flight += pixels
+            self.peak = max(self.peak, self.in_flight)
+    
+    def release(self, pixels):
+        """Return pixels to the budget."""
+        with self._changed:
+            self.in_flight -= pixels
+            self._changed.notify_all()
+
+
+def run_pipeline(image_paths, output_folder, outputs=None, decode='color', canny_auto=None,
+                 bundle=False, readers=2, workers=2, writers=2, max_pixels=200_000_000,
+                 on_result=None, budget=None, input_root=None):
+    """
+    Process images in a three-stage streaming pipeline.
+    
+    Reader threads decode images, compute threads run the edge detection and
+    writer threads encode and save the results. OpenCV releases the GIL in
+    all three, so the stages overlap. Stages are connected by bounded
+    queues. Every image holds its pixel count in a PixelBudget from decode
+    until its results are written; readers block while the budget is full.
+    A reader may hold one decoded image of its own while it waits, so the
+    worst case is max_pixels plus one image per reader.
+    
+    Args:
+        image_paths: Paths of the images to process
+        output_folder (str): Folder to save results in
+        outputs: Outputs to compute and save (see OUTPUTS)
+        decode (str): Decode mode (see DECODE_MODES)
+        canny_auto (str): Derive Canny thresholds per image: 'median' or 'otsu'
+        bundle (bool): Save one .npz bundle per image
+        readers (int): Decoding threads
+        workers (int): Edge detection threads
+        writers (int): Encoding and writing threads
+        max_pixels (int): Decoded pixels in flight at once
+        on_result: Called as on_result(result) as each image finishes, from
+                   whichever thread finished it; if it raises, the error is
+                   recorded as the image's error and the run continues
+        budget (PixelBudget): Budget to use instead of one of max_pixels, e.g.
+                              to read its peak afterwards
+        input_root (str): Folder the images are under; their subfolders are
+                          mirrored into output_folder. None saves every
+                          result directly in output_folder
+    
+    Returns:
+        list: One dict per image in completion order, with 'path', 'error'
+              (None on success), 'thresholds', 'pixels', 'outputs' (result
+              paths written), 'timings' (stage -> milliseconds), 'bytes_read'
+              and 'bytes_written'
+    """
+    if min(readers, workers, writers) < 1:
+        raise ValueError("Every stage needs at least one thread")
+    
+    if budget is None:
+        budget = PixelBudget(max_pixels)
+    # Paths are pulled lazily, so image_paths may be a generator
+    paths = iter(image_paths)
+    paths_lock = threading.Lock()
+    to_compute = queue.Queue(maxsize=2 * workers)
+    to_write = queue.Queue(maxsize=2 * writers)
+    results = []
+    results_lock = threading.Lock()
+    
+    def finish(path, pixels, error=None, thresholds=None, written=(), timings=None,
+               detector=None):
+        try:
+            result = {'path': path, 'error': error, 'thresholds': thresholds, 'pixels': pixels,
+                      'outputs': sorted(set(written)), 'timings': timings or {},
+                      'bytes_read': detector.bytes_read if detector is not None else 0,
+                      'bytes_written': detector.bytes_written if detector is not None else 0}
+            with results_lock:
+                results.append(result)
+            if on_result is not None:
+                try:
+                    on_result(result)
+                except Exception as e:
+                    # Recorded against the image: a dead stage thread would hang the run
+                    if result['error'] is None:
+                        result['error'] = f"on_result failed: {e}"
+        finally:
+            # Always returned, or readers would wait for the budget forever
+            if pixels:
+                budget.release(pixels)
+    
+    def read():
+        while True:
+            with paths_lock:
+                path = next(paths, _DONE)
+            if path is _DONE:
+                return
+            try:
+                detector = EdgeDetector(path, outputs=outputs, decode=decode, verbose=False)
+            except Exception as e:
+                finish(path, 0, str(e))
+                continue
+            pixels = detector.original_image.shape[0] * detector.original_image.shape[1]
+            budget.acquire(pixels)
+            to_compute.put((path, pixels, detector))
+    
+    def compute():
+        while (item := to_compute.get()) is not _DONE:
+            path, pixels, detector = item
+            try:
+                detector.compute(canny_auto=canny_auto)
+            except Exception as e:
+                finish(path, pixels, str(e), detector=detector)
+                continue
+            to_write.put(item)
+    
+    def write():
+        while (item := to_write.get()) is not _DONE:
+            path, pixels, detector = item
+            try:
+                folder = output_folder
+                if input_root is not None:
+                    folder = mirrored_output_folder(os.path.relpath(path, input_root),
+                                                    output_folder)
+                written = detector.save_results(output_dir=folder, bundle=bundle).values()
+                thresholds = None
+                if canny_auto and 'canny' in detector.outputs:
+                    thresholds = tuple(int(t) for t in detector.canny_thresholds)
+            except Exception as e:
+                finish(path, pixels, str(e), detector=detector)
+                continue
+            finish(path, pixels, thresholds=thresholds, written=written,
+                   timings=detector.timing_summary(), detector=detector)
+    
+    def start(target, count, name):
+        threads = [threading.Thread(target=target, name=f'{name}-{i}', daemon=True)
+                   for i in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads
+    
+    # Each stage is closed with one sentinel per consumer once its producers exit
+    stages = [start(read, readers, 'reader'), start(compute, workers, 'compute'),
+              start(write, writers, 'writer')]
+    for producers, consumers, channel in ((stages[0], workers, to_compute),
+                                          (stages[1], writers, to_write)):
+        for thread in producers:
+            thread.join()
+        for _ in range(consumers):
+            channel.put(_DONE)
+    for thread in stages[2]:
+        thread.join()
+    
+    return results
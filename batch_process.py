@@ -3,66 +3,219 @@ Batch Processing Script for Edge Detection
 Process multiple images at once
 """
 
+import itertools
 import os
 import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
-from edge_detection import EdgeDetector
 
+import cv2
 
-def batch_process_images(input_folder='input', output_folder='output', display=False):
+from edge_detection import (EdgeDetector, Workspace, OUTPUTS, DEFAULT_OUTPUTS, DECODE_MODES,
+                            AUTO_THRESHOLDS, parse_outputs)
+from result_writer import ResultWriter
+from batch_pipeline import run_pipeline
+from batch_manifest import BatchManifest, parameter_fingerprint
+from batch_discovery import IMAGE_EXTENSIONS, discover_images, mirrored_output_folder
+from batch_report import RunReport
+from batch_queue import WorkQueue, worker_id
+
+
+# Per-process state of pool workers (see _init_worker)
+_worker_workspace = None
+
+# Serial runs with background writes add finished images to the manifest in
+# groups of this many, after waiting for their writes
+_RECORD_EVERY = 64
+
+# Seconds between polls of a work queue with nothing to claim yet
+_QUEUE_POLL = 1.0
+
+# Minimum seconds between reports of global queue progress, which scans the queue
+_QUEUE_REPORT_INTERVAL = 30.0
+
+
+def _init_worker():
+    """Set up a pool worker process."""
+    global _worker_workspace
+    # One OpenCV thread per process; the pool already uses every core
+    cv2.setNumThreads(1)
+    _worker_workspace = Workspace()
+
+
+def _process_image(task):
     """
-    Process all images in a folder.
+    Process and save one image in a pool worker.
     
     Args:
-        input_folder (str): Folder containing input images
-        output_folder (str): Folder to save processed images
-        display (bool): Whether to display results for each image
+        task (tuple): (image_path, output_folder, outputs, decode, canny_auto, bundle)
+    
+    Returns:
+        dict: 'path', 'error' (None on success), 'thresholds' (or None),
+              'outputs' (result paths written), 'pixels', 'timings'
+              (stage -> milliseconds), 'bytes_read' and 'bytes_written'
     """
-    # Check if input folder exists
-    if not os.path.exists(input_folder):
-        print(f"❌ Error: Input folder '{input_folder}' not found")
-        return
+    image_path, output_folder, outputs, decode, canny_auto, bundle = task
+    result = {'path': image_path, 'error': None, 'thresholds': None, 'outputs': [],
+              'pixels': 0, 'timings': {}, 'bytes_read': 0, 'bytes_written': 0}
+    try:
+        # Silent: only the parent prints, so progress lines never interleave
+        detector = EdgeDetector(image_path, outputs=outputs, decode=decode,
+                                workspace=_worker_workspace, verbose=False)
+        result['pixels'] = detector.original_image.shape[0] * detector.original_image.shape[1]
+        result['bytes_read'] = detector.bytes_read
+        detector.compute(canny_auto=canny_auto)
+        if canny_auto and 'canny' in outputs:
+            result['thresholds'] = tuple(int(t) for t in detector.canny_thresholds)
+        paths = detector.save_results(output_dir=output_folder, bundle=bundle)
+        result['outputs'] = sorted(set(paths.values()))
+        result['timings'] = detector.timing_summary()
+        result['bytes_written'] = detector.bytes_written
+    except Exception as e:
+        result['error'] = str(e)
+    return result
+
+
+def _process_chunk(tasks):
+    """Process a chunk of images in a pool worker (see _process_image)."""
+    return [_process_image(task) for task in tasks]
+
+
+def _report(index, name, result):
+    """Print the one-line outcome of an image; returns True on success."""
+    if result['error'] is None:
+        thresholds = ""
+        if result['thresholds']:
+            thresholds = f" (Canny {result['thresholds'][0]}, {result['thresholds'][1]})"
+        print(f"[{index}] ✓ {name}{thresholds}")
+        return True
     
-    # Get all image files
-    image_extensions = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff')
-    image_files = [f for f in os.listdir(input_folder) 
-                   if f.lower().endswith(image_extensions)]
+    print(f"[{index}] ❌ Failed to process {name}: {result['error']}")
+    return False
+
+
+def _process_parallel(image_files, input_folder, output_folder, outputs, decode, canny_auto,
+                      bundle, workers, record=None, report=None, chunksize=4):
+    """
+    Process images on a pool of worker processes.
     
-    if not image_files:
-        print(f"❌ No image files found in '{input_folder}'")
-        print(f"   Supported formats: {', '.join(image_extensions)}")
-        return
+    Chunks of images are submitted as they are discovered, with at most two
+    chunks per worker queued, so the image list never has to be built.
     
-    print("\n" + "=" * 70)
-    print("BATCH EDGE DETECTION PROCESSING")
-    print("=" * 70)
-    print(f"\nFound {len(image_files)} image(s) to process:")
-    for i, img in enumerate(image_files, 1):
-        print(f"  {i}. {img}")
-    print()
+    Args:
+        image_files: Paths relative to input_folder; may be a generator
+        workers (int): Worker processes
+        record: Called as record(image_path, result_paths) for each image saved
+        report (RunReport): Collects per-image measurements
+        chunksize (int): Images sent to a worker per task
+    
+    Returns:
+        tuple: (successful, failed) counts
+    """
+    counts = {'done': 0, 'successful': 0, 'failed': 0}
+    
+    def collect(future):
+        for result in future.result():
+            counts['done'] += 1
+            if report is not None:
+                report.add(result['path'], result['error'], result['pixels'],
+                           result['timings'], result['bytes_read'], result['bytes_written'])
+            if _report(counts['done'], os.path.relpath(result['path'], input_folder), result):
+                counts['successful'] += 1
+                if record is not None:
+                    record(result['path'], result['outputs'])
+            else:
+                counts['failed'] += 1
     
-    # Process each image
+    tasks = ((os.path.join(input_folder, image_file),
+              mirrored_output_folder(image_file, output_folder), outputs, decode, canny_auto,
+              bundle) for image_file in image_files)
+    
+    in_flight = deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        while chunk := list(itertools.islice(tasks, chunksize)):
+            in_flight.append(executor.submit(_process_chunk, chunk))
+            # Collect in submission order, so progress follows discovery order
+            if len(in_flight) >= 2 * workers:
+                collect(in_flight.popleft())
+        while in_flight:
+            collect(in_flight.popleft())
+    
+    return counts['successful'], counts['failed']
+
+
+def _process_serial(image_files, input_folder, output_folder, display, outputs, decode,
+                    canny_auto, writer_threads, bundle, record=None, report=None):
+    """
+    Process images one after another in this process, writing in the background.
+    
+    Args:
+        image_files: Paths relative to input_folder; may be a generator
+        record: Called as record(image_path, result_paths) once an image's
+                results are all written
+        report (RunReport): Collects per-image measurements; with background
+                            writes, encoding and writing are not in the
+                            image's timings
+    
+    Returns:
+        tuple: (successful, failed) counts
+    """
     successful = 0
     failed = 0
+    # Same-size images reuse the previous image's buffers; save_results
+    # copies them before queuing, as the next image overwrites them
+    workspace = Workspace()
+    writer = ResultWriter(max_workers=writer_threads) if writer_threads > 0 else None
+    saved = {}
+    # (image_path, paths) whose background writes are not confirmed yet
+    unrecorded = []
+    
+    def record_written():
+        if writer is not None:
+            try:
+                writer.flush()
+            except RuntimeError:
+                pass  # Reported per image below, once all writes are done
+        failed_paths = {path for path, _ in writer.failures} if writer is not None else set()
+        for image_path, paths in unrecorded:
+            if not failed_paths.intersection(paths.values()):
+                record(image_path, paths.values())
+        unrecorded.clear()
     
     for i, image_file in enumerate(image_files, 1):
         image_path = os.path.join(input_folder, image_file)
         
-        print(f"\n[{i}/{len(image_files)}] Processing: {image_file}")
+        print(f"\n[{i}] Processing: {image_file}")
         print("-" * 70)
         
         try:
             # Create detector
-            detector = EdgeDetector(image_path)
+            detector = EdgeDetector(image_path, outputs=outputs, decode=decode,
+                                    workspace=workspace)
             
-            # Process
-            detector.preprocess()
-            detector.apply_sobel()
-            detector.apply_laplacian()
-            detector.apply_canny()
+            # Process only the requested outputs
+            detector.compute(canny_auto=canny_auto)
+            if canny_auto and 'canny' in outputs:
+                threshold1, threshold2 = detector.canny_thresholds
+                print(f"  Canny thresholds ({canny_auto}): {threshold1}, {threshold2}")
             
-            # Save results
-            detector.save_results(output_dir=output_folder)
+            # Save results next to those of the image's neighbours
+            saved[image_file] = detector.save_results(
+                output_dir=mirrored_output_folder(image_file, output_folder), writer=writer,
+                bundle=bundle)
+            if report is not None:
+                shape = detector.original_image.shape
+                report.add(image_path, pixels=shape[0] * shape[1],
+                           timings=detector.timing_summary(), bytes_read=detector.bytes_read,
+                           bytes_written=detector.bytes_written)
+            if record is not None:
+                unrecorded.append((image_path, saved[image_file]))
+                if writer is None or len(unrecorded) >= _RECORD_EVERY:
+                    record_written()
             
             # Display if requested
             if display:
@@ -70,21 +223,429 @@ def batch_process_images(input_folder='input', output_folder='output', display=F
             
             print(f"✓ Successfully processed: {image_file}")
             successful += 1
-            
+        
         except Exception as e:
             print(f"❌ Failed to process {image_file}: {str(e)}")
             failed += 1
+            if report is not None:
+                report.add(image_path, error=str(e))
+    
+    if record is not None:
+        record_written()
+    
+    # Wait for queued writes; an image counts as failed if any of its files did
+    if writer is not None:
+        try:
+            writer.close()
+        except RuntimeError:
+            pass
+        if report is not None:
+            report.add_written(writer.bytes_written)
+        for image_file, paths in saved.items():
+            errors = [str(error) for path, error in writer.failures
+                      if path in paths.values()]
+            if errors:
+                print(f"❌ Failed to write results for {image_file}: {errors[0]}")
+                successful -= 1
+                failed += 1
+                if report is not None:
+                    report.fail(os.path.join(input_folder, image_file), errors[0])
+    
+    return successful, failed
+
+
+def _process_pipeline(image_files, input_folder, output_folder, outputs, decode, canny_auto,
+                      bundle, readers, workers, writers, max_pixels, record=None,
+                      report=None):
+    """
+    Process images in the streaming reader/compute/writer pipeline (see batch_pipeline).
+    
+    Args:
+        image_files: Paths relative to input_folder; may be a generator
+        record: Called as record(image_path, result_paths) for each image saved
+        report (RunReport): Collects per-image measurements
+    
+    Returns:
+        tuple: (successful, failed) counts
+    """
+    lock = threading.Lock()
+    counts = {'done': 0, 'successful': 0, 'failed': 0}
+    
+    def on_result(result):
+        # Called from the pipeline threads; one whole line per image
+        if report is not None:
+            report.add(result['path'], result['error'], result['pixels'], result['timings'],
+                       result['bytes_read'], result['bytes_written'])
+        with lock:
+            counts['done'] += 1
+            if _report(counts['done'], os.path.relpath(result['path'], input_folder), result):
+                counts['successful'] += 1
+                if record is not None:
+                    record(result['path'], result['outputs'])
+            else:
+                counts['failed'] += 1
+    
+    run_pipeline((os.path.join(input_folder, image_file) for image_file in image_files),
+                 output_folder, outputs=outputs, decode=decode, canny_auto=canny_auto,
+                 bundle=bundle, readers=readers, workers=workers, writers=writers,
+                 max_pixels=max_pixels, on_result=on_result, input_root=input_folder)
+    return counts['successful'], counts['failed']
+
+
+def _run_engine(image_files, input_folder, output_folder, record=None, report=None,
+                display=False, outputs=DEFAULT_OUTPUTS, decode='color', canny_auto=None,
+                writer_threads=4, bundle=False, workers=1, pipeline=False, readers=2,
+                max_megapixels=200):
+    """
+    Process images with the engine the settings select: the pipeline, the
+    worker pool (workers > 1) or this process.
+    
+    Args:
+        image_files: Paths relative to input_folder; may be a generator
+        record: Called as record(image_path, result_paths) for each image saved
+        report (RunReport): Collects per-image measurements
+        The remaining settings are those of batch_process_images
+    
+    Returns:
+        tuple: (successful, failed) counts
+    """
+    if pipeline:
+        print(f"Streaming with {readers} reader, {workers} compute and "
+              f"{max(writer_threads, 1)} writer thread(s), "
+              f"at most {max_megapixels:g} MP in flight...\n")
+        return _process_pipeline(
+            image_files, input_folder, output_folder, outputs, decode, canny_auto, bundle,
+            readers, workers, max(writer_threads, 1), int(max_megapixels * 1_000_000),
+            record, report)
+    elif workers > 1:
+        print(f"Processing on {workers} worker processes...\n")
+        return _process_parallel(
+            image_files, input_folder, output_folder, outputs, decode, canny_auto, bundle,
+            workers, record, report)
+    else:
+        return _process_serial(
+            image_files, input_folder, output_folder, display, outputs, decode, canny_auto,
+            writer_threads, bundle, record, report)
+
+
+def _pending(image_files, input_folder, counts, is_current=None):
+    """
+    Count images as they are found, skipping those that are up to date.
+    
+    Args:
+        image_files: Paths relative to input_folder; may be a generator
+        counts (dict): 'found' and 'skipped' counts, updated in place
+        is_current: Called as is_current(image_path); True skips the image
+    
+    Yields:
+        str: Path relative to input_folder
+    """
+    # Lazy, so consumed by one engine thread at a time
+    for image_file in image_files:
+        counts['found'] += 1
+        if is_current is not None and is_current(os.path.join(input_folder, image_file)):
+            counts['skipped'] += 1
+            continue
+        yield image_file
+
+
+def _process_folder(input_folder, output_folder, engine, discovery, report=None, manifest=True,
+                    force=False):
+    """
+    Process the images discovered under input_folder.
+    
+    Args:
+        engine (dict): Engine settings (see _run_engine); with the manifest,
+                       'outputs', 'decode', 'canny_auto' and 'bundle' are required
+        discovery (dict): 'include', 'exclude' and 'recursive' (see discover_images)
+        report (RunReport): Collects per-image measurements
+        manifest (bool): Skip images the output folder's manifest has as processed
+                         unchanged with the same settings, and record new ones
+        force (bool): Reprocess every image, still updating the manifest
+    
+    Returns:
+        dict: 'found', 'skipped', 'successful' and 'failed' image counts
+    """
+    counts = {'found': 0, 'skipped': 0}
+    images = discover_images(input_folder, **discovery, skip_folders=[output_folder])
+    if not manifest:
+        successful, failed = _run_engine(_pending(images, input_folder, counts), input_folder,
+                                         output_folder, report=report, **engine)
+        return dict(counts, successful=successful, failed=failed)
+    
+    from config_manager import ConfigManager
+    # Anything that changes the written results invalidates earlier runs
+    fingerprint = parameter_fingerprint(
+        outputs=sorted(engine['outputs']), decode=engine['decode'],
+        canny_auto=engine['canny_auto'], bundle=engine['bundle'],
+        output=ConfigManager().get_output_config())
+    
+    with BatchManifest(output_folder) as store:
+        def record(image_path, paths):
+            store.record(image_path, fingerprint, paths)
+        
+        is_current = None if force else partial(store.is_current, fingerprint=fingerprint)
+        successful, failed = _run_engine(_pending(images, input_folder, counts, is_current),
+                                         input_folder, output_folder, record, report, **engine)
+    return dict(counts, successful=successful, failed=failed)
+
+
+def _populate_queue(queue, owner, input_folder, output_folder, discovery, chunk_size):
+    """Add the images discovered under input_folder to a work queue."""
+    images = discover_images(input_folder, **discovery, skip_folders=[output_folder])
+    added = queue.populate(images, owner, chunk_size)
+    print(f"[queue] Added {added} image(s) to {queue.path}")
+
+
+def _claimed(queue):
+    """
+    on_claim callback for WorkQueue.work that prints each claim, with the
+    global progress at most every _QUEUE_REPORT_INTERVAL seconds.
+    """
+    reported = {'at': None}
+    
+    def claimed(chunk_id, paths):
+        message = f"[queue] Claimed chunk {chunk_id} ({len(paths)} images)"
+        now = time.monotonic()
+        if reported['at'] is None or now - reported['at'] >= _QUEUE_REPORT_INTERVAL:
+            reported['at'] = now
+            progress = queue.progress()
+            finished = progress['done'] + progress['failed']
+            message += (f"; {finished}/{progress['total']} finished by "
+                        f"{len(progress['workers'])} worker(s)")
+        print(message)
+    
+    return claimed
+
+
+def _process_queue(queue_path, owner, input_folder, output_folder, engine, discovery,
+                   report=None, lease_seconds=300, chunk_size=32):
+    """
+    Process images claimed from a work queue shared with other hosts.
+    
+    Populates the queue in the background if no other worker is, then
+    claims chunks until none are left. Stays until the other workers are
+    done, to take over the chunks of one that crashes.
+    
+    Args:
+        queue_path (str): Queue file on the shared volume
+        owner (str): This worker's ID in the queue
+        engine (dict): Engine settings (see _run_engine)
+        discovery (dict): 'include', 'exclude' and 'recursive' (see discover_images)
+        report (RunReport): Collects per-image measurements; failures it
+                            collects are recorded in the queue
+        lease_seconds (float): How long this worker may go silent before
+                               its chunks go to another
+        chunk_size (int): Images per chunk
+    
+    Returns:
+        dict: 'found', 'skipped', 'successful' and 'failed' image counts of
+              this worker, and the queue's global 'progress'
+    """
+    counts = {'found': 0, 'skipped': 0}
+    stop = threading.Event()
+    populate_errors = []
+    
+    with WorkQueue(queue_path, lease_seconds=lease_seconds) as queue:
+        def populate():
+            _populate_queue(queue, owner, input_folder, output_folder, discovery, chunk_size)
+        
+        def take_over_populating():
+            print("[queue] Resuming discovery for a worker that stopped responding")
+            populate()
+        
+        def populate_in_background():
+            try:
+                populate()
+            except Exception as e:
+                populate_errors.append(e)
+                stop.set()
+        
+        def record(image_path, paths):
+            queue.finish(os.path.relpath(image_path, input_folder), owner)
+        
+        def on_failure(image_path, error):
+            queue.finish(os.path.relpath(image_path, input_folder), owner, error)
+        
+        if report is not None:
+            report.on_failure = on_failure
+        
+        populating = None
+        if queue.start_populating(owner):
+            populating = threading.Thread(target=populate_in_background, name='queue-populate',
+                                          daemon=True)
+            populating.start()
+        
+        def claim():
+            return _pending(queue.work(owner, poll=_QUEUE_POLL, on_claim=_claimed(queue),
+                                       stop=stop, populate=take_over_populating),
+                            input_folder, counts)
+        
+        try:
+            with queue.keep_alive(owner):
+                successful, failed = _run_engine(claim(), input_folder, output_folder, record,
+                                                 report, **engine)
+                while queue.wait(owner, poll=_QUEUE_POLL, stop=stop):
+                    print("[queue] Taking over images from a worker that stopped responding")
+                    more = _run_engine(claim(), input_folder, output_folder, record, report,
+                                       **engine)
+                    successful += more[0]
+                    failed += more[1]
+        finally:
+            # Stops waiting for work if the engine failed
+            stop.set()
+        
+        if populating is not None:
+            populating.join()
+            if populate_errors:
+                raise RuntimeError(f"Could not populate the work queue: {populate_errors[0]}")
+        progress = queue.progress()
+    
+    return dict(counts, successful=successful, failed=failed, progress=progress)
+
+
+def batch_process_images(input_folder='input', output_folder='output', display=False,
+                         outputs=None, decode='color', canny_auto=None, writer_threads=4,
+                         bundle=False, workers=None, pipeline=False, readers=2,
+                         max_megapixels=None, manifest=True, force=False, include=None,
+                         exclude=None, recursive=True, report_path=None, slowest=10,
+                         queue_path=None, lease_seconds=300, chunk_size=32):
+    """
+    Process all images in a folder tree.
+    
+    Images are processed as they are discovered; results go to the same
+    subfolder of output_folder as the image has under input_folder.
+    
+    Args:
+        input_folder (str): Folder containing input images
+        output_folder (str): Folder to save processed images
+        display (bool): Whether to display results for each image
+        outputs: Outputs to compute and save (default: all)
+        decode (str): Decode mode; anything but 'color' skips the color decode
+        canny_auto (str): Derive Canny thresholds per image: 'median' or 'otsu'
+        writer_threads (int): Threads encoding and writing results while the
+                              next image is processed; 0 writes synchronously
+        bundle (bool): Save one .npz bundle per image instead of one file per output
+        workers (int): Worker processes (compute threads with pipeline); defaults
+                       to performance.max_workers in config.yaml. 1 processes in
+                       this process (required for display)
+        pipeline (bool): Stream images through reader, compute and writer
+                         threads with bounded queues instead
+        readers (int): Decoding threads with pipeline
+        max_megapixels (float): Decoded megapixels in flight with pipeline;
+                                defaults to performance.max_inflight_megapixels
+        manifest (bool): Record processed images in a manifest in the output
+                         folder and skip those already processed unchanged
+                         with the same settings (see batch_manifest)
+        force (bool): Reprocess every image, still updating the manifest
+        include (list): Glob patterns (relative to input_folder) images must match
+        exclude (list): Glob patterns of images and folders to skip
+        recursive (bool): Descend into subfolders
+        report_path (str): Where to write the JSON run report (see batch_report);
+                           defaults to batch_report.json in output_folder
+        slowest (int): Number of slowest images listed in the report
+        queue_path (str): Share the batch with other processes and hosts through
+                          a work queue file on a shared volume (see batch_queue).
+                          Every host runs with the same queue; the first one
+                          discovers the images, and each claims chunks of them
+                          until all are finished. The queue, not the manifest,
+                          tracks what is done, and each host writes its own
+                          report (batch_report_<host>_<pid>.json by default)
+        lease_seconds (float): How long a host may go silent before its
+                               claimed chunks are handed to another host
+        chunk_size (int): Images per claimed chunk
+    
+    Returns:
+        dict: 'total', 'successful', 'failed' and 'skipped' image counts
+    """
+    outputs = parse_outputs(outputs)
+    
+    if workers is None or max_megapixels is None:
+        from config_manager import ConfigManager
+        performance = ConfigManager().get_performance_config()
+        if workers is None:
+            workers = performance['max_workers']
+        if max_megapixels is None:
+            max_megapixels = performance['max_inflight_megapixels']
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+    
+    # Check if input folder exists
+    if not os.path.exists(input_folder):
+        print(f"❌ Error: Input folder '{input_folder}' not found")
+        return
+    
+    print("\n" + "=" * 70)
+    print("BATCH EDGE DETECTION PROCESSING")
+    print("=" * 70)
+    print(f"\nProcessing images under '{input_folder}' as they are found...\n")
+    
+    if display and (workers > 1 or pipeline):
+        print("Displaying results, so processing in this process (--workers 1)")
+        workers = 1
+        pipeline = False
+    engine = {
+        'display': display, 'outputs': outputs, 'decode': decode, 'canny_auto': canny_auto,
+        'writer_threads': writer_threads, 'bundle': bundle, 'workers': workers,
+        'pipeline': pipeline, 'readers': readers, 'max_megapixels': max_megapixels
+    }
+    discovery = {'include': include, 'exclude': exclude, 'recursive': recursive}
+    
+    owner = worker_id() if queue_path is not None else None
+    report = RunReport({
+        'engine': 'pipeline' if pipeline else 'pool' if workers > 1 else 'serial',
+        'workers': workers, 'readers': readers if pipeline else None,
+        'writer_threads': writer_threads, 'outputs': sorted(outputs), 'decode': decode,
+        'canny_auto': canny_auto, 'bundle': bundle, 'input_folder': input_folder,
+        'output_folder': output_folder, 'queue': queue_path, 'worker': owner
+    }, slowest=slowest)
+    
+    try:
+        if queue_path is not None:
+            if manifest:
+                # The manifest's WAL mode needs all its users on one host
+                print("Work queue tracks finished images; not using the manifest")
+            summary = _process_queue(queue_path, owner, input_folder, output_folder, engine,
+                                     discovery, report, lease_seconds, chunk_size)
+        else:
+            summary = _process_folder(input_folder, output_folder, engine, discovery, report,
+                                      manifest, force)
+    finally:
+        report.finish()
+    
+    if report_path is None:
+        name = 'batch_report.json'
+        if owner is not None:
+            name = f"batch_report_{owner.replace(':', '_')}.json"
+        report_path = os.path.join(output_folder, name)
+    run = report.write(report_path, skipped=summary['skipped'])
+    
+    if summary['found'] == 0 and queue_path is None:
+        print(f"❌ No image files found in '{input_folder}'")
+        print(f"   Supported formats: {', '.join(IMAGE_EXTENSIONS)}")
     
     # Summary
     print("\n" + "=" * 70)
     print("BATCH PROCESSING SUMMARY")
     print("=" * 70)
-    print(f"Total images: {len(image_files)}")
-    print(f"✓ Successful: {successful}")
-    if failed > 0:
-        print(f"❌ Failed: {failed}")
+    print(f"Total images: {summary['found']}")
+    print(f"✓ Successful: {summary['successful']}")
+    if summary['failed'] > 0:
+        print(f"❌ Failed: {summary['failed']}")
+    if summary['skipped'] > 0:
+        print(f"⏭ Skipped (unchanged): {summary['skipped']}")
+    if 'progress' in summary:
+        progress = summary['progress']
+        print(f"Queue: {progress['done']}/{progress['total']} done, "
+              f"{progress['failed']} failed, {progress['pending']} pending across all workers")
+    print(f"Throughput: {run['throughput']['images_per_s']:.1f} images/s, "
+          f"{run['throughput']['megapixels_per_s']:.1f} MP/s")
     print(f"\nAll results saved to: {output_folder}/")
+    print(f"Run report: {report_path}")
     print("=" * 70 + "\n")
+    
+    return {'total': summary['found'], 'successful': summary['successful'],
+            'failed': summary['failed'], 'skipped': summary['skipped']}
 
 
 def main():
@@ -111,14 +672,151 @@ def main():
         action='store_true',
         help='Display results for each image (default: False)'
     )
+    parser.add_argument(
+        '--outputs',
+        default=None,
+        help=f'Comma-separated outputs to compute and save (default: all). '
+             f'Available: {", ".join(OUTPUTS)}'
+    )
+    parser.add_argument(
+        '--decode',
+        default='color',
+        choices=list(DECODE_MODES),
+        help='Decode mode; grayscale and reduced_N (1/N size) decode faster (default: color)'
+    )
+    parser.add_argument(
+        '--canny-auto',
+        default=None,
+        choices=list(AUTO_THRESHOLDS),
+        help='Derive Canny thresholds per image instead of using 50/150 (default: off)'
+    )
+    parser.add_argument(
+        '--writer-threads',
+        type=int,
+        default=4,
+        help='Threads writing results in the background; 0 writes synchronously (default: 4)'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help='Worker processes (default: performance.max_workers in config.yaml)'
+    )
+    parser.add_argument(
+        '--pipeline',
+        action='store_true',
+        help='Overlap decoding, edge detection and writing in separate threads (default: off)'
+    )
+    parser.add_argument(
+        '--readers',
+        type=int,
+        default=2,
+        help='Decoding threads with --pipeline (default: 2)'
+    )
+    parser.add_argument(
+        '--max-megapixels',
+        type=float,
+        default=None,
+        help='Decoded megapixels in flight with --pipeline '
+             '(default: performance.max_inflight_megapixels in config.yaml)'
+    )
+    parser.add_argument(
+        '--no-manifest',
+        action='store_true',
+        help='Do not record or skip already processed images (default: use the manifest)'
+    )
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='Reprocess images the manifest lists as unchanged (default: skip them)'
+    )
+    parser.add_argument(
+        '--include',
+        action='append',
+        default=None,
+        metavar='GLOB',
+        help='Only process images whose path under --input matches; repeatable (default: all)'
+    )
+    parser.add_argument(
+        '--exclude',
+        action='append',
+        default=None,
+        metavar='GLOB',
+        help='Skip images and folders whose path under --input matches; repeatable'
+    )
+    parser.add_argument(
+        '--no-recursive',
+        action='store_true',
+        help='Only process images directly in --input (default: walk subfolders)'
+    )
+    parser.add_argument(
+        '--report',
+        default=None,
+        help='JSON run report path (default: batch_report.json in --output)'
+    )
+    parser.add_argument(
+        '--slowest',
+        type=int,
+        default=10,
+        help='Slowest images listed in the run report (default: 10)'
+    )
+    parser.add_argument(
+        '--mode',
+        default=None,
+        choices=['files', 'bundle'],
+        help='One image file per output, or one .npz bundle per image (default: output.mode in config.yaml)'
+    )
+    parser.add_argument(
+        '--queue',
+        default=None,
+        metavar='PATH',
+        help='Share the batch with other hosts through this work queue file on a shared '
+             'volume; run the same command on every host (default: process alone)'
+    )
+    parser.add_argument(
+        '--lease-seconds',
+        type=float,
+        default=300,
+        help='Seconds before a silent host\'s claimed images go to another host (default: 300)'
+    )
+    parser.add_argument(
+        '--chunk-size',
+        type=int,
+        default=32,
+        help='Images claimed from the work queue at a time (default: 32)'
+    )
     
     args = parser.parse_args()
     
+    mode = args.mode
+    if mode is None:
+        from config_manager import ConfigManager
+        mode = ConfigManager().get_output_config()['mode']
+    
     try:
         batch_process_images(
             input_folder=args.input,
             output_folder=args.output,
-            display=args.display
+            display=args.display,
+            outputs=args.outputs,
+            decode=args.decode,
+            canny_auto=args.canny_auto,
+            writer_threads=args.writer_threads,
+            bundle=mode == 'bundle',
+            workers=args.workers,
+            pipeline=args.pipeline,
+            readers=args.readers,
+            max_megapixels=args.max_megapixels,
+            manifest=not args.no_manifest,
+            force=args.force,
+            include=args.include,
+            exclude=args.exclude,
+            recursive=not args.no_recursive,
+            report_path=args.report,
+            slowest=args.slowest,
+            queue_path=args.queue,
+            lease_seconds=args.lease_seconds,
+            chunk_size=args.chunk_size
         )
     except KeyboardInterrupt:
         print("\n\n✓ Batch processing interrupted by user")
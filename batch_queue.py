@@ -0,0 +1,445 @@
+"""
+Batch Work Queue
+Share a batch between processes on several hosts through one SQLite file
+on a shared volume, with leased chunks of images
+"""
+
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    state TEXT NOT NULL DEFAULT 'pending',
+    owner TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS items (
+    path TEXT PRIMARY KEY,
+    chunk INTEGER NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    error TEXT,
+    owner TEXT,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS items_chunk ON items (chunk, state);
+CREATE INDEX IF NOT EXISTS chunks_state ON chunks (state, lease_until);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT,
+    updated REAL
+);
+"""
+
+
+def _sleep(seconds, stop=None):
+    """Sleep, waking early if stop is set; returns True if it was."""
+    if stop is None:
+        time.sleep(seconds)
+        return False
+    return stop.wait(seconds)
+
+
+def worker_id():
+    """Identity of this process in the queue: host name and process ID."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    """
+    Queue of images shared by workers on any number of hosts.
+    
+    Images are grouped into chunks. A worker claims a chunk by taking a
+    lease on it and must renew the lease while it works (see keep_alive).
+    If a worker crashes or hangs, its lease expires and another worker
+    claims the chunk, skipping the images already finished. A chunk that
+    has been claimed max_attempts times without finishing has its
+    remaining images marked failed, so one bad input cannot loop forever.
+    
+    The queue is a single SQLite file. SQLite's rollback journal (not WAL,
+    which needs shared memory) works across hosts on a shared volume whose
+    file locking works, e.g. NFSv4 or SMB. Every operation is one short
+    transaction. Safe to use from several threads.
+    """
+    
+    def __init__(self, path, lease_seconds=300, max_attempts=3, timeout=60):
+        """
+        Open (or create) a queue.
+        
+        Args:
+            path (str): Queue file, normally on the shared volume
+            lease_seconds (float): How long a claim lasts without renewal
+            max_attempts (int): Claims of a chunk before its images are given up
+            timeout (float): Seconds to wait for another host's transaction
+        """
+        if lease_seconds <= 0:
+            raise ValueError("lease_seconds must be positive")
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+        
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=timeout, isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=DELETE")
+        # executescript() would commit the transaction it runs in
+        with self._transaction() as db:
+            for statement in _SCHEMA.split(';'):
+                if statement.strip():
+                    db.execute(statement)
+    
+    @contextmanager
+    def _transaction(self):
+        """Run statements in one write transaction, taking the file lock up front."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+    
+    # Population
+    
+    def start_populating(self, owner):
+        """
+        Become the worker that fills the queue, unless another one is.
+        
+        Returns:
+            bool: True if this worker should call populate(); False if the
+                  queue is already populated or another live worker is
+                  populating it (a populator whose heartbeat is older than
+                  the lease is replaced)
+        """
+        now = time.time()
+        with self._transaction() as db:
+            if self._populated(db):
+                return False
+            row = db.execute("SELECT value, updated FROM meta WHERE key = 'populator'").fetchone()
+            if row is not None and row[0] != owner and row[1] > now - self.lease_seconds:
+                return False
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('populator', ?, ?)", (owner, now))
+            return True
+    
+    def populate(self, paths, owner, chunk_size=32):
+        """
+        Add images to the queue in chunks, committing each chunk as it is
+        formed so workers can start on it immediately.
+        
+        Images already in the queue are ignored, so populating again (e.g.
+        after the populator crashed) only adds new ones.
+        
+        Args:
+            paths: Image paths relative to the input root; may be a generator
+            owner (str): This worker's ID
+            chunk_size (int): Images per chunk
+        
+        Returns:
+            int: Number of images added
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        
+        added = 0
+        chunk = []
+        for path in paths:
+            chunk.append(path.replace(os.sep, '/'))
+            if len(chunk) == chunk_size:
+                added += self._add_chunk(chunk, owner)
+                chunk = []
+        if chunk:
+            added += self._add_chunk(chunk, owner)
+        
+        with self._transaction() as db:
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('populated', ?, ?)",
+                       (owner, time.time()))
+        return added
+    
+    def _add_chunk(self, paths, owner):
+        """Insert one chunk of images; returns how many were new."""
+        with self._transaction() as db:
+            chunk_id = db.execute("INSERT INTO chunks DEFAULT VALUES").lastrowid
+            before = db.total_changes
+            db.executemany("INSERT OR IGNORE INTO items (path, chunk) VALUES (?, ?)",
+                           [(path, chunk_id) for path in paths])
+            added = db.total_changes - before
+            if not added:
+                db.execute("DELETE FROM chunks WHERE id = ?", (chunk_id,))
+            # Heartbeat, so other workers know population is alive
+            db.execute("UPDATE meta SET updated = ? WHERE key = 'populator' AND value = ?",
+                       (time.time(), owner))
+        return added
+    
+    # Claiming and finishing work
+    
+    def claim(self, owner):
+        """
+        Lease the next available chunk.
+        
+        Args:
+            owner (str): This worker's ID
+        
+        Returns:
+            tuple: (chunk_id, paths of its unfinished images), or None if no
+                   chunk is pending or has an expired lease
+        """
+        while True:
+            now = time.time()
+            with self._transaction() as db:
+                row = db.execute(
+                    "SELECT id, attempts FROM chunks WHERE state = 'pending' "
+                    "OR (state = 'leased' AND lease_until < ?) ORDER BY id LIMIT 1",
+                    (now,)).fetchone()
+                if row is None:
+                    return None
+                chunk_id, attempts = row
+                
+                if attempts >= self.max_attempts:
+                    db.execute("UPDATE items SET state = 'failed', error = ?, finished = ? "
+                               "WHERE chunk = ? AND state = 'pending'",
+                               (f"Abandoned after {attempts} attempts", now, chunk_id))
+                    db.execute("UPDATE chunks SET state = 'done', owner = NULL WHERE id = ?",
+                               (chunk_id,))
+                    continue
+                
+                paths = [path for (path,) in db.execute(
+                    "SELECT path FROM items WHERE chunk = ? AND state = 'pending' ORDER BY path",
+                    (chunk_id,))]
+                if not paths:
+                    db.execute("UPDATE chunks SET state = 'done', owner = NULL WHERE id = ?",
+                               (chunk_id,))
+                    continue
+                
+                db.execute("UPDATE chunks SET state = 'leased', owner = ?, lease_until = ?, "
+                           "attempts = attempts + 1 WHERE id = ?",
+                           (owner, now + self.lease_seconds, chunk_id))
+            return chunk_id, [path.replace('/', os.sep) for path in paths]
+    
+    def renew(self, owner):
+        """
+        Extend the leases of every chunk a worker holds, and its populate
+        lease if it is populating the queue.
+        
+        Returns:
+            int: Number of chunk leases renewed
+        """
+        now = time.time()
+        with self._transaction() as db:
+            # Heartbeat while discovery is slow to form the next chunk
+            db.execute("UPDATE meta SET updated = ? WHERE key = 'populator' AND value = ?",
+                       (now, owner))
+            return db.execute("UPDATE chunks SET lease_until = ? "
+                              "WHERE owner = ? AND state = 'leased'",
+                              (now + self.lease_seconds, owner)).rowcount
+    
+    def finish(self, path, owner, error=None):
+        """
+        Record the outcome of an image, closing its chunk once every image
+        in it is finished.
+        
+        Args:
+            path (str): Image path relative to the input root
+            owner (str): This worker's ID
+            error (str): Error message, or None on success
+        
+        Returns:
+            bool: False if the image's chunk is no longer this worker's
+                  (nothing is recorded; the new owner processes it)
+        """
+        path = path.replace(os.sep, '/')
+        with self._transaction() as db:
+            row = db.execute("SELECT chunk FROM items WHERE path = ? AND chunk IN "
+                             "(SELECT id FROM chunks WHERE owner = ?)", (path, owner)).fetchone()
+            if row is None:
+                return False
+            db.execute("UPDATE items SET state = ?, error = ?, owner = ?, finished = ? "
+                       "WHERE path = ?",
+                       ('done' if error is None else 'failed', error, owner, time.time(), path))
+            remaining = db.execute("SELECT 1 FROM items WHERE chunk = ? AND state = 'pending' "
+                                   "LIMIT 1", (row[0],)).fetchone()
+            if remaining is None:
+                db.execute("UPDATE chunks SET state = 'done', owner = NULL WHERE id = ?",
+                           (row[0],))
+        return True
+    
+    @contextmanager
+    def keep_alive(self, owner, interval=None):
+        """
+        Renew this worker's leases in a background thread.
+        
+        Args:
+            owner (str): This worker's ID
+            interval (float): Seconds between renewals; a third of the lease by default
+        """
+        stop = threading.Event()
+        
+        def renew():
+            while not stop.wait(interval or self.lease_seconds / 3):
+                try:
+                    self.renew(owner)
+                except sqlite3.Error:
+                    pass  # Retried at the next interval; the lease has slack
+        
+        thread = threading.Thread(target=renew, name='lease-renewal', daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+    
+    # Monitoring
+    
+    def progress(self):
+        """
+        Global progress across all workers.
+        
+        Returns:
+            dict: 'total', 'pending', 'done' and 'failed' image counts,
+                  'leased' chunk count, 'workers' (IDs holding live leases)
+                  and 'populated'
+        """
+        now = time.time()
+        with self._lock:
+            counts = dict(self._db.execute(
+                "SELECT state, COUNT(*) FROM items GROUP BY state").fetchall())
+            workers = [owner for (owner,) in self._db.execute(
+                "SELECT DISTINCT owner FROM chunks WHERE state = 'leased' AND lease_until >= ? "
+                "ORDER BY owner", (now,))]
+            leased = self._db.execute(
+                "SELECT COUNT(*) FROM chunks WHERE state = 'leased' AND lease_until >= ?",
+                (now,)).fetchone()[0]
+            populated = self._populated(self._db)
+        return {
+            'total': sum(counts.values()),
+            'pending': counts.get('pending', 0),
+            'done': counts.get('done', 0),
+            'failed': counts.get('failed', 0),
+            'leased': leased,
+            'workers': workers,
+            'populated': populated
+        }
+    
+    def populated(self):
+        """Whether the queue has been fully populated."""
+        with self._lock:
+            return self._populated(self._db)
+    
+    @staticmethod
+    def _populated(db):
+        return db.execute("SELECT 1 FROM meta WHERE key = 'populated'").fetchone() is not None
+    
+    def populator_stale(self):
+        """
+        Whether the queue is unpopulated and nobody live is populating it.
+        
+        Returns:
+            bool: True if the populate lease has expired (or was never taken)
+                  and the queue is not marked populated
+        """
+        with self._lock:
+            if self._populated(self._db):
+                return False
+            row = self._db.execute(
+                "SELECT updated FROM meta WHERE key = 'populator'").fetchone()
+        return row is None or row[0] <= time.time() - self.lease_seconds
+    
+    def work(self, owner, poll=5.0, on_claim=None, stop=None, populate=None):
+        """
+        Yield images to process until nothing is left to claim.
+        
+        Claims chunks one at a time as the caller asks for more images, and
+        waits for more while the queue is still being populated. Chunks other
+        workers hold may still come back if they crash; see wait().
+        
+        If the worker populating the queue stops renewing its populate lease,
+        this worker takes the lease over and calls populate() to resume
+        discovery (images already queued are ignored), then carries on.
+        
+        Args:
+            owner (str): This worker's ID
+            poll (float): Seconds between polls while waiting
+            on_claim: Called as on_claim(chunk_id, paths) after each claim
+            stop (threading.Event): Stop waiting for more work once set
+            populate: Called with no arguments to populate the queue after
+                      taking over from a dead populator; None raises instead
+        
+        Yields:
+            str: Image path relative to the input root
+        """
+        while True:
+            claimed = self.claim(owner)
+            if claimed is not None:
+                chunk_id, paths = claimed
+                if on_claim is not None:
+                    on_claim(chunk_id, paths)
+                yield from paths
+                continue
+            
+            if self.populated():
+                return
+            if self.populator_stale():
+                if populate is None:
+                    raise RuntimeError("The worker populating the queue stopped responding "
+                                       "before it finished")
+                if self.start_populating(owner):
+                    populate()
+                    continue
+            if _sleep(poll, stop):
+                return
+    
+    def wait(self, owner, poll=5.0, stop=None):
+        """
+        Wait while other workers hold chunks, in case one of them crashes.
+        
+        Call once this worker has finished everything it claimed, so that
+        surviving workers finish the queue.
+        
+        Args:
+            owner (str): This worker's ID
+            poll (float): Seconds between polls
+            stop (threading.Event): Stop waiting once set
+        
+        Returns:
+            bool: True if a chunk can be claimed again (run work() again);
+                  False once no other worker holds a chunk, or when stopped
+        """
+        while True:
+            now = time.time()
+            with self._lock:
+                claimable = self._db.execute(
+                    "SELECT 1 FROM chunks WHERE state = 'pending' "
+                    "OR (state = 'leased' AND lease_until < ?) LIMIT 1", (now,)).fetchone()
+                others = self._db.execute(
+                    "SELECT 1 FROM chunks WHERE state = 'leased' AND lease_until >= ? "
+                    "AND owner != ? LIMIT 1", (now, owner)).fetchone()
+            if claimable is not None:
+                return True
+            if others is None:
+                return False
+            if _sleep(poll, stop):
+                return False
+    
+    def close(self):
+        """Close the database."""
+        with self._lock:
+            self._db.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
@@ -0,0 +1,233 @@
+"""
+Batch Run Report
+Aggregate per-image timings of a batch run as images finish and summarize
+throughput and latency as JSON
+"""
+
+import heapq
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+PERCENTILES = (50, 95, 99)
+
+
+def peak_rss():
+    """
+    Peak resident set size of this process and of its finished children.
+    
+    Returns:
+        dict: 'self' and 'children' in bytes (None where unavailable);
+              'children' is the largest single child, e.g. a pool worker
+    """
+    if resource is None:
+        return {'self': None, 'children': None}
+    
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return {'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale}
+
+
+def _distribution(sample, count, total, peak):
+    """Percentiles of a sample of milliseconds, with the exact mean and max of all of them."""
+    percentiles = np.percentile(np.asarray(sample, dtype=np.float64), PERCENTILES)
+    summary = {f'p{p}': round(float(v), 3) for p, v in zip(PERCENTILES, percentiles)}
+    summary['mean'] = round(total / count, 3)
+    summary['max'] = round(peak, 3)
+    return summary
+
+
+class RunReport:
+    """
+    Running totals of one batch run.
+    
+    Engines call add() once per image, from any thread. Counts, byte totals
+    and per-stage timing statistics are updated as images finish; only a
+    bounded sample of timings, the slowest images and the first failures
+    are kept, so memory does not grow with the size of the run. build()
+    turns the totals into the JSON report.
+    """
+    
+    def __init__(self, settings=None, on_failure=None, slowest=10, samples=10_000,
+                 max_failures=100):
+        """
+        Start timing a run.
+        
+        Args:
+            settings (dict): JSON-serializable run settings to include
+            on_failure: Called as on_failure(path, error) whenever an image
+                        is recorded as failed
+            slowest (int): Slowest images to keep for the report
+            samples (int): Timings kept per stage for percentiles; runs with
+                           more images are sampled uniformly
+            max_failures (int): Failed images listed by path and error
+        """
+        self.settings = dict(settings or {})
+        self.on_failure = on_failure
+        self.slowest = slowest
+        self.samples = samples
+        self.max_failures = max_failures
+        self.started = datetime.now(timezone.utc)
+        self._start = time.perf_counter()
+        self._elapsed = None
+        self._counts = {'successful': 0, 'failed': 0}
+        self._pixels = 0
+        self._bytes = {'read': 0, 'written': 0}
+        # Stage -> [count, sum, max, sampled milliseconds]
+        self._stages = {}
+        # Min-heap of (total ms, sequence, path, pixels), the slowest on top
+        self._slowest = []
+        self._sequence = 0
+        self._failures = []
+        self._random = random.Random(0)
+        self._lock = threading.Lock()
+    
+    def add(self, path, error=None, pixels=0, timings=None, bytes_read=0, bytes_written=0):
+        """
+        Record the outcome of an image.
+        
+        Args:
+            path (str): Input path
+            error (str): Error message, or None on success
+            pixels (int): Decoded pixel count
+            timings (dict): Stage -> milliseconds, as from EdgeDetector.timing_summary()
+            bytes_read (int): Input bytes read (EdgeDetector.bytes_read)
+            bytes_written (int): Result bytes written (EdgeDetector.bytes_written)
+        """
+        with self._lock:
+            self._bytes['read'] += bytes_read
+            if error is not None:
+                self._failed(path, error)
+            else:
+                self._counts['successful'] += 1
+                self._pixels += pixels
+                self._bytes['written'] += bytes_written
+                timings = timings or {}
+                for stage, ms in timings.items():
+                    self._sample(stage, ms)
+                self._sequence += 1
+                entry = (timings.get('total', 0), self._sequence, path, pixels)
+                if len(self._slowest) < self.slowest:
+                    heapq.heappush(self._slowest, entry)
+                elif self._slowest and entry > self._slowest[0]:
+                    heapq.heapreplace(self._slowest, entry)
+        if error is not None and self.on_failure is not None:
+            self.on_failure(path, error)
+    
+    def add_written(self, nbytes):
+        """Count result bytes written in the background, e.g. ResultWriter.bytes_written."""
+        with self._lock:
+            self._bytes['written'] += nbytes
+    
+    def fail(self, path, error):
+        """
+        Mark an image recorded as successful as failed, e.g. when a
+        background write fails. Its timings and pixels stay in the totals.
+        """
+        with self._lock:
+            self._counts['successful'] -= 1
+            self._failed(path, error)
+        if self.on_failure is not None:
+            self.on_failure(path, error)
+    
+    def _failed(self, path, error):
+        """Count a failure; call with the lock held."""
+        self._counts['failed'] += 1
+        if len(self._failures) < self.max_failures:
+            self._failures.append({'path': path, 'error': error})
+    
+    def _sample(self, stage, ms):
+        """Add a stage timing to the totals and the reservoir sample; call with the lock held."""
+        stats = self._stages.setdefault(stage, [0, 0.0, ms, []])
+        stats[0] += 1
+        stats[1] += ms
+        stats[2] = max(stats[2], ms)
+        sample = stats[3]
+        if len(sample) < self.samples:
+            sample.append(ms)
+        else:
+            # Keep each timing seen so far with equal probability
+            slot = self._random.randrange(stats[0])
+            if slot < self.samples:
+                sample[slot] = ms
+    
+    def finish(self):
+        """Stop the run clock (build() does this if it was not called)."""
+        if self._elapsed is None:
+            self._elapsed = time.perf_counter() - self._start
+    
+    def build(self, skipped=0, slowest=None):
+        """
+        Summarize the run.
+        
+        Args:
+            skipped (int): Images skipped as unchanged (not timed)
+            slowest (int): Number of slowest images to list, at most the
+                           number kept (see __init__); None lists all kept
+        
+        Returns:
+            dict: JSON-serializable report
+        """
+        self.finish()
+        with self._lock:
+            counts = dict(self._counts)
+            megapixels = self._pixels / 1e6
+            totals = dict(self._bytes)
+            latency = {stage: _distribution(sample, count, total, peak)
+                       for stage, (count, total, peak, sample) in self._stages.items()}
+            ranked = sorted(self._slowest, reverse=True)
+            failures = list(self._failures)
+        elapsed = self._elapsed or float('inf')
+        if slowest is not None:
+            ranked = ranked[:slowest]
+        
+        return {
+            'started': self.started.isoformat(),
+            'elapsed_s': round(self._elapsed, 3),
+            'settings': self.settings,
+            'images': {'total': counts['successful'] + counts['failed'] + skipped,
+                       'successful': counts['successful'], 'failed': counts['failed'],
+                       'skipped': skipped},
+            'throughput': {'images_per_s': round(counts['successful'] / elapsed, 3),
+                           'megapixels_per_s': round(megapixels / elapsed, 3)},
+            'latency_ms': latency,
+            'peak_rss_bytes': peak_rss(),
+            'bytes': totals,
+            'slowest': [{'path': path, 'latency_ms': round(total, 3),
+                         'megapixels': round(pixels / 1e6, 3)}
+                        for total, _, path, pixels in ranked],
+            'failures': failures
+        }
+    
+    def write(self, path, skipped=0, slowest=None):
+        """
+        Write the report as JSON.
+        
+        Args:
+            path (str): Report file path
+            skipped (int): Images skipped as unchanged
+            slowest (int): Number of slowest images to list (see build())
+        
+        Returns:
+            dict: The report
+        """
+        report = self.build(skipped=skipped, slowest=slowest)
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        return report
@@ -0,0 +1,292 @@
+"""
+Edge Detection Benchmarks
+Measure per-frame allocations and throughput of the processing paths
+"""
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from edge_detection import EdgeDetector, Workspace, OUTPUTS, parse_outputs
+from edge_detection_webcam import WebcamEdgeDetector
+from encoders import ImageEncoder
+from stack_processing import process_stack
+
+
+def synthetic_frames(count, shape=(480, 640), seed=0):
+    """
+    Generate textured BGR frames of one size.
+    
+    Args:
+        count (int): Number of frames
+        shape (tuple): Frame (height, width)
+        seed (int): Random seed
+    
+    Returns:
+        list: uint8 arrays of shape (height, width, 3)
+    """
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, size=(*shape, 3), dtype=np.uint8) for _ in range(count)]
+
+
+def _measure(process, frames, warmup=2):
+    """
+    Run process on each frame, tracking NumPy allocations per frame.
+    
+    tracemalloc sees NumPy's array buffers (including those OpenCV returns),
+    so the traced bytes per frame count every new output array.
+    
+    Returns:
+        dict: frames, fps and mean bytes allocated per frame
+    """
+    for frame in frames[:warmup]:
+        process(frame)
+    
+    allocated = 0
+    tracemalloc.start()
+    start = time.perf_counter()
+    for frame in frames:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        process(frame)
+        allocated += tracemalloc.get_traced_memory()[1] - before
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+    
+    return {
+        'frames': len(frames),
+        'fps': len(frames) / elapsed if elapsed else float('inf'),
+        'bytes_per_frame': allocated / len(frames)
+    }
+
+
+def benchmark_workspace(frames, outputs=None):
+    """
+    Compare EdgeDetector with and without a reused Workspace.
+    
+    Args:
+        frames (list): Same-size BGR frames
+        outputs: Outputs to compute (see OUTPUTS)
+    
+    Returns:
+        dict: 'fresh' and 'workspace' measurements from _measure
+    """
+    outputs = parse_outputs(outputs)
+    workspace = Workspace()
+    
+    def fresh(frame):
+        EdgeDetector.from_array(frame, outputs=outputs).compute()
+    
+    def reused(frame):
+        EdgeDetector.from_array(frame, outputs=outputs, workspace=workspace).compute()
+    
+    return {'fresh': _measure(fresh, frames), 'workspace': _measure(reused, frames)}
+
+
+def benchmark_webcam(frames, mode='canny'):
+    """
+    Measure WebcamEdgeDetector.process_frame, whose workspace is always on.
+    
+    Args:
+        frames (list): Same-size BGR frames
+        mode (str): Webcam display mode
+    
+    Returns:
+        dict: Measurement from _measure
+    """
+    webcam = WebcamEdgeDetector()
+    webcam.mode = mode
+    return _measure(webcam.process_frame, frames)
+
+
+def _throughput(process, count, repeats=3):
+    """Best images per second of process() over a few repeats."""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        process()
+        best = min(best, time.perf_counter() - start)
+    return count / best if best else float('inf')
+
+
+def benchmark_stack(images, outputs=None, workers=1):
+    """
+    Compare stack processing with per-image loops.
+    
+    Args:
+        images (numpy.ndarray): uint8 stack of shape (N, H, W)
+        outputs: Outputs to compute (see OUTPUTS)
+        workers (int): Threads for process_stack
+        
+    Returns:
+        dict: Images per second for 'per_file' (decode each PNG from disk),
+              'per_array' (one EdgeDetector per in-memory image) and 'stack'
+    """
+    outputs = parse_outputs(outputs)
+    count = images.shape[0]
+    
+    with tempfile.TemporaryDirectory() as folder:
+        paths = []
+        for i, image in enumerate(images):
+            paths.append(os.path.join(folder, f"image_{i:04d}.png"))
+            cv2.imwrite(paths[-1], image)
+        
+        def per_file():
+            for path in paths:
+                EdgeDetector(path, outputs=outputs, decode='grayscale').compute()
+        
+        def per_array():
+            for image in images:
+                EdgeDetector.from_array(image, outputs=outputs).compute()
+        
+        workspace = Workspace()
+        
+        def stack():
+            process_stack(images, outputs=outputs, workers=workers, workspace=workspace)
+        
+        return {
+            'per_file': _throughput(per_file, count),
+            'per_array': _throughput(per_array, count),
+            'stack': _throughput(stack, count)
+        }
+
+
+def benchmark_canny_sweep(image, thresholds):
+    """
+    Compare EdgeDetector.canny_sweep with one cv2.Canny call per threshold pair.
+    
+    Args:
+        image (numpy.ndarray): uint8 image
+        thresholds (list): (threshold1, threshold2) pairs
+        
+    Returns:
+        dict: Milliseconds for 'single' (one Canny call), 'loop' and 'sweep'
+    """
+    detector = EdgeDetector.from_array(image, outputs=('blurred',))
+    blurred = detector.compute()['blurred']
+    
+    def timed(process, repeats=3):
+        best = float('inf')
+        for _ in range(repeats):
+            start = time.perf_counter()
+            process()
+            best = min(best, time.perf_counter() - start)
+        return best * 1000
+    
+    def sweep():
+        # Fresh gradients each time; a 1x1 blur leaves the input unchanged
+        sweeper = EdgeDetector.from_array(blurred, outputs=('canny',))
+        sweeper.set_params(blur_kernel_size=(1, 1))
+        sweeper.canny_sweep(thresholds)
+    
+    return {
+        'single': timed(lambda: cv2.Canny(blurred, *thresholds[0])),
+        'loop': timed(lambda: [cv2.Canny(blurred, t1, t2) for t1, t2 in thresholds]),
+        'sweep': timed(sweep)
+    }
+
+
+def benchmark_encoders(image, encoders=None, repeats=3):
+    """
+    Compare encode time and size of the output encoders.
+    
+    Args:
+        image (numpy.ndarray): uint8 BGR image
+        encoders (dict): Label -> ImageEncoder; defaults to JPEG, PNG and WebP
+        repeats (int): Encodes per measurement (the best is kept)
+    
+    Returns:
+        dict: (output, label) -> dict with 'ms', 'bytes' and 'exact'
+              (whether the output decodes back unchanged), for the grayscale
+              image and the binary Canny mask
+    """
+    if encoders is None:
+        encoders = {
+            'jpg': ImageEncoder(format='jpg', mask_format='jpg'),
+            'jpg-optimize': ImageEncoder(format='jpg', mask_format='jpg', optimize=True),
+            'png': ImageEncoder(format='png'),
+            'webp': ImageEncoder(format='webp', quality=90, mask_format='webp'),
+        }
+    
+    outputs = EdgeDetector.from_array(image, outputs=('grayscale', 'canny'), verbose=False).compute()
+    results = {}
+    for name, output in outputs.items():
+        for label, encoder in encoders.items():
+            best = float('inf')
+            for _ in range(repeats):
+                start = time.perf_counter()
+                encoded = encoder.encode(output, name)
+                best = min(best, time.perf_counter() - start)
+            decoded = cv2.imdecode(encoded, cv2.IMREAD_GRAYSCALE)
+            results[(name, label)] = {
+                'ms': best * 1000,
+                'bytes': encoded.size,
+                'exact': bool(np.array_equal(decoded, output))
+            }
+    return results
+
+
+def _report(label, result):
+    """Print one measurement line."""
+    print(f"  {label:<12} {result['fps']:8.1f} fps  "
+          f"{result['bytes_per_frame'] / 1024:10.1f} KiB allocated/frame")
+
+
+def main():
+    """
+    Main function for running the benchmarks.
+    """
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Edge detection benchmarks')
+    parser.add_argument('--frames', type=int, default=50, help='Frames to time (default: 50)')
+    parser.add_argument('--width', type=int, default=640, help='Frame width (default: 640)')
+    parser.add_argument('--height', type=int, default=480, help='Frame height (default: 480)')
+    parser.add_argument(
+        '--outputs',
+        default=None,
+        help=f'Comma-separated outputs (default: standard set). Available: {", ".join(OUTPUTS)}'
+    )
+    parser.add_argument('--stack', type=int, default=200,
+                        help='Grayscale images in the stack benchmark (default: 200)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Threads for stack processing (default: 1)')
+    
+    args = parser.parse_args()
+    
+    try:
+        frames = synthetic_frames(args.frames, (args.height, args.width))
+        
+        print(f"\nWorkspace reuse, {args.frames} frames of {args.width}x{args.height}:")
+        results = benchmark_workspace(frames, args.outputs)
+        _report('fresh', results['fresh'])
+        _report('workspace', results['workspace'])
+        _report('webcam', benchmark_webcam(frames))
+        
+        stack = synthetic_frames(args.stack, (args.height, args.width))
+        stack = np.stack([cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in stack])
+        print(f"\nStack of {args.stack} grayscale {args.width}x{args.height} images:")
+        for label, rate in benchmark_stack(stack, args.outputs, args.workers).items():
+            print(f"  {label:<12} {rate:8.1f} images/s")
+        
+        grid = [(low, high) for low in range(20, 120, 20) for high in range(60, 260, 20)]
+        print(f"\nCanny sweep of {len(grid)} threshold pairs on one {args.width}x{args.height} image:")
+        for label, ms in benchmark_canny_sweep(stack[0], grid).items():
+            print(f"  {label:<12} {ms:8.1f} ms")
+        
+        print(f"\nEncoders on one {args.width}x{args.height} image:")
+        for (name, label), result in benchmark_encoders(frames[0]).items():
+            print(f"  {name:<10} {label:<14} {result['ms']:8.1f} ms  "
+                  f"{result['bytes'] / 1024:8.1f} KiB  {'lossless' if result['exact'] else 'lossy'}")
+    except Exception as e:
+        print(f"\n[ERROR] {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -46,7 +46,11 @@ class ConfigManager:
             'output': {
                 'directory': 'output',
                 'format': 'jpg',
-                'quality': 95
+                'quality': 95,
+                'optimize': False,
+                'png_compression': 3,
+                'mask_format': 'png',
+                'mode': 'files'
             },
             'logging': {
                 'level': 'INFO',
@@ -62,7 +66,19 @@ class ConfigManager:
             },
             'performance': {
                 'enable_gpu': False,
-                'max_workers': 4
+                'max_workers': 4,
+                'max_inflight_megapixels': 200
+            },
+            'cache': {
+                'enabled': True,
+                'memory_mb': 64,
+                'disk_mb': 1024,
+                'ttl_seconds': 3600
+            },
+            'jobs': {
+                'workers': 2,
+                'retention_seconds': 86400,
+                'lease_seconds': 60
             }
         }
     
@@ -102,7 +118,36 @@ class ConfigManager:
         return {
             'directory': self.get('output.directory', 'output'),
             'format': self.get('output.format', 'jpg'),
-            'quality': self.get('output.quality', 95)
+            'quality': self.get('output.quality', 95),
+            'optimize': self.get('output.optimize', False),
+            'png_compression': self.get('output.png_compression', 3),
+            'mask_format': self.get('output.mask_format', 'png'),
+            'mode': self.get('output.mode', 'files')
+        }
+    
+    def get_performance_config(self) -> Dict[str, Any]:
+        """Get performance configuration."""
+        return {
+            'enable_gpu': self.get('performance.enable_gpu', False),
+            'max_workers': self.get('performance.max_workers', 4),
+            'max_inflight_megapixels': self.get('performance.max_inflight_megapixels', 200)
+        }
+    
+    def get_cache_config(self) -> Dict[str, Any]:
+        """Get web result cache configuration."""
+        return {
+            'enabled': self.get('cache.enabled', True),
+            'memory_mb': self.get('cache.memory_mb', 64),
+            'disk_mb': self.get('cache.disk_mb', 1024),
+            'ttl_seconds': self.get('cache.ttl_seconds', 3600)
+        }
+    
+    def get_jobs_config(self) -> Dict[str, Any]:
+        """Get asynchronous job configuration."""
+        return {
+            'workers': self.get('jobs.workers', 2),
+            'retention_seconds': self.get('jobs.retention_seconds', 86400),
+            'lease_seconds': self.get('jobs.lease_seconds', 60)
         }
     
     def get_web_config(self) -> Dict[str, Any]:
@@ -7,41 +7,721 @@ import cv2
 import numpy as np
 import matplotlib.pyplot as plt
 import os
+import time
+from contextlib import contextmanager
 from pathlib import Path
 
 
+# Stage graph: stage name -> (attribute, dependencies, parameters it reads).
+# Outputs are computed on demand, so a caller asking only for 'canny' never
+# pays for the Sobel or Laplacian passes.
+STAGES = {
+    'grayscale': ('gray_image', (), ()),
+    'blurred': ('blurred_image', ('grayscale',), ('blur_kernel_size', 'sigma')),
+    'gradients': ('gradients', ('blurred',), ('sobel_kernel', 'precision')),
+    'sobel_x': ('sobel_x', ('gradients',), ()),
+    'sobel_y': ('sobel_y', ('gradients',), ()),
+    'sobel_combined': ('sobel_combined', ('sobel_x', 'sobel_y'), ()),
+    'magnitude': ('magnitude', ('gradients',), ()),
+    'orientation': ('orientation', ('gradients',), ()),
+    'laplacian': ('laplacian', ('blurred',), ('laplacian_kernel', 'precision')),
+    # Fixed thresholds, or ones derived from the blurred image's histogram
+    'canny_thresholds': ('canny_thresholds', ('blurred',),
+                         ('canny_threshold1', 'canny_threshold2', 'canny_auto', 'canny_sigma')),
+    # Canny reuses 'gradients' when they are int16 and its aperture matches
+    'canny': ('canny', ('blurred', 'canny_thresholds'), ('sobel_kernel', 'precision')),
+}
+
+# Stages that can be requested as image outputs ('gradients' and
+# 'canny_thresholds' are internal)
+OUTPUTS = ('grayscale', 'blurred', 'sobel_x', 'sobel_y', 'sobel_combined',
+           'magnitude', 'orientation', 'laplacian', 'canny')
+
+# Outputs produced when the caller does not ask for specific ones
+DEFAULT_OUTPUTS = ('grayscale', 'blurred', 'sobel_x', 'sobel_y', 'sobel_combined',
+                   'laplacian', 'canny')
+
+# Sobel aperture cv2.Canny uses internally (and the border mode it applies)
+CANNY_APERTURE = 3
+
+# Derivative precision modes -> OpenCV output depth. Results are saturated
+# to uint8 either way; int16 needs a quarter of the memory of float64.
+PRECISIONS = {
+    'int16': cv2.CV_16S,
+    'float32': cv2.CV_32F,
+    'float64': cv2.CV_64F,
+}
+
+# Largest Sobel/Laplacian aperture whose int16 derivatives cannot overflow on
+# 8-bit input (ksize 5 peaks at 14280; ksize 7 reaches 163200). Larger
+# apertures fall back to float32 in int16 precision.
+INT16_MAX_KSIZE = 5
+
+DEFAULT_PARAMS = {
+    'blur_kernel_size': (5, 5),
+    'sigma': 1.4,
+    'sobel_kernel': 3,
+    'laplacian_kernel': 3,
+    'canny_threshold1': 50,
+    'canny_threshold2': 150,
+    'canny_auto': None,
+    'canny_sigma': 0.33,
+    'precision': 'int16',
+}
+
+# Automatic Canny threshold methods (the 'canny_auto' parameter). Both read
+# one 256-bin histogram of the blurred image:
+#   median - thresholds (1 - canny_sigma) and (1 + canny_sigma) times the median
+#   otsu   - Otsu's threshold as the high threshold, half of it as the low one
+AUTO_THRESHOLDS = ('median', 'otsu')
+
+
+# Decode modes -> cv2.imread flag. Every edge stage works on grayscale, so
+# the color decode is only needed to show or return the original. The
+# reduced modes use libjpeg's DCT scaling to decode JPEGs at 1/2, 1/4 or
+# 1/8 size without ever materializing the full-resolution image.
+DECODE_MODES = {
+    'color': cv2.IMREAD_COLOR,
+    'grayscale': cv2.IMREAD_GRAYSCALE,
+    'reduced_2': cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    'reduced_4': cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    'reduced_8': cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+def _decode_flag(decode):
+    """Look up the cv2.imread flag for a decode mode."""
+    if decode not in DECODE_MODES:
+        raise ValueError(f"Unknown decode mode: {decode}. "
+                         f"Available: {', '.join(DECODE_MODES)}")
+    return DECODE_MODES[decode]
+
+
+def canny_hysteresis(weak, strong):
+    """
+    Canny hysteresis: keep the 8-connected weak-edge components touching a strong edge.
+    
+    Together with EdgeDetector.canny_candidates this reproduces cv2.Canny
+    exactly, while letting the non-local step run separately from the rest.
+    
+    Args:
+        weak (numpy.ndarray): Non-zero where a pixel passes the low threshold
+        strong (numpy.ndarray): Non-zero where a pixel passes the high threshold
+    
+    Returns:
+        numpy.ndarray: uint8 edge mask (0 or 255)
+    """
+    count, labels = cv2.connectedComponents((weak > 0).view(np.uint8), connectivity=8)
+    keep = np.zeros(count, dtype=bool)
+    keep[labels[strong > 0]] = True
+    keep[0] = False
+    
+    edges = keep[labels].view(np.uint8)
+    edges *= 255
+    return edges
+
+
+def auto_canny_thresholds(histogram, method='median', sigma=0.33):
+    """
+    Derive Canny thresholds from an intensity histogram.
+    
+    Args:
+        histogram: 256 pixel counts, e.g. from cv2.calcHist
+        method (str): 'median' or 'otsu' (see AUTO_THRESHOLDS)
+        sigma (float): Spread around the median for the 'median' method
+    
+    Returns:
+        tuple: (threshold1, threshold2) as ints, low first
+    """
+    if method not in AUTO_THRESHOLDS:
+        raise ValueError(f"Unknown threshold method: {method}. "
+                         f"Available: {', '.join(AUTO_THRESHOLDS)}")
+    
+    counts = np.asarray(histogram, dtype=np.float64).ravel()
+    if counts.shape != (256,) or counts.sum() <= 0:
+        raise ValueError("Expected a non-empty 256-bin histogram")
+    
+    cumulative = np.cumsum(counts)
+    total = cumulative[-1]
+    
+    if method == 'median':
+        median = int(np.searchsorted(cumulative, total / 2))
+        return int(max(0, (1.0 - sigma) * median)), int(min(255, (1.0 + sigma) * median))
+    
+    # Otsu: the split maximizing the between-class variance
+    moments = np.cumsum(counts * np.arange(256))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        between = (moments[-1] * cumulative - moments * total) ** 2 / (
+            cumulative * (total - cumulative))
+    threshold = int(np.argmax(np.nan_to_num(between)))
+    return threshold // 2, threshold
+
+
+def parse_outputs(outputs):
+    """
+    Normalize a set of requested output names.
+    
+    Args:
+        outputs: None (default outputs), a comma-separated string or an iterable of names
+    
+    Returns:
+        tuple: Requested output names in pipeline order
+    """
+    if outputs is None:
+        return DEFAULT_OUTPUTS
+    if isinstance(outputs, str):
+        outputs = [name.strip() for name in outputs.split(',') if name.strip()]
+    
+    requested = set(outputs)
+    unknown = requested - set(OUTPUTS)
+    if unknown:
+        raise ValueError(f"Unknown output(s): {', '.join(sorted(unknown))}. "
+                         f"Available: {', '.join(OUTPUTS)}")
+    if not requested:
+        raise ValueError("At least one output must be requested")
+    
+    return tuple(name for name in OUTPUTS if name in requested)
+
+
+class Workspace:
+    """
+    Preallocated output buffers, reused across same-size images or frames.
+    
+    Each role has one buffer, handed to OpenCV's dst= parameters, so after
+    the first image the steady state allocates nothing. When an image of
+    another size (or precision) arrives, the role's old buffer is dropped
+    and replaced, so a batch of mixed sizes holds one image's buffers at a
+    time rather than one set per size seen. Results computed with a
+    workspace alias its buffers: copy anything that must outlive the next
+    image processed with the same workspace.
+    """
+    
+    def __init__(self):
+        """Create an empty workspace."""
+        self._buffers = {}
+        self.allocations = 0
+    
+    def get(self, role, shape, dtype=np.uint8):
+        """
+        Return the buffer for a role, allocating it on first use or when the
+        shape or dtype differs from the role's current buffer.
+        
+        Args:
+            role (str): What the buffer holds, e.g. 'blurred'
+            shape (tuple): Array shape
+            dtype: NumPy dtype
+        
+        Returns:
+            numpy.ndarray: Uninitialized buffer owned by the workspace
+        """
+        shape = tuple(shape)
+        dtype = np.dtype(dtype)
+        buffer = self._buffers.get(role)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            # Drop the old buffer before allocating, so both are never held
+            self._buffers.pop(role, None)
+            buffer = np.empty(shape, dtype=dtype)
+            self._buffers[role] = buffer
+            self.allocations += 1
+        return buffer
+    
+    def clear(self):
+        """Release all buffers."""
+        self._buffers.clear()
+    
+    @property
+    def nbytes(self):
+        """Total size of the buffers held."""
+        return sum(buffer.nbytes for buffer in self._buffers.values())
+
+
 class EdgeDetector:
     """
     A class to perform various edge detection techniques on images.
     """
     
-    def __init__(self, image_path):
+    def __init__(self, image_path, outputs=None, decode='color', workspace=None, hook=None,
+                 verbose=True):
         """
         Initialize the EdgeDetector with an input image.
         
         Args:
             image_path (str): Path to the input image
+            outputs: Outputs to produce (see OUTPUTS); defaults to DEFAULT_OUTPUTS
+            decode (str): Decode mode (see DECODE_MODES)
+            workspace (Workspace): Buffers to reuse for stage outputs
+            hook: Called as hook(stage, elapsed_ns) after each timed stage
+            verbose (bool): Print progress; False keeps the hot path free of terminal I/O
         """
-        self.image_path = image_path
-        self.original_image = cv2.imread(image_path)
-        
-        if self.original_image is None:
+        start = time.perf_counter_ns()
+        # Read, then decode, so the input size is known for reports
+        try:
+            data = np.fromfile(image_path, dtype=np.uint8)
+        except OSError:
+            data = np.empty(0, dtype=np.uint8)
+        image = cv2.imdecode(data, _decode_flag(decode)) if data.size else None
+        elapsed = time.perf_counter_ns() - start
+        
+        if image is None:
             raise ValueError(f"Could not read image from {image_path}")
         
-        # Convert to RGB for display (OpenCV loads as BGR)
-        self.original_rgb = cv2.cvtColor(self.original_image, cv2.COLOR_BGR2RGB)
+        self._setup(image, image_path, outputs, workspace, hook, verbose)
+        self._record('decode', elapsed)
+        self.bytes_read = data.size
+    
+    @classmethod
+    def from_array(cls, image, outputs=None, name='image', workspace=None, hook=None,
+                   verbose=True):
+        """
+        Create an EdgeDetector from an image already in memory.
+        
+        Args:
+            image (numpy.ndarray): BGR (H, W, 3) or grayscale (H, W) uint8 image
+            outputs: Outputs to produce (see OUTPUTS); defaults to DEFAULT_OUTPUTS
+            name (str): Name used in place of a file path, e.g. for save_results
+            workspace (Workspace): Buffers to reuse for stage outputs
+            hook: Called as hook(stage, elapsed_ns) after each timed stage
+            verbose (bool): Print progress; False keeps the hot path free of terminal I/O
+        
+        Returns:
+            EdgeDetector: A detector for the given image
+        """
+        image = np.asarray(image)
+        if image.dtype != np.uint8 or not (
+                image.ndim == 2 or (image.ndim == 3 and image.shape[2] == 3)):
+            raise ValueError(f"Expected a uint8 (H, W) or (H, W, 3) image, "
+                             f"got {image.dtype} {image.shape}")
+        
+        detector = cls.__new__(cls)
+        detector._setup(image, name, outputs, workspace, hook, verbose)
+        return detector
+    
+    @classmethod
+    def from_bytes(cls, data, outputs=None, name='image', decode='color', workspace=None,
+                   hook=None, verbose=True):
+        """
+        Create an EdgeDetector from encoded image bytes (JPEG, PNG, ...).
+        
+        Args:
+            data (bytes): Encoded image file contents
+            outputs: Outputs to produce (see OUTPUTS); defaults to DEFAULT_OUTPUTS
+            name (str): Name used in place of a file path, e.g. for save_results
+            decode (str): Decode mode (see DECODE_MODES)
+            workspace (Workspace): Buffers to reuse for stage outputs
+            hook: Called as hook(stage, elapsed_ns) after each timed stage
+            verbose (bool): Print progress; False keeps the hot path free of terminal I/O
+        
+        Returns:
+            EdgeDetector: A detector for the decoded image
+        """
+        start = time.perf_counter_ns()
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), _decode_flag(decode))
+        elapsed = time.perf_counter_ns() - start
+        
+        if image is None:
+            raise ValueError(f"Could not decode image data for {name}")
+        
+        detector = cls.from_array(image, outputs=outputs, name=name, workspace=workspace,
+                                  hook=hook, verbose=verbose)
+        detector._record('decode', elapsed)
+        detector.bytes_read = len(data)
+        return detector
+    
+    @classmethod
+    def from_stream(cls, stream, outputs=None, name='image', decode='color', workspace=None,
+                    hook=None, verbose=True):
+        """
+        Create an EdgeDetector from a binary file-like object.
+        
+        Args:
+            stream: Object with a read() method returning encoded image bytes
+            outputs: Outputs to produce (see OUTPUTS); defaults to DEFAULT_OUTPUTS
+            name (str): Name used in place of a file path, e.g. for save_results
+            decode (str): Decode mode (see DECODE_MODES)
+            workspace (Workspace): Buffers to reuse for stage outputs
+            hook: Called as hook(stage, elapsed_ns) after each timed stage
+            verbose (bool): Print progress; False keeps the hot path free of terminal I/O
+        
+        Returns:
+            EdgeDetector: A detector for the decoded image
+        """
+        start = time.perf_counter_ns()
+        data = stream.read()
+        elapsed = time.perf_counter_ns() - start
+        
+        detector = cls.from_bytes(data, outputs=outputs, name=name, decode=decode,
+                                  workspace=workspace, hook=hook, verbose=verbose)
+        detector._record('read', elapsed)
+        return detector
+    
+    def _setup(self, image, image_path, outputs, workspace=None, hook=None, verbose=True):
+        """Initialize detector state around a decoded image."""
+        self.image_path = image_path
+        self.workspace = workspace
+        self.hook = hook
+        self.verbose = verbose
+        
+        # Nanoseconds spent per stage (decode, each computed stage, encode, write)
+        self.timings = {}
+        # Encoded input size, and result bytes written by save_results (not
+        # counting writes handed to a ResultWriter)
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.outputs = parse_outputs(outputs)
+        self.params = dict(DEFAULT_PARAMS)
+        self.original_image = image
+        
+        # RGB copy for display, built on first use (see original_rgb)
+        self._original_rgb = None
         
         # Preprocessing
         self.gray_image = None
         self.blurred_image = None
         
+        # Shared int16 Sobel derivatives (dx, dy)
+        self.gradients = None
+        
         # Edge detection results
         self.sobel_x = None
         self.sobel_y = None
         self.sobel_combined = None
+        self.magnitude = None
+        self.orientation = None
         self.laplacian = None
+        self.canny_thresholds = None
         self.canny = None
+    
+    @property
+    def original_rgb(self):
+        """The original image as RGB for display (OpenCV loads as BGR)."""
+        if self._original_rgb is None:
+            if self.original_image.ndim == 2:
+                self._original_rgb = cv2.cvtColor(self.original_image, cv2.COLOR_GRAY2RGB)
+            else:
+                self._original_rgb = cv2.cvtColor(self.original_image, cv2.COLOR_BGR2RGB)
+        return self._original_rgb
+    
+    def _record(self, stage, elapsed_ns):
+        """Add time spent in a stage and pass it to the hook, if any."""
+        self.timings[stage] = self.timings.get(stage, 0) + elapsed_ns
+        if self.hook is not None:
+            self.hook(stage, elapsed_ns)
+    
+    @contextmanager
+    def timed(self, stage):
+        """
+        Time a block of work as a stage, e.g. encoding results for a response.
+        
+        Args:
+            stage (str): Name the time is recorded under in timings
+        """
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self._record(stage, time.perf_counter_ns() - start)
+    
+    def timing_summary(self):
+        """
+        Stage timings in milliseconds.
+        
+        Returns:
+            dict: Stage name -> milliseconds, plus 'total'
+        """
+        summary = {stage: elapsed / 1e6 for stage, elapsed in self.timings.items()}
+        summary['total'] = sum(self.timings.values()) / 1e6
+        return summary
+    
+    def _log(self, message):
+        """Print progress unless the detector is silent."""
+        if self.verbose:
+            print(message)
+    
+    def set_params(self, **params):
+        """
+        Update processing parameters, discarding any stage they invalidate.
+        
+        Args:
+            **params: Any of the keys in DEFAULT_PARAMS
+        """
+        unknown = set(params) - set(DEFAULT_PARAMS)
+        if unknown:
+            raise ValueError(f"Unknown parameter(s): {', '.join(sorted(unknown))}")
+        
+        if 'blur_kernel_size' in params:
+            params['blur_kernel_size'] = tuple(params['blur_kernel_size'])
+        if 'precision' in params and params['precision'] not in PRECISIONS:
+            raise ValueError(f"Unknown precision: {params['precision']}. "
+                             f"Available: {', '.join(PRECISIONS)}")
+        if params.get('canny_auto') is not None and params['canny_auto'] not in AUTO_THRESHOLDS:
+            raise ValueError(f"Unknown threshold method: {params['canny_auto']}. "
+                             f"Available: {', '.join(AUTO_THRESHOLDS)}")
+        
+        changed = {key for key, value in params.items() if self.params[key] != value}
+        self.params.update(params)
+        
+        for name, (_, _, stage_params) in STAGES.items():
+            if changed.intersection(stage_params):
+                self._invalidate(name)
+    
+    def _invalidate(self, name):
+        """Drop a memoized stage and everything derived from it."""
+        setattr(self, STAGES[name][0], None)
+        for other, (_, dependencies, _) in STAGES.items():
+            if name in dependencies:
+                self._invalidate(other)
+    
+    def get_output(self, name):
+        """
+        Return a single output, computing it and its dependencies if needed.
+        
+        Args:
+            name (str): Output name (see OUTPUTS)
+        
+        Returns:
+            numpy.ndarray: The requested output
+        """
+        if name not in STAGES:
+            raise ValueError(f"Unknown stage: {name}. Available: {', '.join(STAGES)}")
+        
+        attribute, dependencies, _ = STAGES[name]
+        result = getattr(self, attribute)
+        if result is None:
+            for dependency in dependencies:
+                self.get_output(dependency)
+            with self.timed(name):
+                result = getattr(self, f"_compute_{name}")()
+            setattr(self, attribute, result)
+        return result
+    
+    def compute(self, outputs=None, workers=1, **params):
+        """
+        Compute only the requested outputs and the stages they depend on.
+        
+        Intermediate results are memoized, so asking for more outputs later
+        reuses what has already been computed.
+        
+        Args:
+            outputs: Outputs to compute; defaults to the ones given at construction
+            workers (int): Threads for splitting images of MIN_PARALLEL_PIXELS
+                           or more into tiles (see strip_processing.process_in_tiles)
+            **params: Processing parameters (see DEFAULT_PARAMS)
+        
+        Returns:
+            dict: Output name -> image
+        """
+        self.set_params(**params)
+        names = self.outputs if outputs is None else parse_outputs(outputs)
+        
+        if workers > 1:
+            from strip_processing import process_in_tiles, MIN_PARALLEL_PIXELS, MIN_TILE_ROWS
+            
+            height, width = self.original_image.shape[:2]
+            missing = [name for name in names if getattr(self, STAGES[name][0]) is None]
+            if (missing and height >= 2 * MIN_TILE_ROWS
+                    and height * width >= MIN_PARALLEL_PIXELS):
+                params = dict(self.params)
+                if 'canny' in missing:
+                    if params['canny_auto'] is None:
+                        self.canny_thresholds = (params['canny_threshold1'],
+                                                 params['canny_threshold2'])
+                    # Tiles must share the thresholds of the whole image
+                    threshold1, threshold2 = self.get_output('canny_thresholds')
+                    params.update(canny_auto=None, canny_threshold1=threshold1,
+                                  canny_threshold2=threshold2)
+                with self.timed('tiles'):
+                    tiled = process_in_tiles(self.original_image, missing, workers=workers,
+                                             **params)
+                for name, image in tiled.items():
+                    setattr(self, STAGES[name][0], image)
+        
+        return {name: self.get_output(name) for name in names}
+    
+    def _buffer(self, role, dtype=np.uint8):
+        """Workspace buffer of the image's (H, W) size, or None to let OpenCV allocate."""
+        if self.workspace is None:
+            return None
+        return self.workspace.get(role, self.original_image.shape[:2], dtype)
+    
+    def _as_float32(self, role, array):
+        """float32 copy of a derivative, into a workspace buffer when available."""
+        buffer = self._buffer(role, np.float32)
+        if buffer is None:
+            return array.astype(np.float32)
+        np.copyto(buffer, array, casting='unsafe')
+        return buffer
+    
+    def _derivative_precision(self, kernel_size):
+        """The precision setting, or float32 where int16 would saturate (see INT16_MAX_KSIZE)."""
+        precision = self.params['precision']
+        if precision == 'int16' and kernel_size > INT16_MAX_KSIZE:
+            return 'float32'
+        return precision
+    
+    def _compute_grayscale(self):
+        """Convert the original BGR image to grayscale."""
+        if self.original_image.ndim == 2:
+            return self.original_image
+        return cv2.cvtColor(self.original_image, cv2.COLOR_BGR2GRAY,
+                            dst=self._buffer('grayscale'))
+    
+    def _compute_blurred(self):
+        """Apply Gaussian blur to reduce noise."""
+        return cv2.GaussianBlur(self.gray_image, self.params['blur_kernel_size'],
+                                self.params['sigma'], dst=self._buffer('blurred'))
+    
+    def _compute_gradients(self):
+        """
+        Sobel derivatives in X and Y, computed once for every consumer.
+        
+        Uses the same replicated border as cv2.Canny, so in int16 precision
+        the pair can be fed straight into its dx/dy overload. Apertures above
+        INT16_MAX_KSIZE are computed in float32 instead.
+        """
+        kernel_size = self.params['sobel_kernel']
+        precision = self._derivative_precision(kernel_size)
+        ddepth = PRECISIONS[precision]
+        dx = cv2.Sobel(self.blurred_image, ddepth, 1, 0, ksize=kernel_size,
+                       dst=self._buffer('dx', precision), borderType=cv2.BORDER_REPLICATE)
+        dy = cv2.Sobel(self.blurred_image, ddepth, 0, 1, ksize=kernel_size,
+                       dst=self._buffer('dy', precision), borderType=cv2.BORDER_REPLICATE)
+        return dx, dy
+    
+    def _compute_sobel_x(self):
+        """Sobel in X direction (vertical edges)."""
+        return cv2.convertScaleAbs(self.gradients[0], dst=self._buffer('sobel_x'))
+    
+    def _compute_sobel_y(self):
+        """Sobel in Y direction (horizontal edges)."""
+        return cv2.convertScaleAbs(self.gradients[1], dst=self._buffer('sobel_y'))
+    
+    def _compute_sobel_combined(self):
+        """Combine Sobel X and Y."""
+        return cv2.addWeighted(self.sobel_x, 0.5, self.sobel_y, 0.5, 0,
+                               dst=self._buffer('sobel_combined'))
+    
+    def _compute_magnitude(self):
+        """True L2 gradient magnitude, saturated to 8 bits."""
+        dx, dy = self.gradients
+        magnitude = cv2.magnitude(self._as_float32('dx_f32', dx), self._as_float32('dy_f32', dy),
+                                  magnitude=self._buffer('magnitude_f32', np.float32))
+        return cv2.convertScaleAbs(magnitude, dst=self._buffer('magnitude'))
+    
+    def _compute_orientation(self):
+        """Gradient direction in 2-degree steps (0-180), as OpenCV stores hue."""
+        dx, dy = self.gradients
+        angle = cv2.phase(self._as_float32('dx_f32', dx), self._as_float32('dy_f32', dy),
+                          angle=self._buffer('angle_f32', np.float32), angleInDegrees=True)
+        return cv2.convertScaleAbs(angle, dst=self._buffer('orientation'), alpha=0.5)
+    
+    def _compute_laplacian(self):
+        """Second derivative edges."""
+        precision = self._derivative_precision(self.params['laplacian_kernel'])
+        laplacian = cv2.Laplacian(self.blurred_image, PRECISIONS[precision],
+                                  dst=self._buffer('laplacian_raw', precision),
+                                  ksize=self.params['laplacian_kernel'])
+        return cv2.convertScaleAbs(laplacian, dst=self._buffer('laplacian'))
+    
+    def _canny_gradients(self):
+        """int16 aperture-3 gradients for Canny, shared with Sobel when they match."""
+        if (self.params['sobel_kernel'] == CANNY_APERTURE
+                and self.params['precision'] == 'int16'):
+            return self.get_output('gradients')
+        
+        blurred = self.get_output('blurred')
+        dx = cv2.Sobel(blurred, cv2.CV_16S, 1, 0, ksize=CANNY_APERTURE,
+                       dst=self._buffer('canny_dx', np.int16), borderType=cv2.BORDER_REPLICATE)
+        dy = cv2.Sobel(blurred, cv2.CV_16S, 0, 1, ksize=CANNY_APERTURE,
+                       dst=self._buffer('canny_dy', np.int16), borderType=cv2.BORDER_REPLICATE)
+        return dx, dy
+    
+    def _compute_canny_thresholds(self):
+        """The configured Canny thresholds, or automatic ones from one histogram pass."""
+        if self.params['canny_auto'] is None:
+            return self.params['canny_threshold1'], self.params['canny_threshold2']
+        
+        histogram = cv2.calcHist([self.blurred_image], [0], None, [256], [0, 256])
+        return auto_canny_thresholds(histogram, self.params['canny_auto'],
+                                     self.params['canny_sigma'])
+    
+    def _compute_canny(self):
+        """Canny edges, reusing the shared gradients when the aperture matches."""
+        dx, dy = self._canny_gradients()
+        threshold1, threshold2 = self.canny_thresholds
+        return cv2.Canny(dx, dy, threshold1, threshold2, edges=self._buffer('canny'))
+    
+    def canny_candidates(self):
+        """
+        Canny edge candidates before hysteresis.
+        
+        Returns:
+            tuple: (weak, strong) uint8 masks of non-maximum-suppressed pixels
+                   above the low and the high threshold respectively
+        """
+        low, high = sorted(self.get_output('canny_thresholds'))
+        dx, dy = self._canny_gradients()
+        return cv2.Canny(dx, dy, low, low), cv2.Canny(dx, dy, high, high)
+    
+    def _canny_maxima(self):
+        """Gradient maxima left by non-maximum suppression (Canny with zero thresholds)."""
+        dx, dy = self._canny_gradients()
+        return cv2.Canny(dx, dy, 0, 0)
+    
+    def _label_components(self, mask):
+        """8-connected component labels of a boolean mask, as (count, labels)."""
+        return cv2.connectedComponents(mask.view(np.uint8), connectivity=8)
+    
+    def canny_sweep(self, thresholds):
+        """
+        Canny edges for many threshold pairs from one gradient and NMS pass.
+        
+        Non-maximum suppression does not depend on the thresholds, so it runs
+        once. Each distinct low threshold then costs one component labelling
+        (about half a Canny call) and each pair only a lookup, so sweeping
+        high thresholds at a few low ones is cheapest. Every mask equals
+        cv2.Canny(blurred, threshold1, threshold2) for its pair.
+        
+        Args:
+            thresholds: Iterable of (threshold1, threshold2) pairs
         
+        Returns:
+            tuple: (masks, densities) - uint8 array (P, H, W) of 0/255 masks
+                   and float array (P,) of the fraction of edge pixels
+        """
+        # Canny floors its thresholds and orders them itself
+        pairs = [tuple(sorted((int(np.floor(t1)), int(np.floor(t2))))) for t1, t2 in thresholds]
+        if not pairs:
+            raise ValueError("At least one threshold pair is required")
+        
+        dx, dy = self._canny_gradients()
+        shape = dx.shape
+        # Flat positions of the suppressed maxima and Canny's default L1 magnitude there
+        maxima = np.flatnonzero(self._canny_maxima())
+        magnitude = (np.abs(dx.ravel()[maxima], dtype=np.int32)
+                     + np.abs(dy.ravel()[maxima], dtype=np.int32))
+        
+        masks = np.zeros((len(pairs), shape[0] * shape[1]), dtype=np.uint8)
+        densities = np.empty(len(pairs))
+        weak = np.zeros(shape, dtype=bool)
+        for low in sorted({low for low, _ in pairs}):
+            passed = magnitude > low
+            weak.ravel()[maxima] = passed
+            positions = maxima[passed]
+            count, labels = self._label_components(weak)
+            component = labels.ravel()[positions]
+            
+            # Strongest magnitude in each component decides it for every high threshold
+            peak = np.zeros(count, dtype=np.int32)
+            np.maximum.at(peak, component, magnitude[passed])
+            
+            for index, (pair_low, high) in enumerate(pairs):
+                if pair_low == low:
+                    kept = positions[peak[component] > high]
+                    masks[index, kept] = 255
+                    densities[index] = kept.size / masks.shape[1]
+        
+        return masks.reshape((len(pairs),) + shape), densities
+    
     def preprocess(self, blur_kernel_size=(5, 5), sigma=1.4):
         """
         Preprocess the image: convert to grayscale and apply Gaussian blur.
@@ -50,75 +730,75 @@ class EdgeDetector:
             blur_kernel_size (tuple): Size of the Gaussian kernel
             sigma (float): Standard deviation for Gaussian kernel
         """
-        print("Preprocessing image...")
+        self._log("Preprocessing image...")
         
-        # Convert to grayscale
-        self.gray_image = cv2.cvtColor(self.original_image, cv2.COLOR_BGR2GRAY)
+        self.set_params(blur_kernel_size=blur_kernel_size, sigma=sigma)
         
-        # Apply Gaussian blur to reduce noise
-        self.blurred_image = cv2.GaussianBlur(self.gray_image, blur_kernel_size, sigma)
+        # Convert to grayscale, then apply Gaussian blur to reduce noise
+        self.get_output('blurred')
         
-        print("[OK] Image converted to grayscale")
-        print(f"[OK] Gaussian blur applied (kernel: {blur_kernel_size}, sigma: {sigma})")
+        self._log("[OK] Image converted to grayscale")
+        self._log(f"[OK] Gaussian blur applied (kernel: {blur_kernel_size}, sigma: {sigma})")
     
-    def apply_sobel(self, kernel_size=3):
+    def apply_sobel(self, kernel_size=3, precision='int16'):
         """
         Apply Sobel edge detection in X and Y directions.
         
         Args:
             kernel_size (int): Size of the Sobel kernel (must be odd: 1, 3, 5, or 7)
+            precision (str): Derivative precision: 'int16', 'float32' or 'float64'
         """
-        print("\nApplying Sobel edge detection...")
-        
-        # Sobel in X direction (vertical edges)
-        self.sobel_x = cv2.Sobel(self.blurred_image, cv2.CV_64F, 1, 0, ksize=kernel_size)
-        self.sobel_x = np.absolute(self.sobel_x)
-        self.sobel_x = np.uint8(self.sobel_x)
+        self._log("\nApplying Sobel edge detection...")
         
-        # Sobel in Y direction (horizontal edges)
-        self.sobel_y = cv2.Sobel(self.blurred_image, cv2.CV_64F, 0, 1, ksize=kernel_size)
-        self.sobel_y = np.absolute(self.sobel_y)
-        self.sobel_y = np.uint8(self.sobel_y)
+        self.set_params(sobel_kernel=kernel_size, precision=precision)
         
-        # Combine Sobel X and Y
-        self.sobel_combined = cv2.addWeighted(self.sobel_x, 0.5, self.sobel_y, 0.5, 0)
+        # Sobel in X (vertical edges) and Y (horizontal edges), then combined
+        self.get_output('sobel_combined')
         
-        print(f"[OK] Sobel edge detection completed (kernel size: {kernel_size})")
+        self._log(f"[OK] Sobel edge detection completed (kernel size: {kernel_size})")
     
-    def apply_laplacian(self, kernel_size=3):
+    def apply_laplacian(self, kernel_size=3, precision='int16'):
         """
         Apply Laplacian edge detection.
         
         Args:
             kernel_size (int): Size of the Laplacian kernel
+            precision (str): Derivative precision: 'int16', 'float32' or 'float64'
         """
-        print("\nApplying Laplacian edge detection...")
+        self._log("\nApplying Laplacian edge detection...")
         
-        self.laplacian = cv2.Laplacian(self.blurred_image, cv2.CV_64F, ksize=kernel_size)
-        self.laplacian = np.absolute(self.laplacian)
-        self.laplacian = np.uint8(self.laplacian)
+        self.set_params(laplacian_kernel=kernel_size, precision=precision)
+        self.get_output('laplacian')
         
-        print(f"[OK] Laplacian edge detection completed (kernel size: {kernel_size})")
+        self._log(f"[OK] Laplacian edge detection completed (kernel size: {kernel_size})")
     
-    def apply_canny(self, threshold1=50, threshold2=150):
+    def apply_canny(self, threshold1=50, threshold2=150, auto=None):
         """
         Apply Canny edge detection.
         
         Args:
             threshold1 (int): Lower threshold for hysteresis
             threshold2 (int): Upper threshold for hysteresis
+            auto (str): Derive the thresholds instead: 'median' or 'otsu'
         """
-        print("\nApplying Canny edge detection...")
+        self._log("\nApplying Canny edge detection...")
         
-        self.canny = cv2.Canny(self.blurred_image, threshold1, threshold2)
+        self.set_params(canny_threshold1=threshold1, canny_threshold2=threshold2,
+                        canny_auto=auto)
+        self.get_output('canny')
         
-        print(f"[OK] Canny edge detection completed (thresholds: {threshold1}, {threshold2})")
+        threshold1, threshold2 = self.canny_thresholds
+        method = f", {auto}" if auto else ""
+        self._log(f"[OK] Canny edge detection completed (thresholds: {threshold1}, {threshold2}{method})")
     
     def display_results(self):
         """
         Display all edge detection results in a single figure.
         """
-        print("\nDisplaying results...")
+        self._log("\nDisplaying results...")
+        
+        # The comparison grid shows every default stage
+        self.compute(DEFAULT_OUTPUTS)
         
         fig, axes = plt.subplots(2, 4, figsize=(18, 10))
         fig.suptitle('Edge Detection Results Comparison', fontsize=16, fontweight='bold')
@@ -166,40 +846,94 @@ class EdgeDetector:
         plt.tight_layout()
         plt.show()
         
-        print("[OK] Results displayed successfully")
+        self._log("[OK] Results displayed successfully")
     
-    def save_results(self, output_dir='output'):
+    def save_results(self, output_dir='output', writer=None, encoder=None, bundle=False):
         """
-        Save all edge detection results to files.
+        Save the requested edge detection results to files.
         
         Args:
             output_dir (str): Directory to save output images
+            writer (ResultWriter): Encode and write in the background instead;
+                                   call writer.flush() to wait and raise errors
+            encoder (ImageEncoder): Output formats; defaults to config.yaml's output section
+            bundle (bool): Write one <name>.npz holding every output and a
+                           metadata header instead of one file per output
+                           (see result_bundle)
+        
+        Returns:
+            dict: Output name -> file path (the bundle path for every output in bundle mode)
         """
-        print(f"\nSaving results to '{output_dir}' directory...")
+        self._log(f"\nSaving results to '{output_dir}' directory...")
         
         # Create output directory if it doesn't exist
-        Path(output_dir).mkdir(exist_ok=True)
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
         
         # Get base filename
         base_name = Path(self.image_path).stem
         
+        if encoder is None:
+            from encoders import ImageEncoder
+            encoder = ImageEncoder.from_config()
+        
+        results = self.compute()
+        if bundle:
+            from result_bundle import BUNDLE_EXTENSION
+            return self._save_bundle(f"{output_dir}/{base_name}{BUNDLE_EXTENSION}", results,
+                                     writer, encoder)
+        
         # Save each result
-        cv2.imwrite(f"{output_dir}/{base_name}_grayscale.jpg", self.gray_image)
-        cv2.imwrite(f"{output_dir}/{base_name}_blurred.jpg", self.blurred_image)
-        cv2.imwrite(f"{output_dir}/{base_name}_sobel_x.jpg", self.sobel_x)
-        cv2.imwrite(f"{output_dir}/{base_name}_sobel_y.jpg", self.sobel_y)
-        cv2.imwrite(f"{output_dir}/{base_name}_sobel_combined.jpg", self.sobel_combined)
-        cv2.imwrite(f"{output_dir}/{base_name}_laplacian.jpg", self.laplacian)
-        cv2.imwrite(f"{output_dir}/{base_name}_canny.jpg", self.canny)
-        
-        print("[OK] All results saved successfully:")
-        print(f"  - {base_name}_grayscale.jpg")
-        print(f"  - {base_name}_blurred.jpg")
-        print(f"  - {base_name}_sobel_x.jpg")
-        print(f"  - {base_name}_sobel_y.jpg")
-        print(f"  - {base_name}_sobel_combined.jpg")
-        print(f"  - {base_name}_laplacian.jpg")
-        print(f"  - {base_name}_canny.jpg")
+        paths = {name: f"{output_dir}/{base_name}_{name}{encoder.extension(name)}"
+                 for name in results}
+        for name, image in results.items():
+            if writer is not None:
+                # Workspace buffers are overwritten by the next image
+                if self.workspace is not None:
+                    image = image.copy()
+                with self.timed('submit'):
+                    writer.submit(paths[name], image, encoder.params(name))
+                continue
+            
+            with self.timed('encode'):
+                encoded = encoder.encode(image, name)
+            with self.timed('write'):
+                encoded.tofile(paths[name])
+            self.bytes_written += encoded.nbytes
+        
+        if writer is not None:
+            self._log("[OK] All results queued for writing:")
+        else:
+            self._log("[OK] All results saved successfully:")
+        for path in paths.values():
+            self._log(f"  - {Path(path).name}")
+        
+        return paths
+    
+    def _save_bundle(self, path, results, writer, encoder):
+        """Write all results to one bundle file (see save_results)."""
+        from result_bundle import write_bundle
+        
+        # Everything needed to interpret the layers without the input image
+        metadata = {
+            'source': str(self.image_path),
+            'image_shape': list(self.original_image.shape),
+            'params': self.params,
+            'canny_thresholds': ([int(t) for t in self.canny_thresholds]
+                                 if self.canny_thresholds else None)
+        }
+        if writer is not None:
+            if self.workspace is not None:
+                results = {name: image.copy() for name, image in results.items()}
+            with self.timed('submit'):
+                writer.submit_bundle(path, results, metadata, encoder)
+            self._log(f"[OK] Bundle queued for writing: {Path(path).name}")
+        else:
+            with self.timed('write'):
+                write_bundle(path, results, metadata, encoder)
+            self.bytes_written += os.path.getsize(path)
+            self._log(f"[OK] Bundle saved: {Path(path).name} ({', '.join(results)})")
+        
+        return {name: path for name in results}
     
     def process_complete_pipeline(self, save_output=True, display=True):
         """
@@ -209,17 +943,12 @@ class EdgeDetector:
             save_output (bool): Whether to save results to disk
             display (bool): Whether to display results
         """
-        print("=" * 60)
-        print("EDGE DETECTION PIPELINE")
-        print("=" * 60)
-        
-        # Preprocessing
-        self.preprocess()
+        self._log("=" * 60)
+        self._log("EDGE DETECTION PIPELINE")
+        self._log("=" * 60)
         
-        # Apply all edge detection methods
-        self.apply_sobel()
-        self.apply_laplacian()
-        self.apply_canny()
+        # Compute the requested outputs and whatever they depend on
+        self.compute()
         
         # Display results
         if display:
@@ -229,9 +958,9 @@ class EdgeDetector:
         if save_output:
             self.save_results()
         
-        print("\n" + "=" * 60)
-        print("PIPELINE COMPLETED SUCCESSFULLY")
-        print("=" * 60)
+        self._log("\n" + "=" * 60)
+        self._log("PIPELINE COMPLETED SUCCESSFULLY")
+        self._log("=" * 60)
 
 
 def main():
@@ -282,7 +1011,7 @@ def main():
         
         # Run complete pipeline
         detector.process_complete_pipeline(save_output=True, display=True)
-        
+    
     except Exception as e:
         print(f"\n[ERROR] Error occurred: {str(e)}")
         import traceback
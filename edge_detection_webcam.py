@@ -4,7 +4,8 @@ Implements live edge detection with multiple algorithms
 """
 
 import cv2
-import numpy as np
+
+from edge_detection import PRECISIONS, Workspace
 
 
 class WebcamEdgeDetector:
@@ -29,6 +30,10 @@ class WebcamEdgeDetector:
         self.canny_threshold2 = 150
         self.sobel_kernel = 3
         self.laplacian_kernel = 3
+        self.precision = 'int16'  # Derivative precision (see PRECISIONS)
+        
+        # Frame buffers reused across same-size frames
+        self.workspace = Workspace()
         
     def initialize_camera(self):
         """
@@ -56,41 +61,46 @@ class WebcamEdgeDetector:
         Returns:
             Preprocessed grayscale and blurred frame
         """
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        blurred = cv2.GaussianBlur(gray, self.blur_kernel, 1.4)
+        size = frame.shape[:2]
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.workspace.get('gray', size))
+        blurred = cv2.GaussianBlur(gray, self.blur_kernel, 1.4,
+                                   dst=self.workspace.get('blurred', size))
         return gray, blurred
     
+    def _derivative_buffer(self, role, blurred):
+        """Workspace buffer for a raw derivative at the current precision."""
+        return self.workspace.get(role, blurred.shape, self.precision)
+    
     def apply_sobel_x(self, blurred):
         """Apply Sobel X edge detection."""
-        sobel_x = cv2.Sobel(blurred, cv2.CV_64F, 1, 0, ksize=self.sobel_kernel)
-        sobel_x = np.absolute(sobel_x)
-        sobel_x = np.uint8(sobel_x)
-        return sobel_x
+        sobel_x = cv2.Sobel(blurred, PRECISIONS[self.precision], 1, 0, ksize=self.sobel_kernel,
+                            dst=self._derivative_buffer('dx', blurred))
+        return cv2.convertScaleAbs(sobel_x, dst=self.workspace.get('sobel_x', blurred.shape))
     
     def apply_sobel_y(self, blurred):
         """Apply Sobel Y edge detection."""
-        sobel_y = cv2.Sobel(blurred, cv2.CV_64F, 0, 1, ksize=self.sobel_kernel)
-        sobel_y = np.absolute(sobel_y)
-        sobel_y = np.uint8(sobel_y)
-        return sobel_y
+        sobel_y = cv2.Sobel(blurred, PRECISIONS[self.precision], 0, 1, ksize=self.sobel_kernel,
+                            dst=self._derivative_buffer('dy', blurred))
+        return cv2.convertScaleAbs(sobel_y, dst=self.workspace.get('sobel_y', blurred.shape))
     
     def apply_sobel_combined(self, blurred):
         """Apply combined Sobel edge detection."""
         sobel_x = self.apply_sobel_x(blurred)
         sobel_y = self.apply_sobel_y(blurred)
-        sobel_combined = cv2.addWeighted(sobel_x, 0.5, sobel_y, 0.5, 0)
+        sobel_combined = cv2.addWeighted(sobel_x, 0.5, sobel_y, 0.5, 0,
+                                         dst=self.workspace.get('combined', blurred.shape))
         return sobel_combined
     
     def apply_laplacian(self, blurred):
         """Apply Laplacian edge detection."""
-        laplacian = cv2.Laplacian(blurred, cv2.CV_64F, ksize=self.laplacian_kernel)
-        laplacian = np.absolute(laplacian)
-        laplacian = np.uint8(laplacian)
-        return laplacian
+        laplacian = cv2.Laplacian(blurred, PRECISIONS[self.precision], ksize=self.laplacian_kernel,
+                                  dst=self._derivative_buffer('laplacian_raw', blurred))
+        return cv2.convertScaleAbs(laplacian, dst=self.workspace.get('laplacian', blurred.shape))
     
     def apply_canny(self, blurred):
         """Apply Canny edge detection."""
-        canny = cv2.Canny(blurred, self.canny_threshold1, self.canny_threshold2)
+        canny = cv2.Canny(blurred, self.canny_threshold1, self.canny_threshold2,
+                          edges=self.workspace.get('canny', blurred.shape))
         return canny
     
     def process_frame(self, frame):
@@ -122,7 +132,8 @@ class WebcamEdgeDetector:
         
         # Convert single channel to BGR for consistent display
         if len(result.shape) == 2:
-            result = cv2.cvtColor(result, cv2.COLOR_GRAY2BGR)
+            result = cv2.cvtColor(result, cv2.COLOR_GRAY2BGR,
+                                  dst=self.workspace.get('display', frame.shape))
         
         return result
     
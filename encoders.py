@@ -0,0 +1,138 @@
+"""
+Result Image Encoders
+Configurable JPEG, PNG and WebP encoding, with a lossless fast path for
+binary edge masks
+"""
+
+import cv2
+
+
+# Output format -> file extension (which also selects the OpenCV encoder)
+FORMATS = {
+    'jpg': '.jpg',
+    'jpeg': '.jpg',
+    'png': '.png',
+    'webp': '.webp',
+}
+
+MIMETYPES = {
+    '.jpg': 'image/jpeg',
+    '.png': 'image/png',
+    '.webp': 'image/webp',
+}
+
+# Outputs that only hold 0 and 255. JPEG blurs them into gray ringing that
+# breaks downstream thresholding, while a 1-bit PNG at low compression is
+# lossless, several times smaller and about as fast to encode.
+MASK_OUTPUTS = ('canny',)
+
+
+class ImageEncoder:
+    """
+    Encoding settings for result images.
+    
+    Continuous-tone outputs use the configured format; binary masks use
+    mask_format, which defaults to 1-bit PNG.
+    """
+    
+    def __init__(self, format='jpg', quality=95, optimize=False, png_compression=3,
+                 mask_format='png'):
+        """
+        Initialize the encoder.
+        
+        Args:
+            format (str): 'jpg', 'png' or 'webp' (see FORMATS)
+            quality (int): JPEG quality 0-100, or WebP quality 1-100 (above
+                           100 selects lossless WebP)
+            optimize (bool): Optimize JPEG Huffman tables (smaller, slower)
+            png_compression (int): zlib level 0-9 for continuous-tone PNG
+            mask_format (str): Format for binary masks; None uses format
+        """
+        for value in (format, mask_format or format):
+            if value not in FORMATS:
+                raise ValueError(f"Unknown output format: {value}. "
+                                 f"Available: {', '.join(FORMATS)}")
+        if not 0 <= png_compression <= 9:
+            raise ValueError("png_compression must be between 0 and 9")
+        
+        self.format = format
+        self.quality = quality
+        self.optimize = optimize
+        self.png_compression = png_compression
+        self.mask_format = mask_format or format
+    
+    @classmethod
+    def from_config(cls, config=None):
+        """
+        Create an encoder from the 'output' section of config.yaml.
+        
+        Args:
+            config (ConfigManager): Configuration; defaults to the shared instance
+        
+        Returns:
+            ImageEncoder: Encoder with the configured settings
+        """
+        if config is None:
+            from config_manager import ConfigManager
+            config = ConfigManager()
+        
+        settings = config.get_output_config()
+        return cls(format=settings['format'], quality=settings['quality'],
+                   optimize=settings['optimize'], png_compression=settings['png_compression'],
+                   mask_format=settings['mask_format'])
+    
+    def extension(self, name=None):
+        """
+        File extension for an output.
+        
+        Args:
+            name (str): Output name (see OUTPUTS); masks may use another format
+        
+        Returns:
+            str: Extension including the dot, e.g. '.jpg'
+        """
+        return FORMATS[self.mask_format if name in MASK_OUTPUTS else self.format]
+    
+    def mimetype(self, name=None):
+        """MIME type of an encoded output."""
+        return MIMETYPES[self.extension(name)]
+    
+    def params(self, name=None):
+        """
+        cv2.imencode parameters for an output.
+        
+        Args:
+            name (str): Output name (see OUTPUTS)
+        
+        Returns:
+            list: Flat [flag, value, ...] list
+        """
+        extension = self.extension(name)
+        mask = name in MASK_OUTPUTS
+        
+        if extension == '.jpg':
+            return [cv2.IMWRITE_JPEG_QUALITY, self.quality,
+                    cv2.IMWRITE_JPEG_OPTIMIZE, int(self.optimize)]
+        if extension == '.png':
+            if mask:
+                # 1 bit per pixel; level 1 is the knee of the size/time curve
+                return [cv2.IMWRITE_PNG_BILEVEL, 1, cv2.IMWRITE_PNG_COMPRESSION, 1]
+            return [cv2.IMWRITE_PNG_COMPRESSION, self.png_compression]
+        # Masks stay exact in WebP only when lossless
+        return [cv2.IMWRITE_WEBP_QUALITY, 101 if mask else self.quality]
+    
+    def encode(self, image, name=None):
+        """
+        Encode an output image.
+        
+        Args:
+            image (numpy.ndarray): Image to encode
+            name (str): Output name (see OUTPUTS)
+        
+        Returns:
+            numpy.ndarray: Encoded bytes
+        """
+        ok, encoded = cv2.imencode(self.extension(name), image, self.params(name))
+        if not ok:
+            raise ValueError(f"Could not encode {name or 'image'} as {self.extension(name)}")
+        return encoded
@@ -130,7 +130,6 @@ def example_comparison():
         return
     
     import matplotlib.pyplot as plt
-    import cv2
     
     detector = EdgeDetector('input/sample1.png')
     detector.preprocess()
@@ -143,6 +142,9 @@ def example_comparison():
         (150, 250, "Very High Thresholds")
     ]
     
+    # Gradients and non-maximum suppression are shared by all settings
+    masks, densities = detector.canny_sweep([(t1, t2) for t1, t2, _ in threshold_configs])
+    
     fig, axes = plt.subplots(2, 2, figsize=(12, 10))
     fig.suptitle('Canny Edge Detection - Threshold Comparison', 
                  fontsize=14, fontweight='bold')
@@ -151,12 +153,10 @@ def example_comparison():
         row = idx // 2
         col = idx % 2
         
-        # Apply Canny with specific thresholds
-        canny = cv2.Canny(detector.blurred_image, t1, t2)
-        
         # Display
-        axes[row, col].imshow(canny, cmap='gray')
-        axes[row, col].set_title(f'{title}\n({t1}, {t2})', fontweight='bold')
+        axes[row, col].imshow(masks[idx], cmap='gray')
+        axes[row, col].set_title(f'{title}\n({t1}, {t2}), density {densities[idx]:.1%}',
+                                 fontweight='bold')
         axes[row, col].axis('off')
     
     plt.tight_layout()
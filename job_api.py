@@ -0,0 +1,183 @@
+"""
+Asynchronous Job API
+The /api/jobs endpoints shared by app.py and website.py, as a Flask blueprint
+"""
+
+import base64
+
+from flask import Blueprint, Response, current_app, jsonify, request, url_for
+from werkzeug.utils import secure_filename
+
+from responses import select_layers, detection_params
+from result_cache import detect_encoded
+
+
+def job_handler(encoder, cache=None, workers=1):
+    """
+    Handler that processes one upload of an asynchronous job (see JobRunner).
+    
+    Args:
+        encoder (ImageEncoder): Encodes each result layer
+        cache (ResultCache): Cache shared with the synchronous endpoints
+        workers (int): Threads for tiling large images
+    
+    Returns:
+        callable: handler(data, filename, settings) -> (layers, details)
+    """
+    def run_job_upload(data, filename, settings):
+        params = dict(settings['params'])
+        # JSON has no tuples
+        params['blur_kernel_size'] = tuple(params['blur_kernel_size'])
+        encoded, details, _ = detect_encoded(data, settings['layers'], encoder, cache,
+                                             name=filename, decode=settings['decode'],
+                                             workers=workers, **params)
+        return encoded, details
+    
+    return run_job_upload
+
+
+def register_job_api(app, jobs, runner, encoder, layers, default_layers, allowed_extensions,
+                     logger):
+    """
+    Add the asynchronous job endpoints to an app.
+    
+    The store and runner are kept in app.extensions['jobs'] ('store' and
+    'runner'), where the endpoints look them up on each request.
+    
+    Args:
+        app (flask.Flask): The application
+        jobs (JobStore): Where jobs and their results are kept
+        runner (JobRunner): This server worker's runner; started on the first
+                            job request
+        encoder (ImageEncoder): Gives the MIME type of raw result layers
+        layers (tuple): Layer names a job can ask for
+        default_layers (tuple): Layers computed when 'outputs' is not given
+        allowed_extensions (set): Accepted upload file extensions
+        logger (logging.Logger): Request log
+    """
+    app.extensions['jobs'] = {'store': jobs, 'runner': runner}
+    app.register_blueprint(_job_blueprint(encoder, layers, default_layers, allowed_extensions,
+                                          logger))
+
+
+def _job_blueprint(encoder, layers, default_layers, allowed_extensions, logger):
+    """Blueprint with the job endpoints (see register_job_api)."""
+    blueprint = Blueprint('jobs', __name__)
+    
+    def store():
+        return current_app.extensions['jobs']['store']
+    
+    def start_runner():
+        current_app.extensions['jobs']['runner'].start()
+    
+    def allowed_file(filename):
+        return '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_extensions
+    
+    def job_status(job_id):
+        """Job status with the URLs of its status and results."""
+        status = store().status(job_id)
+        if status is not None:
+            status['status_url'] = url_for('jobs.get_job', job_id=job_id)
+            status['results_url'] = url_for('jobs.get_job_results', job_id=job_id)
+        return status
+    
+    @blueprint.route('/api/jobs', methods=['POST'])
+    def create_job():
+        """
+        Submit images for asynchronous edge detection.
+        
+        Accepts: multipart/form-data with one or more 'images' (or 'image')
+                 files, optional 'outputs' and the /api/detect parameters
+        Returns: 202 with the job status right away; the images are processed
+                 by background workers. Poll status_url, then fetch results_url
+        """
+        try:
+            files = [file for key in ('images', 'image') for file in request.files.getlist(key)
+                     if file and file.filename]
+            if not files:
+                return jsonify({'error': 'No images provided'}), 400
+            rejected = [file.filename for file in files if not allowed_file(file.filename)]
+            if rejected:
+                return jsonify({'error': f'File type not allowed: {", ".join(rejected)}. '
+                                         f'Allowed: {allowed_extensions}'}), 400
+            
+            try:
+                selected = select_layers(request.values.get('outputs'), layers, default_layers)
+                params = detection_params(request.form, selected)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            decode = params.pop('decode')
+            
+            job_id = store().create([(secure_filename(file.filename), file.read())
+                                     for file in files],
+                                    {'layers': list(selected), 'decode': decode, 'params': params})
+            start_runner()
+            logger.info(f"Queued job {job_id} with {len(files)} image(s)")
+            
+            status = job_status(job_id)
+            return jsonify(status), 202, {'Location': status['status_url']}
+        
+        except Exception as e:
+            logger.error(f"Error creating job: {str(e)}", exc_info=True)
+            return jsonify({'error': str(e)}), 500
+    
+    @blueprint.route('/api/jobs/<job_id>', methods=['GET'])
+    def get_job(job_id):
+        """
+        Status of an asynchronous job.
+        
+        Returns: JSON with 'state' (queued, running, done or failed), 'total',
+                 'completed', 'failed' and 'progress' (0-1), and when the
+                 results expire
+        """
+        # Resumes jobs left by a worker that exited, if this one has no runner yet
+        start_runner()
+        status = job_status(job_id)
+        if status is None:
+            return jsonify({'error': 'Job not found or expired'}), 404
+        return jsonify(status)
+    
+    @blueprint.route('/api/jobs/<job_id>/results', methods=['GET'])
+    def get_job_results(job_id):
+        """
+        Results of a finished asynchronous job.
+        
+        Returns: JSON with the job status and, per image, 'status', base64
+                 encoded 'results', 'canny_thresholds' and 'timings_ms' (or
+                 'error'); 409 while the job is still queued or running
+        """
+        status = job_status(job_id)
+        if status is None:
+            return jsonify({'error': 'Job not found or expired'}), 404
+        if status['state'] in ('queued', 'running'):
+            return jsonify(dict(status, error='Job not finished')), 409
+        
+        results = []
+        jobs = store()
+        for entry in jobs.results(job_id):
+            result = {'index': entry['index'], 'filename': entry['filename']}
+            if entry['state'] == 'done':
+                details = entry['details']
+                threshold1, threshold2 = details['canny_thresholds'] or (None, None)
+                result.update(
+                    status='success', timings_ms=details['timings_ms'],
+                    canny_thresholds={'threshold1': threshold1, 'threshold2': threshold2},
+                    results={name: base64.b64encode(
+                        jobs.read_layer(job_id, entry['index'], name)).decode('utf-8')
+                        for name in entry['layers']})
+            else:
+                result.update(status='error', error=entry['error'] or 'Not processed')
+            results.append(result)
+        
+        return jsonify({'job': status, 'results': results})
+    
+    @blueprint.route('/api/jobs/<job_id>/results/<int:index>/<layer>', methods=['GET'])
+    def get_job_layer(job_id, index, layer):
+        """One result layer of a job's image, as a raw encoded image."""
+        try:
+            data = store().read_layer(job_id, index, layer)
+        except (KeyError, OSError):
+            return jsonify({'error': 'Result not found or expired'}), 404
+        return Response(data, mimetype=encoder.mimetype(layer))
+    
+    return blueprint
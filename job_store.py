@@ -0,0 +1,552 @@
+"""
+Job Store
+Asynchronous detection jobs: a local SQLite store for job state, with the
+uploads and encoded results on disk, and a background worker pool
+"""
+
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from batch_queue import worker_id
+
+
+JOB_STATES = ('queued', 'running', 'done', 'failed')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    state TEXT NOT NULL DEFAULT 'queued',
+    settings TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    error TEXT,
+    owner TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS files (
+    job TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    error TEXT,
+    details TEXT,
+    layers TEXT,
+    PRIMARY KEY (job, idx)
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created);
+"""
+
+
+class JobStore:
+    """
+    Persistent state of asynchronous jobs.
+    
+    A job is a list of uploads processed with one set of settings. Job and
+    per-file state live in <folder>/jobs.sqlite; each job's uploads and
+    encoded result layers live in <folder>/<job id>/. Everything survives
+    a restart of the processes serving the API.
+    
+    A worker claims a job with a lease and renews it while it works (see
+    keep_alive). If the worker dies, the lease expires and another worker
+    claims the job, skipping the files already finished. A job claimed
+    max_attempts times fails instead of looping. Finished jobs and their
+    files are deleted retention_seconds after they finish (see expire).
+    
+    Uses SQLite's rollback journal like WorkQueue, so the folder may be on
+    a volume shared by several hosts. Safe to use from several threads.
+    """
+    
+    def __init__(self, folder, retention_seconds=86400, lease_seconds=60, max_attempts=3,
+                 timeout=60):
+        """
+        Open (or create) a store.
+        
+        Args:
+            folder (str): Folder for the database and the job files
+            retention_seconds (float): How long results are kept after a job finishes
+            lease_seconds (float): How long a claim lasts without renewal
+            max_attempts (int): Claims of a job before it is given up
+            timeout (float): Seconds to wait for another process's transaction
+        """
+        if retention_seconds <= 0 or lease_seconds <= 0:
+            raise ValueError("retention_seconds and lease_seconds must be positive")
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+        
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.retention_seconds = retention_seconds
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(folder, 'jobs.sqlite'), timeout=timeout,
+                                   isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=DELETE")
+        # executescript() would commit the transaction it runs in
+        with self._transaction() as db:
+            for statement in _SCHEMA.split(';'):
+                if statement.strip():
+                    db.execute(statement)
+    
+    @classmethod
+    def from_config(cls, config=None, folder='results'):
+        """
+        Create a store from the 'jobs' section of config.yaml.
+        
+        Args:
+            config (ConfigManager): Configuration; defaults to the shared instance
+            folder (str): Results folder; jobs go in its 'jobs' subfolder
+        
+        Returns:
+            JobStore: The store
+        """
+        if config is None:
+            from config_manager import ConfigManager
+            config = ConfigManager()
+        
+        settings = config.get_jobs_config()
+        return cls(os.path.join(folder, 'jobs'), retention_seconds=settings['retention_seconds'],
+                   lease_seconds=settings['lease_seconds'])
+    
+    @contextmanager
+    def _transaction(self):
+        """Run statements in one write transaction, taking the file lock up front."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+    
+    def _job_folder(self, job_id):
+        return os.path.join(self.folder, job_id)
+    
+    def _upload_path(self, job_id, index):
+        return os.path.join(self._job_folder(job_id), f"upload_{index}")
+    
+    # Submitting and reading jobs
+    
+    def create(self, uploads, settings):
+        """
+        Queue a job.
+        
+        Args:
+            uploads (list): (filename, bytes) pairs
+            settings (dict): JSON-serializable settings passed to the handler
+        
+        Returns:
+            str: Job ID
+        """
+        if not uploads:
+            raise ValueError("A job needs at least one upload")
+        
+        job_id = uuid.uuid4().hex
+        os.makedirs(self._job_folder(job_id))
+        # Uploads are written before the job exists, so workers never see it half-made
+        for index, (_, data) in enumerate(uploads):
+            with open(self._upload_path(job_id, index), 'wb') as stream:
+                stream.write(data)
+        
+        with self._transaction() as db:
+            db.execute("INSERT INTO jobs (id, settings, total, created) VALUES (?, ?, ?, ?)",
+                       (job_id, json.dumps(settings), len(uploads), time.time()))
+            db.executemany("INSERT INTO files (job, idx, filename) VALUES (?, ?, ?)",
+                           [(job_id, index, filename)
+                            for index, (filename, _) in enumerate(uploads)])
+        return job_id
+    
+    def status(self, job_id):
+        """
+        State and progress of a job.
+        
+        Args:
+            job_id (str): Job ID
+        
+        Returns:
+            dict: 'id', 'state' (see JOB_STATES), 'total', 'completed',
+                  'failed' and 'progress' (0-1) of its files, 'error', and
+                  'created', 'started', 'finished' and 'expires' times; or
+                  None if there is no such job (or it has expired)
+        """
+        with self._lock:
+            job = self._db.execute(
+                "SELECT state, total, error, created, started, finished FROM jobs WHERE id = ?",
+                (job_id,)).fetchone()
+            if job is None:
+                return None
+            counts = dict(self._db.execute(
+                "SELECT state, COUNT(*) FROM files WHERE job = ? GROUP BY state",
+                (job_id,)).fetchall())
+        
+        state, total, error, created, started, finished = job
+        if self._expired(finished):
+            return None  # Not deleted by expire() yet
+        completed = counts.get('done', 0) + counts.get('failed', 0)
+        return {
+            'id': job_id,
+            'state': state,
+            'total': total,
+            'completed': completed,
+            'failed': counts.get('failed', 0),
+            'progress': round(completed / total, 4),
+            'error': error,
+            'created': created,
+            'started': started,
+            'finished': finished,
+            'expires': finished + self.retention_seconds if finished is not None else None
+        }
+    
+    def _expired(self, finished):
+        """Whether a job that finished at this time is past its retention period."""
+        return finished is not None and finished < time.time() - self.retention_seconds
+    
+    def results(self, job_id):
+        """
+        Per-file results of a job.
+        
+        Args:
+            job_id (str): Job ID
+        
+        Returns:
+            list: One dict per upload, in upload order: 'index', 'filename',
+                  'state' ('pending', 'done' or 'failed'), 'error',
+                  'details' (dict from the handler) and 'layers' (names of
+                  the stored layers; see read_layer); empty if there is no
+                  such job (or it has expired)
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT idx, filename, files.state, files.error, details, layers FROM files "
+                "JOIN jobs ON jobs.id = files.job WHERE job = ? "
+                "AND (finished IS NULL OR finished >= ?) ORDER BY idx",
+                (job_id, time.time() - self.retention_seconds)).fetchall()
+        return [{'index': index, 'filename': filename, 'state': state, 'error': error,
+                 'details': json.loads(details) if details else None,
+                 'layers': json.loads(layers) if layers else []}
+                for index, filename, state, error, details, layers in rows]
+    
+    def read_layer(self, job_id, index, name):
+        """
+        Encoded bytes of one result layer.
+        
+        Args:
+            job_id (str): Job ID
+            index (int): Upload index
+            name (str): Layer name
+        
+        Returns:
+            bytes: The encoded layer
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT layers FROM files JOIN jobs ON jobs.id = files.job "
+                "WHERE job = ? AND idx = ? AND (finished IS NULL OR finished >= ?)",
+                (job_id, index, time.time() - self.retention_seconds)).fetchone()
+        if row is None or name not in json.loads(row[0] or '[]'):
+            raise KeyError(f"No layer '{name}' for upload {index} of job {job_id}")
+        with open(os.path.join(self._job_folder(job_id), f"{index}_{name}"), 'rb') as stream:
+            return stream.read()
+    
+    # Claiming and running jobs
+    
+    def claim(self, owner):
+        """
+        Lease the oldest queued job, or one whose worker stopped renewing.
+        
+        Args:
+            owner (str): This worker's ID
+        
+        Returns:
+            tuple: (job_id, settings), or None if no job is available
+        """
+        while True:
+            now = time.time()
+            with self._transaction() as db:
+                row = db.execute(
+                    "SELECT id, settings, attempts FROM jobs WHERE state = 'queued' "
+                    "OR (state = 'running' AND lease_until < ?) ORDER BY created LIMIT 1",
+                    (now,)).fetchone()
+                if row is None:
+                    return None
+                job_id, settings, attempts = row
+                if attempts >= self.max_attempts:
+                    self._finish(db, job_id, 'failed', f"Abandoned after {attempts} attempts")
+                    continue
+                db.execute("UPDATE jobs SET state = 'running', owner = ?, lease_until = ?, "
+                           "attempts = attempts + 1, started = COALESCE(started, ?) WHERE id = ?",
+                           (owner, now + self.lease_seconds, now, job_id))
+                return job_id, json.loads(settings)
+    
+    def renew(self, job_id, owner):
+        """
+        Extend this worker's lease on a job.
+        
+        Returns:
+            bool: False if the job is no longer this worker's
+        """
+        with self._transaction() as db:
+            return db.execute("UPDATE jobs SET lease_until = ? WHERE id = ? AND owner = ? "
+                              "AND state = 'running'",
+                              (time.time() + self.lease_seconds, job_id, owner)).rowcount > 0
+    
+    @contextmanager
+    def keep_alive(self, job_id, owner, interval=None):
+        """
+        Renew this worker's lease on a job in a background thread.
+        
+        Args:
+            job_id (str): Job ID
+            owner (str): This worker's ID
+            interval (float): Seconds between renewals; a third of the lease by default
+        """
+        stop = threading.Event()
+        
+        def renew():
+            while not stop.wait(interval or self.lease_seconds / 3):
+                try:
+                    self.renew(job_id, owner)
+                except sqlite3.Error:
+                    pass  # Retried at the next interval; the lease has slack
+        
+        thread = threading.Thread(target=renew, name='job-lease-renewal', daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+    
+    def pending(self, job_id):
+        """
+        Uploads of a job that have no result yet.
+        
+        Returns:
+            list: (index, filename, path of the upload) tuples
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT idx, filename FROM files WHERE job = ? "
+                                    "AND state = 'pending' ORDER BY idx", (job_id,)).fetchall()
+        return [(index, filename, self._upload_path(job_id, index)) for index, filename in rows]
+    
+    def finish_file(self, job_id, index, owner, layers=None, details=None, error=None):
+        """
+        Record the result of one upload.
+        
+        Args:
+            job_id (str): Job ID
+            index (int): Upload index
+            owner (str): This worker's ID
+            layers (dict): Layer name -> encoded bytes
+            details (dict): JSON-serializable details of the result
+            error (str): Error message if the upload failed
+        
+        Returns:
+            bool: False if the job is no longer this worker's (nothing is recorded)
+        """
+        folder = self._job_folder(job_id)
+        layers = layers or {}
+        for name, data in layers.items():
+            with open(os.path.join(folder, f"{index}_{name}"), 'wb') as stream:
+                stream.write(data)
+        
+        with self._transaction() as db:
+            if not db.execute("SELECT 1 FROM jobs WHERE id = ? AND owner = ? AND state = 'running'",
+                              (job_id, owner)).fetchone():
+                return False
+            db.execute("UPDATE files SET state = ?, error = ?, details = ?, layers = ? "
+                       "WHERE job = ? AND idx = ?",
+                       ('failed' if error else 'done', error, json.dumps(details),
+                        json.dumps(list(layers)), job_id, index))
+        try:
+            os.remove(self._upload_path(job_id, index))
+        except OSError:
+            pass
+        return True
+    
+    def complete(self, job_id, owner, error=None):
+        """
+        Mark a job finished, which starts its retention period.
+        
+        Args:
+            job_id (str): Job ID
+            owner (str): This worker's ID
+            error (str): Error message if the job as a whole failed
+        """
+        with self._transaction() as db:
+            if db.execute("SELECT 1 FROM jobs WHERE id = ? AND owner = ?",
+                          (job_id, owner)).fetchone():
+                self._finish(db, job_id, 'failed' if error else 'done', error)
+    
+    @staticmethod
+    def _finish(db, job_id, state, error):
+        db.execute("UPDATE jobs SET state = ?, error = ?, finished = ?, lease_until = NULL "
+                   "WHERE id = ?", (state, error, time.time(), job_id))
+    
+    # Retention
+    
+    def expire(self):
+        """
+        Delete jobs that finished more than retention_seconds ago, with their files.
+        
+        Returns:
+            int: Number of jobs deleted
+        """
+        cutoff = time.time() - self.retention_seconds
+        with self._transaction() as db:
+            expired = [job_id for (job_id,) in db.execute(
+                "SELECT id FROM jobs WHERE finished < ?", (cutoff,)).fetchall()]
+            for job_id in expired:
+                db.execute("DELETE FROM files WHERE job = ?", (job_id,))
+                db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        for job_id in expired:
+            shutil.rmtree(self._job_folder(job_id), ignore_errors=True)
+        return len(expired)
+    
+    def close(self):
+        """Close the database."""
+        with self._lock:
+            self._db.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+class JobRunner:
+    """
+    Background threads that claim jobs from a JobStore and run each upload
+    through a handler.
+    
+    Every process serving the API can run one; jobs are shared between
+    them through the store, so a job left by a process that exited is
+    picked up by another one once its lease expires.
+    """
+    
+    def __init__(self, store, handler, workers=2, poll=1.0, expire_interval=60, logger=None):
+        """
+        Initialize the runner.
+        
+        Args:
+            store (JobStore): Store to take jobs from
+            handler (callable): handler(data, filename, settings) returning
+                                (layers, details): layer name -> encoded
+                                bytes, and a JSON-serializable dict
+            workers (int): Jobs processed at once
+            poll (float): Seconds between looks for new jobs when idle
+            expire_interval (float): Seconds between deletions of expired jobs
+            logger (logging.Logger): Where failed jobs are logged
+        """
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self.poll = poll
+        self.expire_interval = expire_interval
+        self.logger = logger or logging.getLogger(__name__)
+        self._stop = threading.Event()
+        self._threads = []
+        self._expired_at = 0.0
+        self._lock = threading.Lock()
+    
+    def start(self):
+        """Start the worker threads, unless they are running already."""
+        with self._lock:
+            if self._threads:
+                return
+            self._stop.clear()
+            self._threads = [threading.Thread(target=self._work, args=(f"{worker_id()}:{i}",),
+                                              name=f'job-worker-{i}', daemon=True)
+                             for i in range(self.workers)]
+            for thread in self._threads:
+                thread.start()
+    
+    def stop(self):
+        """Stop the worker threads after their current upload."""
+        self._stop.set()
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join()
+    
+    def _work(self, owner):
+        while not self._stop.is_set():
+            try:
+                self._expire()
+                claimed = self.store.claim(owner)
+            except sqlite3.Error:
+                claimed = None  # Store busy; try again after the poll interval
+            if claimed is None:
+                self._stop.wait(self.poll)
+                continue
+            job_id = claimed[0]
+            try:
+                self.run(*claimed, owner)
+            except sqlite3.Error as e:
+                # Store busy; another attempt is made once the lease expires
+                self.logger.warning(f"Job {job_id} interrupted: {e}")
+            except Exception as e:
+                # Keep this worker alive for the other jobs
+                self.logger.error(f"Job {job_id} failed: {e}", exc_info=True)
+                try:
+                    self.store.complete(job_id, owner, error=str(e))
+                except sqlite3.Error:
+                    pass  # Left for another attempt once the lease expires
+    
+    def _expire(self):
+        with self._lock:
+            due = time.time() - self._expired_at >= self.expire_interval
+            if due:
+                self._expired_at = time.time()
+        if due:
+            self.store.expire()
+    
+    def run(self, job_id, settings, owner):
+        """
+        Process the pending uploads of a claimed job, then complete it.
+        
+        An upload that fails, or whose results cannot be stored, is recorded
+        as failed; the job carries on.
+        
+        Args:
+            job_id (str): Job ID from JobStore.claim()
+            settings (dict): The job's settings
+            owner (str): This worker's ID
+        """
+        with self.store.keep_alive(job_id, owner):
+            for index, filename, path in self.store.pending(job_id):
+                if self._stop.is_set():
+                    return  # Another worker resumes the job when the lease expires
+                try:
+                    with open(path, 'rb') as stream:
+                        data = stream.read()
+                    layers, details = self.handler(data, filename, settings)
+                except Exception as e:
+                    layers, details, error = None, None, str(e)
+                else:
+                    error = None
+                try:
+                    recorded = self.store.finish_file(job_id, index, owner, layers, details,
+                                                      error)
+                except OSError as e:
+                    # Results not written, e.g. the disk is full
+                    recorded = self.store.finish_file(job_id, index, owner,
+                                                      error=f"Could not store results: {e}")
+                if not recorded:
+                    return  # Lease lost to another worker
+            self.store.complete(job_id, owner)
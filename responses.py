@@ -0,0 +1,298 @@
+"""
+API Response Formats
+Return encoded result images as JSON with base64, multipart/mixed, a zip
+stream or a single raw image, chosen by ?format= or the Accept header
+"""
+
+import json
+import uuid
+import zipfile
+
+from flask import Response
+
+from edge_detection import AUTO_THRESHOLDS, DECODE_MODES
+
+
+RESPONSE_FORMATS = ('json', 'multipart', 'zip', 'image')
+
+# Accept header MIME type -> response format (see negotiate_format)
+_ACCEPTED = {
+    'application/json': 'json',
+    'multipart/mixed': 'multipart',
+    'application/zip': 'zip',
+    'image/png': 'image',
+    'image/jpeg': 'image',
+    'image/webp': 'image',
+}
+
+
+def negotiate_format(requested=None, accept=None):
+    """
+    Choose the response format.
+    
+    Args:
+        requested (str): Value of the 'format' parameter, which takes precedence
+        accept (werkzeug.datastructures.MIMEAccept): The request's Accept header
+    
+    Returns:
+        str: One of RESPONSE_FORMATS; 'json' unless asked for otherwise
+    
+    A binary format is only chosen from the Accept header when the header
+    names its MIME type exactly, at a higher quality than application/json,
+    and has no wildcards. Browser-style headers (e.g. 'text/html,...,
+    image/webp,*/*;q=0.8') therefore still get JSON.
+    """
+    if requested:
+        if requested not in RESPONSE_FORMATS:
+            raise ValueError(f"Unknown response format: {requested}. "
+                             f"Available: {', '.join(RESPONSE_FORMATS)}")
+        return requested
+    
+    if accept is None or any('*' in value for value, _ in accept):
+        return 'json'
+    qualities = {value: quality for value, quality in accept if value in _ACCEPTED}
+    json_quality = qualities.get('application/json', 0)
+    best = max(qualities, key=qualities.get, default=None)
+    if best is None or qualities[best] <= json_quality:
+        return 'json'
+    return _ACCEPTED[best]
+
+
+def _part_filename(name, extension):
+    return f"{name}{extension}"
+
+
+def _encoded(encoder, image, name):
+    """Encoded bytes of an output; images already encoded (bytes) pass through."""
+    if isinstance(image, bytes):
+        return image
+    return encoder.encode(image, name).tobytes()
+
+
+def multipart_response(images, metadata, encoder):
+    """
+    Stream images as multipart/mixed: a JSON part with the metadata, then
+    one raw image part per output.
+    
+    Each image is encoded just before its part is sent, so at most one
+    encoded image is held at a time.
+    
+    Args:
+        images (dict): Output name -> image or encoded bytes, in response order
+        metadata (dict): JSON-serializable details (thresholds, timings, ...)
+        encoder (ImageEncoder): Encodes each output
+    
+    Returns:
+        flask.Response: Streaming response
+    """
+    boundary = uuid.uuid4().hex
+    
+    def generate():
+        yield (f"--{boundary}\r\nContent-Type: application/json\r\n"
+               f"Content-Disposition: inline; name=\"metadata\"\r\n\r\n").encode()
+        yield json.dumps(metadata).encode()
+        for name, image in images.items():
+            data = _encoded(encoder, image, name)
+            filename = _part_filename(name, encoder.extension(name))
+            yield (f"\r\n--{boundary}\r\nContent-Type: {encoder.mimetype(name)}\r\n"
+                   f"Content-Disposition: inline; name=\"{name}\"; filename=\"{filename}\"\r\n"
+                   f"Content-Length: {len(data)}\r\n\r\n").encode()
+            yield data
+        yield f"\r\n--{boundary}--\r\n".encode()
+    
+    return Response(generate(), mimetype=f'multipart/mixed; boundary={boundary}')
+
+
+class _ChunkSink:
+    """Unseekable file for zipfile that hands written bytes to a generator."""
+    
+    def __init__(self):
+        self.chunks = []
+    
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def take(self):
+        """Return and forget everything written so far."""
+        chunks, self.chunks = self.chunks, []
+        return b''.join(chunks)
+
+
+def zip_response(images, metadata, encoder, filename='results.zip'):
+    """
+    Stream images as a zip archive with a metadata.json entry.
+    
+    Entries are stored, not deflated: the images are already compressed.
+    The archive is written as it is sent, one image at a time.
+    
+    Args:
+        images (dict): Output name -> image or encoded bytes
+        metadata (dict): JSON-serializable details (thresholds, timings, ...)
+        encoder (ImageEncoder): Encodes each output
+        filename (str): Download name of the archive
+    
+    Returns:
+        flask.Response: Streaming response
+    """
+    def generate():
+        sink = _ChunkSink()
+        with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+            archive.writestr('metadata.json', json.dumps(metadata, indent=2))
+            yield sink.take()
+            for name, image in images.items():
+                archive.writestr(_part_filename(name, encoder.extension(name)),
+                                 _encoded(encoder, image, name))
+                yield sink.take()
+        yield sink.take()
+    
+    return Response(generate(), mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
+def image_response(images, metadata, encoder):
+    """
+    Return a single output as a raw image.
+    
+    The metadata travels in the X-Edge-Metadata header as JSON.
+    
+    Args:
+        images (dict): Exactly one output name -> image or encoded bytes
+        metadata (dict): JSON-serializable details (thresholds, timings, ...)
+        encoder (ImageEncoder): Encodes the output
+    
+    Returns:
+        flask.Response: Image response
+    """
+    if len(images) != 1:
+        raise ValueError(f"A raw image response needs exactly one output, not {len(images)}; "
+                         f"choose one with outputs=")
+    (name, image), = images.items()
+    filename = _part_filename(name, encoder.extension(name))
+    return Response(_encoded(encoder, image, name), mimetype=encoder.mimetype(name),
+                    headers={'Content-Disposition': f'inline; filename="{filename}"',
+                             'X-Edge-Metadata': json.dumps(metadata)})
+
+
+def binary_response(format, images, metadata, encoder):
+    """
+    Build a 'multipart', 'zip' or 'image' response (see negotiate_format).
+    
+    Args:
+        format (str): Response format other than 'json'
+        images (dict): Output name -> image or encoded bytes
+        metadata (dict): JSON-serializable details (thresholds, timings, ...)
+        encoder (ImageEncoder): Encodes each output
+    
+    Returns:
+        flask.Response: The response
+    """
+    if format == 'multipart':
+        return multipart_response(images, metadata, encoder)
+    if format == 'zip':
+        return zip_response(images, metadata, encoder)
+    if format == 'image':
+        return image_response(images, metadata, encoder)
+    raise ValueError(f"Not a binary response format: {format}")
+
+
+def select_layers(requested, available, default=None):
+    """
+    Normalize the layers a client asked for.
+    
+    Args:
+        requested: None or a comma-separated string of layer names
+        available (tuple): Layer names in response order
+        default (tuple): Layers when none are requested; defaults to all available
+    
+    Returns:
+        tuple: Requested layer names in response order
+    """
+    if not requested:
+        return tuple(default if default is not None else available)
+    names = {name.strip() for name in requested.split(',') if name.strip()}
+    unknown = names - set(available)
+    if unknown:
+        raise ValueError(f"Unknown output(s): {', '.join(sorted(unknown))}. "
+                         f"Available: {', '.join(available)}")
+    if not names:
+        raise ValueError("At least one output must be requested")
+    return tuple(name for name in available if name in names)
+
+
+def form_choice(form, field, choices, default=None):
+    """
+    A form field that must be one of a fixed set of values.
+    
+    Args:
+        form: The request's form fields
+        field (str): Field name
+        choices: Allowed values
+        default: Value when the field is missing or empty
+    
+    Returns:
+        The field's value, or default
+    
+    Raises:
+        ValueError: If the value is not one of choices
+    """
+    value = form.get(field) or default
+    if value is not None and value not in choices:
+        raise ValueError(f"Unknown {field}: {value}. Available: {', '.join(choices)}")
+    return value
+
+
+def detection_params(form, layers=()):
+    """
+    Decode mode and processing parameters of a detection request.
+    
+    Args:
+        form: The request's form fields ('decode', 'blur_kernel',
+              'sobel_kernel', 'laplacian_kernel', 'canny_threshold1',
+              'canny_threshold2' and 'canny_auto'; all optional)
+        layers (tuple): Requested layers; edge maps only need the
+                        luminance, so the default decode is grayscale
+                        unless 'original' is among them
+    
+    Returns:
+        dict: Keyword arguments for result_cache.detect_encoded: 'decode'
+              and the EdgeDetector.compute() parameters
+    
+    Raises:
+        ValueError: If a numeric field is not an integer, decode is not
+                    one of DECODE_MODES or canny_auto not one of AUTO_THRESHOLDS
+    """
+    blur_size = int(form.get('blur_kernel', 5))
+    return {
+        'decode': form_choice(form, 'decode', DECODE_MODES,
+                              'color' if 'original' in layers else 'grayscale'),
+        'blur_kernel_size': (blur_size, blur_size),
+        'sigma': 1.4,
+        'sobel_kernel': int(form.get('sobel_kernel', 3)),
+        'laplacian_kernel': int(form.get('laplacian_kernel', 3)),
+        'canny_threshold1': int(form.get('canny_threshold1', 50)),
+        'canny_threshold2': int(form.get('canny_threshold2', 150)),
+        'canny_auto': form_choice(form, 'canny_auto', AUTO_THRESHOLDS)
+    }
+
+
+def compute_layers(detector, layers, **params):
+    """
+    Compute only the requested layers of an EdgeDetector.
+    
+    Args:
+        detector (EdgeDetector): Detector holding the decoded upload
+        layers (tuple): Layer names from select_layers; 'original' is the
+                        decoded upload itself
+        **params: Passed to EdgeDetector.compute()
+    
+    Returns:
+        dict: Layer name -> image, in the order of layers
+    """
+    outputs = [name for name in layers if name != 'original']
+    computed = detector.compute(outputs=outputs, **params) if outputs else {}
+    return {name: detector.original_image if name == 'original' else computed[name]
+            for name in layers}
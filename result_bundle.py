@@ -0,0 +1,141 @@
+"""
+Result Bundles
+Store every output layer of one image in a single .npz container
+"""
+
+import json
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+
+BUNDLE_EXTENSION = '.npz'
+BUNDLE_VERSION = 1
+
+# Zip member holding the JSON metadata header
+METADATA_KEY = '__metadata__'
+
+
+def write_bundle(path, images, metadata=None, encoder=None):
+    """
+    Write output layers and a metadata header to one bundle file.
+    
+    The bundle is an uncompressed zip (numpy .npz) with one member per
+    layer, so a reader can extract a single layer without touching the
+    others. Layers are stored encoded (e.g. 1-bit PNG for masks), as
+    the encoder would write them to separate files, or raw when encoder
+    is None.
+    
+    Args:
+        path (str): Output path, normally ending in BUNDLE_EXTENSION
+        images (dict): Layer name -> uint8 image
+        metadata (dict): Extra JSON-serializable header fields
+        encoder (ImageEncoder): Encoder for the layers; None stores raw arrays
+    
+    Returns:
+        dict: The metadata header that was written
+    """
+    header = dict(metadata or {}, version=BUNDLE_VERSION, layers={})
+    members = {}
+    for name, image in images.items():
+        if name == METADATA_KEY:
+            raise ValueError(f"Reserved layer name: {name}")
+        if encoder is None:
+            members[name] = np.ascontiguousarray(image)
+            encoding = 'raw'
+        else:
+            members[name] = encoder.encode(image, name)
+            encoding = encoder.extension(name)
+        header['layers'][name] = {'encoding': encoding, 'shape': list(image.shape),
+                                  'dtype': str(image.dtype)}
+    members[METADATA_KEY] = np.array(json.dumps(header))
+    
+    # A file object keeps numpy from appending '.npz' to the path
+    with open(path, 'wb') as stream:
+        np.savez(stream, **members)
+    return header
+
+
+class ResultBundle:
+    """
+    Read-only access to a bundle written by write_bundle.
+    
+    Opening a bundle reads only the zip directory and the metadata header;
+    each layer is read and decoded on first access.
+    """
+    
+    def __init__(self, path):
+        """
+        Open a bundle.
+        
+        Args:
+            path (str): Bundle file path
+        """
+        self.path = str(path)
+        if not Path(self.path).exists():
+            raise FileNotFoundError(f"Bundle not found: {self.path}")
+        
+        self._archive = np.load(self.path, allow_pickle=False)
+        if METADATA_KEY not in self._archive.files:
+            self._archive.close()
+            raise ValueError(f"Not a result bundle (no metadata header): {self.path}")
+        self.metadata = json.loads(self._archive[METADATA_KEY].item())
+    
+    @property
+    def layers(self):
+        """Names of the stored layers."""
+        return list(self.metadata['layers'])
+    
+    def __contains__(self, name):
+        return name in self.metadata['layers']
+    
+    def read(self, name):
+        """
+        Read and decode one layer.
+        
+        Args:
+            name (str): Layer name
+        
+        Returns:
+            numpy.ndarray: The layer image
+        """
+        if name not in self:
+            raise KeyError(f"Layer '{name}' not in {self.path}. Available: {', '.join(self.layers)}")
+        
+        data = self._archive[name]
+        if self.metadata['layers'][name]['encoding'] == 'raw':
+            return data
+        
+        flags = cv2.IMREAD_UNCHANGED if len(self.metadata['layers'][name]['shape']) == 3 \
+            else cv2.IMREAD_GRAYSCALE
+        image = cv2.imdecode(data, flags)
+        if image is None:
+            raise ValueError(f"Could not decode layer '{name}' of {self.path}")
+        return image
+    
+    def close(self):
+        """Close the underlying file."""
+        self._archive.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+def read_layer(path, name):
+    """
+    Read a single layer from a bundle without decoding the others.
+    
+    Args:
+        path (str): Bundle file path
+        name (str): Layer name
+    
+    Returns:
+        numpy.ndarray: The layer image
+    """
+    with ResultBundle(path) as bundle:
+        return bundle.read(name)
@@ -0,0 +1,381 @@
+"""
+Result Cache
+Content-addressed cache of encoded detection results, with an in-process
+LRU tier and an on-disk tier shared by every worker process
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from edge_detection import EdgeDetector, DEFAULT_PARAMS
+from batch_manifest import parameter_fingerprint
+
+
+# Subfolder of the results folder holding the disk tier
+CACHE_FOLDER = 'cache'
+CACHE_EXTENSION = '.bin'
+
+# Part of every key from detect_encoded; bump it when the details it stores change
+DETAILS_VERSION = 2
+
+
+def _pack(layers, metadata, created):
+    """Serialize an entry: 4-byte header length, JSON header, then the layers."""
+    header = json.dumps({'created': created, 'metadata': metadata,
+                         'layers': [[name, len(data)] for name, data in layers.items()]})
+    header = header.encode('utf-8')
+    return b''.join([len(header).to_bytes(4, 'big'), header, *layers.values()])
+
+
+def _unpack(blob):
+    """Inverse of _pack; returns (layers, metadata, created)."""
+    length = int.from_bytes(blob[:4], 'big')
+    header = json.loads(blob[4:4 + length])
+    layers = {}
+    offset = 4 + length
+    for name, size in header['layers']:
+        layers[name] = blob[offset:offset + size]
+        offset += size
+    if offset != len(blob):
+        raise ValueError("Truncated cache entry")
+    return layers, header['metadata'], header['created']
+
+
+class ResultCache:
+    """
+    Two-tier cache of encoded result layers.
+    
+    Entries are keyed by the SHA-256 of the upload plus a fingerprint of
+    everything that determines the result (see key()). The memory tier is
+    an LRU bounded in bytes; the disk tier keeps one file per entry under
+    <folder>/cache, written atomically, so every process serving the same
+    folder (e.g. gunicorn workers) shares it. Entries expire ttl_seconds
+    after they are created; the disk tier is trimmed to disk_bytes, least
+    recently used first. Safe to use from several threads.
+    
+    Hit, miss and eviction counters are per process; see stats().
+    """
+    
+    def __init__(self, folder='results', memory_bytes=64 << 20, disk_bytes=1 << 30,
+                 ttl_seconds=3600):
+        """
+        Initialize the cache.
+        
+        Args:
+            folder (str): Results folder; the disk tier goes in its 'cache' subfolder
+            memory_bytes (int): Memory tier size; 0 disables it
+            disk_bytes (int): Disk tier size; 0 disables it
+            ttl_seconds (float): Lifetime of an entry
+        """
+        if memory_bytes < 0 or disk_bytes < 0:
+            raise ValueError("Cache sizes cannot be negative")
+        if ttl_seconds <= 0:
+            raise ValueError("ttl_seconds must be positive")
+        
+        self.folder = os.path.join(folder, CACHE_FOLDER)
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.ttl_seconds = ttl_seconds
+        self._memory = OrderedDict()
+        self._memory_used = 0
+        self._written_since_trim = 0
+        self._lock = threading.Lock()
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0,
+                         'memory_evictions': 0, 'disk_evictions': 0, 'expired': 0}
+        if disk_bytes:
+            os.makedirs(self.folder, exist_ok=True)
+    
+    @classmethod
+    def from_config(cls, config=None, folder='results'):
+        """
+        Create a cache from the 'cache' section of config.yaml.
+        
+        Args:
+            config (ConfigManager): Configuration; defaults to the shared instance
+            folder (str): Results folder
+        
+        Returns:
+            ResultCache: The cache, or None if caching is disabled
+        """
+        if config is None:
+            from config_manager import ConfigManager
+            config = ConfigManager()
+        
+        settings = config.get_cache_config()
+        if not settings['enabled']:
+            return None
+        return cls(folder=folder, memory_bytes=int(settings['memory_mb'] * (1 << 20)),
+                   disk_bytes=int(settings['disk_mb'] * (1 << 20)),
+                   ttl_seconds=settings['ttl_seconds'])
+    
+    @staticmethod
+    def key(data, **settings):
+        """
+        Cache key of an upload processed with some settings.
+        
+        Args:
+            data (bytes): The uploaded file
+            **settings: JSON-serializable settings that determine the result,
+                        e.g. layers, decode mode, parameters and encoder settings
+        
+        Returns:
+            str: Hex key
+        """
+        return f"{hashlib.sha256(data).hexdigest()}-{parameter_fingerprint(**settings)}"
+    
+    def _path(self, key):
+        return os.path.join(self.folder, key[:2], key + CACHE_EXTENSION)
+    
+    def _count(self, counter, amount=1):
+        with self._lock:
+            self.counters[counter] += amount
+    
+    def get(self, key):
+        """
+        Look an entry up, in memory first, then on disk.
+        
+        Args:
+            key (str): Key from key()
+        
+        Returns:
+            tuple: (layers, metadata) with layers as name -> encoded bytes,
+                   or None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                layers, metadata, created, size = entry
+                if now - created <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.counters['memory_hits'] += 1
+                    return layers, metadata
+                del self._memory[key]
+                self._memory_used -= size
+                self.counters['expired'] += 1
+        
+        if self.disk_bytes:
+            path = self._path(key)
+            try:
+                with open(path, 'rb') as stream:
+                    blob = stream.read()
+                layers, metadata, created = _unpack(blob)
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError):
+                self._remove(path)  # Corrupt or half-written by a crashed process
+            else:
+                if now - created <= self.ttl_seconds:
+                    try:
+                        os.utime(path)  # Most recently used, for trimming
+                    except OSError:
+                        pass
+                    self._remember(key, layers, metadata, created, len(blob))
+                    self._count('disk_hits')
+                    return layers, metadata
+                self._remove(path)
+                self._count('expired')
+        
+        self._count('misses')
+        return None
+    
+    def put(self, key, layers, metadata=None):
+        """
+        Store an entry in both tiers.
+        
+        Args:
+            key (str): Key from key()
+            layers (dict): Layer name -> encoded bytes
+            metadata (dict): JSON-serializable details to return with the layers
+        """
+        metadata = dict(metadata or {})
+        created = time.time()
+        blob = _pack(layers, metadata, created)
+        self._remember(key, layers, metadata, created, len(blob))
+        self._count('stores')
+        
+        if not self.disk_bytes or len(blob) > self.disk_bytes:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write aside and rename, so other processes never read half an entry
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as stream:
+                stream.write(blob)
+            os.replace(temporary, path)
+        except OSError:
+            self._remove(temporary)
+            return
+        
+        with self._lock:
+            self._written_since_trim += len(blob)
+            trim = self._written_since_trim > self.disk_bytes // 16
+            if trim:
+                self._written_since_trim = 0
+        if trim:
+            self.trim()
+    
+    def _remember(self, key, layers, metadata, created, size):
+        """Add an entry to the memory tier, evicting least recently used ones."""
+        if size > self.memory_bytes:
+            return
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_used -= previous[3]
+            self._memory[key] = (layers, metadata, created, size)
+            self._memory_used += size
+            while self._memory_used > self.memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_used -= evicted[3]
+                self.counters['memory_evictions'] += 1
+    
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    
+    def _disk_entries(self):
+        """(path, size, mtime) of every disk entry."""
+        entries = []
+        try:
+            shards = list(os.scandir(self.folder))
+        except FileNotFoundError:
+            return entries
+        for shard in shards:
+            if not shard.is_dir():
+                continue
+            with os.scandir(shard.path) as scan:
+                for entry in scan:
+                    if entry.name.endswith(CACHE_EXTENSION):
+                        try:
+                            stat = entry.stat()
+                        except FileNotFoundError:
+                            continue  # Removed by another process
+                        entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+    
+    def trim(self):
+        """
+        Remove expired disk entries, then the least recently used ones
+        until the disk tier fits in disk_bytes.
+        
+        Returns:
+            int: Number of entries removed
+        """
+        now = time.time()
+        removed = 0
+        kept = []
+        # mtime is at least the creation time, so this only catches expired entries
+        for path, size, mtime in self._disk_entries():
+            if now - mtime > self.ttl_seconds:
+                self._remove(path)
+                removed += 1
+                self._count('expired')
+            else:
+                kept.append((mtime, size, path))
+        
+        used = sum(size for _, size, _ in kept)
+        for mtime, size, path in sorted(kept):
+            if used <= self.disk_bytes:
+                break
+            self._remove(path)
+            used -= size
+            removed += 1
+            self._count('disk_evictions')
+        return removed
+    
+    def clear(self):
+        """Remove every entry from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_used = 0
+        for path, _, _ in self._disk_entries():
+            self._remove(path)
+    
+    def stats(self):
+        """
+        Cache counters and sizes.
+        
+        Returns:
+            dict: This process's counters ('memory_hits', 'disk_hits',
+                  'misses', 'stores', 'memory_evictions', 'disk_evictions',
+                  'expired'), 'hit_rate', and the entries and bytes held in
+                  each tier (the disk tier is shared)
+        """
+        disk = self._disk_entries() if self.disk_bytes else []
+        with self._lock:
+            counters = dict(self.counters)
+            memory = {'entries': len(self._memory), 'bytes': self._memory_used,
+                      'limit_bytes': self.memory_bytes}
+        lookups = counters['memory_hits'] + counters['disk_hits'] + counters['misses']
+        hits = counters['memory_hits'] + counters['disk_hits']
+        return dict(counters, hit_rate=round(hits / lookups, 4) if lookups else None,
+                    pid=os.getpid(), ttl_seconds=self.ttl_seconds, memory=memory,
+                    disk={'entries': len(disk), 'bytes': sum(size for _, size, _ in disk),
+                          'limit_bytes': self.disk_bytes})
+
+
+def detect_encoded(data, layers, encoder, cache=None, name='image', decode='color', workers=1,
+                   **params):
+    """
+    Encoded result layers of an upload, from the cache when possible.
+    
+    On a miss the upload is decoded, only the requested layers are computed
+    (see responses.compute_layers) and encoded, and the result is stored.
+    
+    Args:
+        data (bytes): The uploaded file
+        layers (tuple): Layer names ('original' is the decoded upload)
+        encoder (ImageEncoder): Encodes each layer
+        cache (ResultCache): Cache to use; None always computes
+        name (str): Upload name, for error messages
+        decode (str): Decode mode (see DECODE_MODES)
+        workers (int): Threads for tiling large images
+        **params: Processing parameters (see DEFAULT_PARAMS)
+    
+    Returns:
+        tuple: (layers, details, cached): name -> encoded bytes; a dict
+               with 'canny_thresholds' ([low, high] or None), 'shape',
+               'edge_density' (layer -> fraction of nonzero pixels, for every
+               layer but 'original') and 'timings_ms' of the computation;
+               and whether it was a hit
+    """
+    from responses import compute_layers
+    
+    key = None
+    if cache is not None:
+        key = cache.key(data, layers=list(layers), decode=decode,
+                        params=dict(DEFAULT_PARAMS, **params), encoder=vars(encoder),
+                        details=DETAILS_VERSION)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached[0], cached[1], True
+    
+    detector = EdgeDetector.from_bytes(data, name=name, decode=decode, verbose=False)
+    images = compute_layers(detector, layers, workers=workers, **params)
+    with detector.timed('encode'):
+        encoded = {layer: encoder.encode(image, layer).tobytes()
+                   for layer, image in images.items()}
+    thresholds = detector.canny_thresholds
+    details = {
+        'canny_thresholds': [int(t) for t in thresholds] if thresholds is not None else None,
+        'shape': list(detector.original_image.shape),
+        # Computed here, as the cache only keeps the encoded layers
+        'edge_density': {layer: np.count_nonzero(image) / image.size
+                         for layer, image in images.items() if layer != 'original'},
+        'timings_ms': detector.timing_summary()
+    }
+    if cache is not None:
+        cache.put(key, encoded, details)
+    return encoded, details, False
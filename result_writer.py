@@ -0,0 +1,172 @@
+"""
+Background Result Writer
+Encode and write result images on a bounded thread pool, overlapping disk
+(or network share) I/O with the computation of the next image
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+
+
+class ResultWriter:
+    """
+    Asynchronous image writer with a bounded queue.
+    
+    cv2.imencode and file writes release the GIL, so several outputs are
+    encoded and written at once while the caller moves on. When max_pending
+    writes are in flight, submit() blocks until one finishes, which bounds
+    the memory held by queued images.
+    
+    Errors are collected as writes complete and raised by flush() or close().
+    """
+    
+    def __init__(self, max_workers=4, max_pending=None):
+        """
+        Start the writer threads.
+        
+        Args:
+            max_workers (int): Number of writer threads
+            max_pending (int): Writes queued or in flight before submit()
+                               blocks; defaults to twice max_workers
+        """
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='result-writer')
+        self._slots = threading.BoundedSemaphore(max_pending or 2 * max_workers)
+        # Guards the counters below; notified whenever a write completes
+        self._done = threading.Condition()
+        self._pending = 0
+        self._unreported = []
+        self._closed = False
+        
+        # Every (path, exception) that failed, kept for the writer's lifetime
+        self.failures = []
+        # Files and bytes written successfully
+        self.written = 0
+        self.bytes_written = 0
+    
+    def submit(self, path, image, params=None):
+        """
+        Queue an image to be encoded and written.
+        
+        The image must not be modified until the write has completed (copy
+        it first if it lives in a reused buffer, e.g. a Workspace).
+        
+        Args:
+            path (str): Output path; its extension selects the encoder
+            image (numpy.ndarray): Image to write
+            params (list): cv2.imencode parameters, e.g. [cv2.IMWRITE_JPEG_QUALITY, 95]
+        
+        Returns:
+            concurrent.futures.Future: Completes when the file is written
+        """
+        return self._submit(path, self._write, str(path), image, params)
+    
+    def submit_bundle(self, path, images, metadata=None, encoder=None):
+        """
+        Queue a result bundle to be encoded and written (see result_bundle.write_bundle).
+        
+        As with submit(), the images must not be modified until the write has completed.
+        
+        Args:
+            path (str): Bundle path
+            images (dict): Layer name -> image
+            metadata (dict): Extra header fields
+            encoder (ImageEncoder): Encoder for the layers; None stores raw arrays
+        
+        Returns:
+            concurrent.futures.Future: Completes when the bundle is written
+        """
+        return self._submit(path, self._write_bundle, str(path), images, metadata, encoder)
+    
+    def _submit(self, path, function, *args):
+        """Run function(*args) on a writer thread once a queue slot is free."""
+        if self._closed:
+            raise RuntimeError("ResultWriter is closed")
+        
+        self._slots.acquire()
+        with self._done:
+            self._pending += 1
+        try:
+            future = self._executor.submit(function, *args)
+        except BaseException:
+            self._finished(str(path), None)
+            raise
+        
+        future.add_done_callback(lambda done: self._finished(str(path), done))
+        return future
+    
+    @staticmethod
+    def _write(path, image, params):
+        """Encode and write one image on a writer thread; returns the bytes written."""
+        ok, encoded = cv2.imencode(Path(path).suffix, image, params or [])
+        if not ok:
+            raise ValueError(f"Could not encode {path}")
+        encoded.tofile(path)
+        return encoded.nbytes
+    
+    @staticmethod
+    def _write_bundle(path, images, metadata, encoder):
+        """Write one bundle on a writer thread; returns the bytes written."""
+        from result_bundle import write_bundle
+        write_bundle(path, images, metadata, encoder)
+        return os.path.getsize(path)
+    
+    def _finished(self, path, future):
+        """Release the queue slot and collect the outcome of a write (None if never queued)."""
+        self._slots.release()
+        error = None if future is None else future.exception()
+        with self._done:
+            self._pending -= 1
+            if error is not None:
+                self.failures.append((path, error))
+                self._unreported.append((path, error))
+            elif future is not None:
+                self.written += 1
+                self.bytes_written += future.result()
+            self._done.notify_all()
+    
+    def flush(self):
+        """
+        Wait for every queued write to finish.
+        
+        Raises:
+            RuntimeError: If writes failed since the last flush; the first
+                          failure is chained as the cause
+        """
+        with self._done:
+            self._done.wait_for(lambda: self._pending == 0)
+            errors, self._unreported = self._unreported, []
+        if errors:
+            path, error = errors[0]
+            raise RuntimeError(f"{len(errors)} write(s) failed, first {path}: {error}") from error
+    
+    def close(self):
+        """Flush pending writes and stop the writer threads."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown(wait=True)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Keep the original exception; still wait for queued writes
+            try:
+                self.close()
+            except RuntimeError:
+                pass
+        return False
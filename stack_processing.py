@@ -0,0 +1,216 @@
+"""
+Stack Processing for Edge Detection
+Process bursts of identically sized images as one (N, H, W) array
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from edge_detection import EdgeDetector, CANNY_APERTURE, PRECISIONS
+
+
+class StackDetector(EdgeDetector):
+    """
+    Edge detection over a stack of same-size images.
+    
+    The stack is viewed as one tall atlas of N * H rows without copying.
+    Pixel-wise stages (grayscale conversion, absolute value, Sobel
+    combination, magnitude and orientation) run once over the whole atlas.
+    Neighbourhood filters run per image on row slices of the atlas, writing
+    straight into the stacked outputs, so borders are handled exactly as for
+    a single image and no padding copies are needed.
+    """
+    
+    def __init__(self, images, outputs=None, workspace=None, hook=None, verbose=True):
+        """
+        Initialize the detector with a stack of images.
+        
+        Args:
+            images (numpy.ndarray): uint8 stack of shape (N, H, W) or (N, H, W, 3)
+            outputs: Outputs to produce (see OUTPUTS); defaults to DEFAULT_OUTPUTS
+            workspace (Workspace): Buffers to reuse for stage outputs
+            hook: Called as hook(stage, elapsed_ns) after each timed stage
+            verbose (bool): Print progress; False keeps the hot path free of terminal I/O
+        """
+        images = np.asarray(images)
+        if images.dtype != np.uint8:
+            raise ValueError(f"Expected a uint8 stack, got {images.dtype}")
+        if images.ndim not in (3, 4) or (images.ndim == 4 and images.shape[3] != 3):
+            raise ValueError(f"Expected a (N, H, W) or (N, H, W, 3) stack, got {images.shape}")
+        if 0 in images.shape[:3]:
+            raise ValueError("Stack must hold at least one non-empty image")
+        
+        images = np.ascontiguousarray(images)
+        self.stack_shape = images.shape[:3]
+        count, height = self.stack_shape[:2]
+        atlas = images.reshape((count * height,) + images.shape[2:])
+        
+        self._executor = None
+        self._setup(atlas, 'stack', outputs, workspace, hook, verbose)
+    
+    def compute(self, outputs=None, workers=1, **params):
+        """
+        Compute the requested outputs for every image in the stack.
+        
+        Args:
+            outputs: Outputs to compute; defaults to the ones given at construction
+            workers (int): Threads for running the per-image filters concurrently
+            **params: Processing parameters (see DEFAULT_PARAMS)
+        
+        Returns:
+            dict: Output name -> uint8 stack of shape (N, H, W)
+        """
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                self._executor = executor
+                try:
+                    results = super().compute(outputs, **params)
+                finally:
+                    self._executor = None
+        else:
+            results = super().compute(outputs, **params)
+        
+        return {name: image.reshape(self.stack_shape) for name, image in results.items()}
+    
+    def _per_image(self, role, dtype, apply):
+        """
+        Run a neighbourhood filter on each image of the atlas.
+        
+        Args:
+            role (str): Workspace role of the output atlas
+            dtype: Output dtype
+            apply: Called as apply(rows, dst) with the image's row slice and
+                   the matching view of the output atlas
+        
+        Returns:
+            numpy.ndarray: Output atlas of shape (N * H, W)
+        """
+        output = self._buffer(role, dtype)
+        if output is None:
+            output = np.empty(self.original_image.shape[:2], dtype=dtype)
+        
+        height = self.stack_shape[1]
+        
+        def run(index):
+            rows = slice(index * height, (index + 1) * height)
+            apply(rows, output[rows])
+        
+        if self._executor is None:
+            for index in range(self.stack_shape[0]):
+                run(index)
+        else:
+            list(self._executor.map(run, range(self.stack_shape[0])))
+        
+        return output
+    
+    def _compute_blurred(self):
+        """Apply Gaussian blur to each image."""
+        kernel_size, sigma = self.params['blur_kernel_size'], self.params['sigma']
+        return self._per_image('blurred', np.uint8, lambda rows, dst: cv2.GaussianBlur(
+            self.gray_image[rows], kernel_size, sigma, dst=dst))
+    
+    def _sobel(self, role, ddepth, dtype, dx, dy, kernel_size):
+        """Per-image Sobel derivative of the blurred stack."""
+        return self._per_image(role, dtype, lambda rows, dst: cv2.Sobel(
+            self.blurred_image[rows], ddepth, dx, dy, ksize=kernel_size, dst=dst,
+            borderType=cv2.BORDER_REPLICATE))
+    
+    def _compute_gradients(self):
+        """Per-image first derivatives at the configured precision (see _derivative_precision)."""
+        kernel_size = self.params['sobel_kernel']
+        precision = self._derivative_precision(kernel_size)
+        ddepth = PRECISIONS[precision]
+        return (self._sobel('dx', ddepth, precision, 1, 0, kernel_size),
+                self._sobel('dy', ddepth, precision, 0, 1, kernel_size))
+    
+    def _compute_laplacian(self):
+        """Per-image second derivative, saturated over the whole stack at once."""
+        kernel_size = self.params['laplacian_kernel']
+        precision = self._derivative_precision(kernel_size)
+        ddepth = PRECISIONS[precision]
+        laplacian = self._per_image('laplacian_raw', precision, lambda rows, dst: cv2.Laplacian(
+            self.blurred_image[rows], ddepth, dst=dst, ksize=kernel_size))
+        return cv2.convertScaleAbs(laplacian, dst=self._buffer('laplacian'))
+    
+    def _canny_gradients(self):
+        """Per-image int16 aperture-3 derivatives for Canny."""
+        if self.params['sobel_kernel'] == CANNY_APERTURE and self.params['precision'] == 'int16':
+            return self.get_output('gradients')
+        
+        self.get_output('blurred')
+        return (self._sobel('canny_dx', cv2.CV_16S, np.int16, 1, 0, CANNY_APERTURE),
+                self._sobel('canny_dy', cv2.CV_16S, np.int16, 0, 1, CANNY_APERTURE))
+    
+    def _canny(self, role, low, high):
+        """Per-image Canny with the given thresholds."""
+        dx, dy = self._canny_gradients()
+        return self._per_image(role, np.uint8, lambda rows, dst: cv2.Canny(
+            dx[rows], dy[rows], low, high, edges=dst))
+    
+    def _compute_canny(self):
+        """Per-image Canny edges; automatic thresholds come from the whole stack's histogram."""
+        return self._canny('canny', *self.canny_thresholds)
+    
+    def canny_candidates(self):
+        """
+        Canny edge candidates before hysteresis, per image.
+        
+        Returns:
+            tuple: (weak, strong) uint8 atlases of shape (N * H, W)
+        """
+        low, high = sorted(self.get_output('canny_thresholds'))
+        return self._canny('canny_weak', low, low), self._canny('canny_strong', high, high)
+
+    
+    def _canny_maxima(self):
+        """Per-image non-maximum suppression."""
+        return self._canny('canny_maxima', 0, 0)
+    
+    def _label_components(self, mask):
+        """Component labels per image, so components never join across images."""
+        labels = np.empty(mask.shape, dtype=np.int32)
+        height = self.stack_shape[1]
+        total = 1
+        for top in range(0, mask.shape[0], height):
+            count, band = cv2.connectedComponents(mask[top:top + height].view(np.uint8),
+                                                  connectivity=8)
+            band[band > 0] += total - 1
+            labels[top:top + height] = band
+            total += count - 1
+        return total, labels
+    
+    def canny_sweep(self, thresholds):
+        """
+        Canny edges of every image for many threshold pairs (see EdgeDetector.canny_sweep).
+        
+        Args:
+            thresholds: Iterable of (threshold1, threshold2) pairs
+            
+        Returns:
+            tuple: (masks, densities) - uint8 array (P, N, H, W) of 0/255 masks
+                   and float array (P, N) of the fraction of edge pixels per image
+        """
+        masks, _ = super().canny_sweep(thresholds)
+        masks = masks.reshape((masks.shape[0],) + self.stack_shape)
+        densities = np.count_nonzero(masks.reshape(masks.shape[:2] + (-1,)), axis=2)
+        return masks, densities / (self.stack_shape[1] * self.stack_shape[2])
+
+
+def process_stack(images, outputs=None, workers=1, workspace=None, **params):
+    """
+    Run edge detection on a stack of same-size images.
+    
+    Args:
+        images (numpy.ndarray): uint8 stack of shape (N, H, W) or (N, H, W, 3)
+        outputs: Outputs to compute (see OUTPUTS); defaults to DEFAULT_OUTPUTS
+        workers (int): Threads for running the per-image filters concurrently
+        workspace (Workspace): Buffers to reuse across same-size stacks
+        **params: Processing parameters (see DEFAULT_PARAMS)
+    
+    Returns:
+        dict: Output name -> uint8 stack of shape (N, H, W)
+    """
+    return StackDetector(images, outputs=outputs, workspace=workspace).compute(
+        workers=workers, **params)
@@ -1,3 +1,11 @@
+// Data URI for a base64 result image; the server picks JPEG, PNG or WebP per output
+function imageSrc(base64) {
+    let type = 'image/jpeg';
+    if (base64.startsWith('iVBOR')) type = 'image/png';
+    else if (base64.startsWith('UklGR')) type = 'image/webp';
+    return `data:${type};base64,${base64}`;
+}
+
 // Tab switching
 function switchTab(tabName) {
     document.querySelectorAll('.tab-content').forEach(tab => {
@@ -205,12 +213,17 @@ function displayResults(results, type) {
     ];
     
     items.forEach(item => {
-        if (results[item.key]) {
+        let src = results[item.key] ? imageSrc(results[item.key]) : null;
+        // The API only echoes the upload on request; show the local file instead
+        if (!src && item.key === 'original' && type === 'single' && selectedFile) {
+            src = URL.createObjectURL(selectedFile);
+        }
+        if (src) {
             const div = document.createElement('div');
             div.className = 'result-item';
             div.innerHTML = `
                 <h3>${item.label}</h3>
-                <img src="data:image/jpeg;base64,${results[item.key]}" alt="${item.label}">
+                <img src="${src}" alt="${item.label}">
             `;
             grid.appendChild(div);
         }
@@ -229,7 +242,7 @@ function displayBatchResults(results) {
             div.className = 'result-item';
             div.innerHTML = `
                 <h3>${result.filename}</h3>
-                <img src="data:image/jpeg;base64,${result.canny}" alt="${result.filename}">
+                <img src="${imageSrc(result.canny)}" alt="${result.filename}">
             `;
             grid.appendChild(div);
         }
@@ -259,7 +272,7 @@ function displayComparison(data) {
             
             div.innerHTML = `
                 <h3>${item.label}</h3>
-                <img src="data:image/jpeg;base64,${src}" alt="${item.label}">
+                <img src="${imageSrc(src)}" alt="${item.label}">
             `;
             grid.appendChild(div);
         }
@@ -0,0 +1,481 @@
+"""
+Strip Processing for Edge Detection
+Process images in horizontal bands: out-of-core for images larger than RAM,
+or in parallel tiles for low-latency processing of a single large image
+"""
+
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from edge_detection import (EdgeDetector, DEFAULT_PARAMS, OUTPUTS, parse_outputs,
+                            canny_hysteresis, auto_canny_thresholds)
+
+
+# Marker for Canny pixels that passed the low threshold but are not yet
+# known to be connected to a strong edge
+WEAK_EDGE = 1
+
+# Smallest tile worth handing to a thread; below this the halo rows and
+# scheduling overhead outweigh the parallel speed-up
+MIN_TILE_ROWS = 256
+
+# Images smaller than this are not worth splitting across threads
+MIN_PARALLEL_PIXELS = 4000000
+
+
+# Inputs open_source can read band by band, without decoding the whole image
+STREAMABLE_EXTENSIONS = ('.npy', '.pgm', '.ppm')
+
+
+def _open_netpbm(image_path):
+    """
+    Memory-map the pixels of a binary PGM (P5) or PPM (P6) file.
+    
+    Their pixels are stored uncompressed after a short text header, so
+    rows can be paged in like those of a .npy file. PPM pixels are RGB;
+    the returned view is BGR like OpenCV's images.
+    
+    Args:
+        image_path (str): Path to the file
+    
+    Returns:
+        numpy.memmap: (H, W) or (H, W, 3) view of the pixels
+    """
+    with open(image_path, 'rb') as stream:
+        header = stream.read(1024)
+    
+    fields = []
+    offset = 2
+    if header[:2] in (b'P5', b'P6'):
+        # Magic number, width, height and maxval, separated by whitespace and comments
+        while len(fields) < 3 and offset < len(header):
+            if header[offset:offset + 1] == b'#':
+                offset = header.find(b'\n', offset) + 1 or len(header)
+            elif header[offset:offset + 1].isspace():
+                offset += 1
+            else:
+                end = offset
+                while end < len(header) and header[end:end + 1].isdigit():
+                    end += 1
+                if end == offset:
+                    break
+                fields.append(int(header[offset:end]))
+                offset = end
+    # Exactly one whitespace character separates the header from the pixels
+    if len(fields) < 3 or not header[offset:offset + 1].isspace():
+        raise ValueError(f"Not a binary PGM/PPM file: {image_path}")
+    width, height, maxval = fields
+    if maxval > 255:
+        raise ValueError(f"Expected an 8-bit PGM/PPM file, got maxval {maxval}: {image_path}")
+    
+    shape = (height, width) if header[:2] == b'P5' else (height, width, 3)
+    source = np.memmap(image_path, dtype=np.uint8, mode='r', offset=offset + 1, shape=shape)
+    return source if source.ndim == 2 else source[:, :, ::-1]
+
+
+def open_source(image_path, full_read=False):
+    """
+    Open an image for band-wise reading.
+    
+    .npy files and binary PGM/PPM files are memory-mapped, so only the rows
+    of the current band are ever paged in. Other formats cannot be decoded
+    partially by OpenCV: they are refused unless full_read is set, in which
+    case they are decoded whole as grayscale (a third of the memory of a
+    color decode), which defeats out-of-core processing.
+    
+    Args:
+        image_path (str): Path to a .npy array (H, W) or (H, W, 3), a binary
+                          .pgm/.ppm file or, with full_read, any image file
+        full_read (bool): Decode formats that cannot be read in bands whole
+    
+    Returns:
+        numpy.ndarray: Array (or memmap) supporting row slicing
+    """
+    extension = Path(image_path).suffix.lower()
+    if extension == '.npy':
+        source = np.load(image_path, mmap_mode='r')
+    elif extension in ('.pgm', '.ppm'):
+        source = _open_netpbm(image_path)
+    elif full_read:
+        source = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    else:
+        raise ValueError(f"{extension or 'This format'} cannot be read in bands, so "
+                         f"{image_path} would be decoded whole; convert it to one of "
+                         f"{', '.join(STREAMABLE_EXTENSIONS)} or allow a full read")
+    
+    if source is None:
+        raise ValueError(f"Could not read image from {image_path}")
+    if source.dtype != np.uint8 or source.ndim not in (2, 3):
+        raise ValueError(f"Expected a uint8 (H, W) or (H, W, 3) image, "
+                         f"got {source.dtype} {source.shape}")
+    
+    return source
+
+
+def _kernel_radius(kernel_size):
+    """Rows a derivative kernel reaches above and below (ksize 1 still uses 3 taps)."""
+    return max(1, kernel_size // 2)
+
+
+def halo_rows(params):
+    """
+    Number of extra rows a band needs above and below for exact results.
+    
+    Args:
+        params (dict): Processing parameters (see DEFAULT_PARAMS)
+    
+    Returns:
+        int: Halo height covering blur, derivatives and non-maximum suppression
+    """
+    blur_height = params['blur_kernel_size'][1]
+    if blur_height <= 0:
+        # OpenCV derives the 8-bit kernel size from sigma in this case
+        blur_height = int(round(params['sigma'] * 6 + 1)) | 1
+    
+    derivative = max(_kernel_radius(params['sobel_kernel']),
+                     _kernel_radius(params['laplacian_kernel']),
+                     _kernel_radius(3))
+    
+    # +1 for the neighbours Canny compares against during non-maximum suppression
+    return blur_height // 2 + derivative + 1
+
+
+def _propagate_hysteresis(state, band_height):
+    """
+    Resolve Canny hysteresis across bands in place.
+    
+    Sweeps down and up the image, promoting weak pixels connected to strong
+    ones within each band plus one row of its neighbours, until a full round
+    changes nothing. Remaining weak pixels are then cleared.
+    
+    Args:
+        state (numpy.ndarray): Mask holding 0, WEAK_EDGE or 255
+        band_height (int): Rows processed at a time
+    """
+    height = state.shape[0]
+    tops = list(range(0, height, band_height))
+    
+    changed = True
+    while changed:
+        changed = False
+        for top in tops + tops[::-1]:
+            start = max(0, top - 1)
+            stop = min(height, top + band_height + 1)
+            band = np.array(state[start:stop])
+            
+            edges = canny_hysteresis(band, band == 255)
+            promoted = (edges == 255) & (band == WEAK_EDGE)
+            if promoted.any():
+                band[promoted] = 255
+                state[start:stop] = band
+                changed = True
+    
+    for top in tops:
+        band = state[top:top + band_height]
+        band[band == WEAK_EDGE] = 0
+
+
+def _fixed_thresholds(source, band_height, halo, params):
+    """
+    Resolve automatic Canny thresholds over the whole image, band by band.
+    
+    Each band would otherwise derive its own thresholds from its own
+    histogram. The blurred image's histogram is accumulated over the band
+    cores instead, which matches the whole-image histogram exactly.
+    
+    Args:
+        source: Array or memmap of shape (H, W) or (H, W, 3)
+        band_height (int): Rows per band
+        halo (int): Extra context rows read above and below
+        params (dict): Processing parameters
+    
+    Returns:
+        dict: params with canny_auto cleared and fixed thresholds filled in
+    """
+    settings = dict(DEFAULT_PARAMS)
+    settings.update(params)
+    if settings['canny_auto'] is None:
+        return params
+    
+    height = source.shape[0]
+    histogram = np.zeros(256)
+    for top in range(0, height, band_height):
+        start = max(0, top - halo)
+        stop = min(height, top + band_height + halo)
+        detector = EdgeDetector.from_array(np.ascontiguousarray(source[start:stop]))
+        detector.set_params(**params)
+        blurred = detector.get_output('blurred')[top - start:min(top + band_height, height) - start]
+        histogram += cv2.calcHist([blurred], [0], None, [256], [0, 256]).ravel()
+    
+    threshold1, threshold2 = auto_canny_thresholds(histogram, settings['canny_auto'],
+                                                   settings['canny_sigma'])
+    return dict(params, canny_auto=None, canny_threshold1=threshold1,
+                canny_threshold2=threshold2)
+
+
+def _process_band(source, top, bottom, halo, outputs, params):
+    """
+    Compute the requested outputs for rows [top, bottom) of the source.
+    
+    Args:
+        source: Array or memmap of shape (H, W) or (H, W, 3)
+        top (int): First row of the band
+        bottom (int): Row after the last row of the band
+        halo (int): Extra context rows read above and below
+        outputs: Output names to compute
+        params (dict): Processing parameters
+    
+    Returns:
+        dict: Output name -> band image; 'canny' holds 0, WEAK_EDGE or 255
+              until hysteresis has been resolved
+    """
+    height = source.shape[0]
+    start = max(0, top - halo)
+    stop = min(height, bottom + halo)
+    core = slice(top - start, bottom - start)
+    
+    detector = EdgeDetector.from_array(np.ascontiguousarray(source[start:stop]))
+    detector.set_params(**params)
+    
+    band_outputs = [name for name in outputs if name != 'canny']
+    results = {}
+    if band_outputs:
+        for name, image in detector.compute(band_outputs).items():
+            results[name] = image[core]
+    
+    if 'canny' in outputs:
+        weak, strong = detector.canny_candidates()
+        band_state = (weak[core] > 0).view(np.uint8) * np.uint8(WEAK_EDGE)
+        band_state[strong[core] > 0] = 255
+        results['canny'] = band_state
+    
+    return results
+
+
+def process_in_strips(source, output_dir='output', base_name='image', outputs=('canny',),
+                      band_height=1024, **params):
+    """
+    Run edge detection band by band, writing each output to a .npy memmap.
+    
+    Peak memory is set by band_height and the image width, not by the image
+    height. Results match whole-image processing exactly, including Canny
+    hysteresis across band boundaries.
+    
+    Args:
+        source: Array or memmap of shape (H, W) or (H, W, 3), e.g. from open_source
+        output_dir (str): Directory for the output .npy files
+        base_name (str): Prefix for output file names
+        outputs: Outputs to compute (see OUTPUTS)
+        band_height (int): Rows per band, excluding halo rows
+        **params: Processing parameters (see DEFAULT_PARAMS)
+    
+    Returns:
+        dict: Output name -> path of the written .npy file
+    """
+    outputs = parse_outputs(outputs)
+    if band_height < 1:
+        raise ValueError("band_height must be at least 1")
+    
+    settings = dict(DEFAULT_PARAMS)
+    settings.update(params)
+    halo = halo_rows(settings)
+    height, width = source.shape[:2]
+    if 'canny' in outputs:
+        params = _fixed_thresholds(source, band_height, halo, params)
+    
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    paths = {name: os.path.join(output_dir, f"{base_name}_{name}.npy") for name in outputs}
+    files = {
+        name: np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=(height, width))
+        for name, path in paths.items()
+    }
+    
+    for top in range(0, height, band_height):
+        bottom = min(top + band_height, height)
+        for name, image in _process_band(source, top, bottom, halo, outputs, params).items():
+            files[name][top:bottom] = image
+    
+    if 'canny' in files:
+        _propagate_hysteresis(files['canny'], band_height)
+    
+    for image in files.values():
+        image.flush()
+    
+    return paths
+
+
+def _seam_pairs(upper, lower):
+    """
+    Label pairs that touch across a seam under 8-connectivity.
+    
+    Args:
+        upper (numpy.ndarray): Labels of the last row above the seam
+        lower (numpy.ndarray): Labels of the first row below the seam
+    
+    Returns:
+        tuple: (upper_labels, lower_labels) arrays of connected pairs
+    """
+    width = upper.shape[0]
+    pairs_upper, pairs_lower = [], []
+    for shift in (-1, 0, 1):
+        a = upper[max(0, -shift):width - max(0, shift)]
+        b = lower[max(0, shift):width - max(0, -shift)]
+        touching = (a > 0) & (b > 0)
+        pairs_upper.append(a[touching])
+        pairs_lower.append(b[touching])
+    return np.concatenate(pairs_upper), np.concatenate(pairs_lower)
+
+
+def process_in_tiles(image, outputs=('canny',), workers=4, tile_height=None, **params):
+    """
+    Run edge detection on overlapping horizontal tiles in a thread pool.
+    
+    OpenCV releases the GIL, so tiles run concurrently. Each tile writes a
+    disjoint set of rows. Canny edge candidates are labelled per tile, the
+    labels are joined across seams, and hysteresis is resolved from the
+    joined components, so results match single-threaded processing exactly.
+    
+    Args:
+        image (numpy.ndarray): Image of shape (H, W) or (H, W, 3)
+        outputs: Outputs to compute (see OUTPUTS)
+        workers (int): Number of threads
+        tile_height (int): Rows per tile; defaults to an even split between
+                           workers, but never below MIN_TILE_ROWS
+        **params: Processing parameters (see DEFAULT_PARAMS)
+    
+    Returns:
+        dict: Output name -> full-size image
+    """
+    outputs = parse_outputs(outputs)
+    height, width = image.shape[:2]
+    if tile_height is None:
+        tile_height = max(MIN_TILE_ROWS, -(-height // max(1, workers)))
+    if tile_height < 1:
+        raise ValueError("tile_height must be at least 1")
+    
+    settings = dict(DEFAULT_PARAMS)
+    settings.update(params)
+    halo = halo_rows(settings)
+    if 'canny' in outputs:
+        params = _fixed_thresholds(image, tile_height, halo, params)
+    results = {name: np.empty((height, width), dtype=np.uint8) for name in outputs}
+    tops = list(range(0, height, tile_height))
+    components = [None] * len(tops)
+    
+    def run_tile(index):
+        top = tops[index]
+        bottom = min(top + tile_height, height)
+        for name, tile in _process_band(image, top, bottom, halo, outputs, params).items():
+            if name == 'canny':
+                # Label candidates locally; hysteresis waits for the seams
+                count, labels = cv2.connectedComponents((tile > 0).view(np.uint8),
+                                                        connectivity=8)
+                seeded = np.zeros(count, dtype=bool)
+                seeded[labels[tile == 255]] = True
+                seeded[0] = False
+                components[index] = (labels, seeded)
+            else:
+                results[name][top:bottom] = tile
+    
+    def finish_tile(index, offset, keep):
+        labels, seeded = components[index]
+        edges = keep[offset:offset + seeded.shape[0]][labels].view(np.uint8)
+        edges *= 255
+        results['canny'][tops[index]:tops[index] + labels.shape[0]] = edges
+    
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        # list() re-raises the first tile error, if any
+        list(executor.map(run_tile, range(len(tops))))
+        
+        if 'canny' in results:
+            offsets = np.cumsum([0] + [seeded.shape[0] for _, seeded in components])
+            keep = np.concatenate([seeded for _, seeded in components])
+            
+            seams = [_seam_pairs(components[i][0][-1], components[i + 1][0][0])
+                     for i in range(len(tops) - 1)]
+            if seams:
+                upper = np.concatenate([pair[0] + offsets[i] for i, pair in enumerate(seams)])
+                lower = np.concatenate([pair[1] + offsets[i + 1]
+                                        for i, pair in enumerate(seams)])
+                
+                # Spread the strong seed along joined components until stable
+                while True:
+                    joined = keep[upper] | keep[lower]
+                    spread = joined & ~(keep[upper] & keep[lower])
+                    if not spread.any():
+                        break
+                    keep[upper[spread]] = True
+                    keep[lower[spread]] = True
+            
+            list(executor.map(finish_tile, range(len(tops)), offsets[:-1],
+                              [keep] * len(tops)))
+    
+    return results
+
+
+def main():
+    """
+    Main function for strip processing.
+    """
+    import argparse
+    
+    parser = argparse.ArgumentParser(
+        description='Edge detection for images larger than RAM, processed in bands'
+    )
+    parser.add_argument(
+        'image',
+        help=f'Input image, read out-of-core: {", ".join(STREAMABLE_EXTENSIONS)} '
+             f'(binary 8-bit PGM/PPM)'
+    )
+    parser.add_argument(
+        '--output',
+        default='output',
+        help='Output folder for .npy results (default: output)'
+    )
+    parser.add_argument(
+        '--outputs',
+        default='canny',
+        help=f'Comma-separated outputs (default: canny). Available: {", ".join(OUTPUTS)}'
+    )
+    parser.add_argument(
+        '--band-height',
+        type=int,
+        default=1024,
+        help='Rows per band; sets peak memory (default: 1024)'
+    )
+    parser.add_argument(
+        '--full-read',
+        action='store_true',
+        help='Decode other formats (PNG, JPEG, TIFF, ...) whole into memory first'
+    )
+    
+    args = parser.parse_args()
+    
+    try:
+        if args.full_read and Path(args.image).suffix.lower() not in STREAMABLE_EXTENSIONS:
+            print(f"[WARNING] {Path(args.image).name} cannot be read in bands; decoding "
+                  f"the whole image into memory")
+        source = open_source(args.image, full_read=args.full_read)
+        paths = process_in_strips(
+            source,
+            output_dir=args.output,
+            base_name=Path(args.image).stem,
+            outputs=args.outputs,
+            band_height=args.band_height
+        )
+        print(f"[OK] Processed {source.shape[1]}x{source.shape[0]} image in bands "
+              f"of {args.band_height} rows:")
+        for path in paths.values():
+            print(f"  - {path}")
+    except Exception as e:
+        print(f"\n[ERROR] {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,23 +3,40 @@ Unit tests for Flask API
 """
 
 import pytest
+import base64
 import io
+import json
 import sys
+import time
+import zipfile
 from pathlib import Path
 import numpy as np
 import cv2
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+import app as app_module
 from app import app
+from result_cache import ResultCache
+from job_store import JobStore, JobRunner
+from job_api import job_handler
+from responses import detection_params
 
 
 @pytest.fixture
-def client():
-    """Create test client."""
+def client(tmp_path, monkeypatch):
+    """Create test client with an empty result cache and job store."""
+    monkeypatch.setattr(app_module, 'RESULT_CACHE', ResultCache(str(tmp_path)))
+    jobs = JobStore(str(tmp_path / "jobs"))
+    runner = JobRunner(jobs, job_handler(app_module.ENCODER, app_module.RESULT_CACHE),
+                       workers=1, poll=0.01)
+    monkeypatch.setitem(app.extensions['jobs'], 'store', jobs)
+    monkeypatch.setitem(app.extensions['jobs'], 'runner', runner)
     app.config['TESTING'] = True
     with app.test_client() as client:
         yield client
+    runner.stop()
+    jobs.close()
 
 
 @pytest.fixture
@@ -81,6 +98,275 @@ class TestAPI:
         assert json_data['success'] == True
         assert 'results' in json_data
         assert 'canny' in json_data['results']
+        assert {'decode', 'canny', 'encode', 'total'} <= set(json_data['timings_ms'])
+    
+    def test_detect_auto_thresholds(self, client, test_image):
+        """Test that automatic Canny thresholds are reported."""
+        response = client.post(
+            '/api/detect',
+            data={'image': (test_image, 'test.jpg'), 'canny_auto': 'otsu'},
+            content_type='multipart/form-data'
+        )
+        
+        assert response.status_code == 200
+        thresholds = response.get_json()['canny_thresholds']
+        assert thresholds['auto'] == 'otsu'
+        assert 0 <= thresholds['threshold1'] <= thresholds['threshold2'] <= 255
+    
+    @pytest.mark.parametrize('endpoint', ['/api/detect', '/api/jobs'])
+    def test_unknown_auto_thresholds(self, client, test_image, endpoint):
+        """Test that an unknown canny_auto method is a client error listing the methods."""
+        response = client.post(
+            endpoint,
+            data={'image': (test_image, 'test.jpg'), 'canny_auto': 'bogus'},
+            content_type='multipart/form-data'
+        )
+        
+        assert response.status_code == 400
+        assert 'median, otsu' in response.get_json()['error']
+    
+    @pytest.mark.parametrize('endpoint', ['/api/detect', '/api/jobs'])
+    def test_unknown_decode_mode(self, client, test_image, endpoint):
+        """Test that an unknown decode mode is a client error listing the modes."""
+        response = client.post(
+            endpoint,
+            data={'image': (test_image, 'test.jpg'), 'decode': 'bogus'},
+            content_type='multipart/form-data'
+        )
+        
+        assert response.status_code == 400
+        assert 'Unknown decode: bogus' in response.get_json()['error']
+    
+    def test_detect_selected_outputs(self, client, test_image):
+        """Test that only the requested layers are returned."""
+        response = client.post(
+            '/api/detect',
+            data={'image': (test_image, 'test.jpg'), 'outputs': 'canny,grayscale'},
+            content_type='multipart/form-data'
+        )
+        
+        assert response.status_code == 200
+        assert set(response.get_json()['results']) == {'grayscale', 'canny'}
+    
+    def test_detect_computes_only_requested(self, client, test_image):
+        """Test that unrequested layers are neither computed nor returned."""
+        response = client.post(
+            '/api/detect',
+            data={'image': (test_image, 'test.jpg'), 'outputs': 'canny'},
+            content_type='multipart/form-data'
+        )
+        
+        json_data = response.get_json()
+        assert list(json_data['results']) == ['canny']
+        assert 'laplacian' not in json_data['timings_ms']
+        assert json_data['canny_thresholds']['threshold1'] == 50
+    
+    def test_detect_original_opt_in(self, client, test_image):
+        """Test that the upload is returned only when 'original' is requested."""
+        response = client.post(
+            '/api/detect',
+            data={'image': (test_image, 'test.jpg'), 'outputs': 'original,laplacian'},
+            content_type='multipart/form-data'
+        )
+        
+        json_data = response.get_json()
+        assert set(json_data['results']) == {'original', 'laplacian'}
+        assert json_data['canny_thresholds']['threshold1'] is None
+        original = cv2.imdecode(np.frombuffer(base64.b64decode(json_data['results']['original']),
+                                              np.uint8), cv2.IMREAD_UNCHANGED)
+        assert original.shape == (100, 100, 3)
+    
+    def test_detect_multipart(self, client, test_image):
+        """Test raw image parts in a multipart/mixed response."""
+        response = client.post(
+            '/api/detect',
+            data={'image': (test_image, 'test.jpg'), 'outputs': 'sobel_x,canny'},
+            content_type='multipart/form-data',
+            headers={'Accept': 'multipart/mixed'}
+        )
+        
+        assert response.status_code == 200
+        assert response.mimetype == 'multipart/mixed'
+        boundary = response.mimetype_params['boundary'].encode()
+        parts = response.data.split(b'--' + boundary)[1:-1]
+        assert len(parts) == 3
+        headers, body = parts[0].split(b'\r\n\r\n', 1)
+        assert json.loads(body)['canny_thresholds']['threshold1'] == 50
+        headers, body = parts[2].split(b'\r\n\r\n', 1)
+        assert b'name="canny"' in headers and b'image/png' in headers
+        canny = cv2.imdecode(np.frombuffer(body[:-2], np.uint8), cv2.IMREAD_GRAYSCALE)
+        assert canny.shape == (100, 100)
+    
+    def test_detect_zip(self, client, test_image):
+        """Test the zip response format."""
+        response = client.post(
+            '/api/detect?format=zip',
+            data={'image': (test_image, 'test.jpg')},
+            content_type='multipart/form-data'
+        )
+        
+        assert response.status_code == 200
+        with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+            names = archive.namelist()
+            assert names[0] == 'metadata.json'
+            assert 'canny.png' in names and 'grayscale.jpg' in names
+            # The upload is not echoed back unless requested
+            assert 'original.jpg' not in names
+            assert len(names) == 8
+            canny = cv2.imdecode(np.frombuffer(archive.read('canny.png'), np.uint8),
+                                 cv2.IMREAD_GRAYSCALE)
+        assert set(np.unique(canny)) <= {0, 255}
+    
+    def test_detect_raw_image(self, client, test_image):
+        """Test a single raw image chosen through the Accept header."""
+        response = client.post(
+            '/api/detect',
+            data={'image': (test_image, 'test.jpg'), 'outputs': 'canny'},
+            content_type='multipart/form-data',
+            headers={'Accept': 'image/png'}
+        )
+        
+        assert response.status_code == 200
+        assert response.mimetype == 'image/png'
+        assert json.loads(response.headers['X-Edge-Metadata'])['filename'] == 'test.jpg'
+        assert cv2.imdecode(np.frombuffer(response.data, np.uint8),
+                            cv2.IMREAD_GRAYSCALE).shape == (100, 100)
+    
+    @pytest.mark.parametrize('accept', [
+        'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,'
+        'image/apng,*/*;q=0.8',
+        'image/*',
+        'application/json,image/png',
+        'image/png;q=0.5,application/json;q=0.9'
+    ])
+    def test_detect_json_by_default(self, client, accept):
+        """Test that browser-style and JSON-preferring Accept headers get JSON."""
+        image = np.zeros((64, 64, 3), dtype=np.uint8)
+        cv2.circle(image, (32, 32), 16, (255, 255, 255), -1)
+        upload = io.BytesIO(cv2.imencode('.png', image)[1].tobytes())
+        response = client.post('/api/detect', data={'image': (upload, 'test.png')},
+                               content_type='multipart/form-data', headers={'Accept': accept})
+        
+        assert response.status_code == 200
+        assert response.mimetype == 'application/json'
+        assert 'canny' in response.get_json()['results']
+    
+    @pytest.mark.parametrize('query', ['format=image', 'format=xml', 'outputs=edges'])
+    def test_detect_bad_format(self, client, test_image, query):
+        """Test that unusable format and output requests are rejected."""
+        response = client.post(
+            f'/api/detect?{query}',
+            data={'image': (test_image, 'test.jpg')},
+            content_type='multipart/form-data'
+        )
+        
+        assert response.status_code == 400
+    
+    def test_detect_cached(self, client, test_image):
+        """Test that a repeated request is served from the result cache."""
+        upload = test_image.getvalue()
+        responses = [client.post('/api/detect',
+                                 data={'image': (io.BytesIO(upload), name), 'outputs': 'canny'},
+                                 content_type='multipart/form-data').get_json()
+                     for name in ('test.jpg', 'renamed.jpg')]
+        
+        assert [json_data['cached'] for json_data in responses] == [False, True]
+        assert responses[0]['results'] == responses[1]['results']
+        assert responses[1]['filename'] == 'renamed.jpg'
+        
+        response = client.post('/api/detect?format=image',
+                               data={'image': (io.BytesIO(upload), 'test.jpg'),
+                                     'outputs': 'canny', 'canny_threshold1': '20'},
+                               content_type='multipart/form-data')
+        assert not json.loads(response.headers['X-Edge-Metadata'])['cached']
+        
+        stats = client.get('/api/cache').get_json()
+        assert stats['enabled']
+        assert (stats['memory_hits'], stats['misses'], stats['stores']) == (1, 2, 2)
+    
+    def test_compare_with_image(self, client, test_image):
+        """Test comparison endpoint decodes the upload in memory."""
+        response = client.post(
+            '/api/compare',
+            data={'image': (test_image, 'test.jpg')},
+            content_type='multipart/form-data'
+        )
+        
+        assert response.status_code == 200
+        assert 'canny' in response.get_json()['algorithms']
+    
+    def test_compare_selected_outputs(self, client, test_image):
+        """Test that comparison computes and returns only the requested layers."""
+        response = client.post(
+            '/api/compare',
+            data={'image': (test_image, 'test.jpg'), 'outputs': 'canny,laplacian'},
+            content_type='multipart/form-data'
+        )
+        
+        assert response.status_code == 200
+        assert set(response.get_json()['algorithms']) == {'canny', 'laplacian'}
+        
+        response = client.post(
+            '/api/compare',
+            data={'image': (io.BytesIO(b'x'), 'test.jpg'), 'outputs': 'edges'},
+            content_type='multipart/form-data'
+        )
+        assert response.status_code == 400
+    
+    def test_job(self, client, test_image):
+        """Test an asynchronous job from submission to results."""
+        upload = test_image.getvalue()
+        response = client.post('/api/jobs', data={
+            'images': [(io.BytesIO(upload), 'a.jpg'), (io.BytesIO(upload), 'b.jpg'),
+                       (io.BytesIO(b'not an image'), 'broken.jpg')],
+            'outputs': 'canny,laplacian'
+        }, content_type='multipart/form-data')
+        
+        assert response.status_code == 202
+        job = response.get_json()
+        assert job['total'] == 3 and response.headers['Location'] == job['status_url']
+        
+        deadline = time.time() + 30
+        while job['state'] in ('queued', 'running'):
+            assert time.time() < deadline
+            time.sleep(0.02)
+            job = client.get(job['status_url']).get_json()
+        assert (job['state'], job['completed'], job['failed'], job['progress']) == ('done', 3, 1, 1)
+        
+        results = client.get(job['results_url']).get_json()['results']
+        assert [result['status'] for result in results] == ['success', 'success', 'error']
+        assert set(results[0]['results']) == {'canny', 'laplacian'}
+        assert results[0]['canny_thresholds']['threshold1'] == 50
+        
+        response = client.get(f"/api/jobs/{job['id']}/results/1/canny")
+        assert response.mimetype == 'image/png'
+        assert response.data == base64.b64decode(results[1]['results']['canny'])
+        assert client.get(f"/api/jobs/{job['id']}/results/2/canny").status_code == 404
+    
+    def test_job_not_ready_or_unknown(self, client, test_image):
+        """Test results of a queued job and of an unknown one."""
+        params = detection_params({})
+        job_id = app.extensions['jobs']['store'].create(
+            [('a.jpg', test_image.getvalue())],
+            {'layers': ['canny'], 'decode': params.pop('decode'), 'params': params})
+        
+        response = client.get(f'/api/jobs/{job_id}/results')
+        assert response.status_code == 409
+        assert response.get_json()['state'] == 'queued'
+        assert client.get('/api/jobs/0123abcd').status_code == 404
+        assert client.get('/api/jobs/0123abcd/results').status_code == 404
+        assert client.post('/api/jobs', data={'outputs': 'canny'},
+                           content_type='multipart/form-data').status_code == 400
+    
+    def test_analyze_undecodable_image(self, client):
+        """Test analysis of a file that is not an image."""
+        response = client.post(
+            '/api/analyze',
+            data={'image': (io.BytesIO(b'not an image'), 'test.jpg')},
+            content_type='multipart/form-data'
+        )
+        
+        assert response.status_code == 400
     
     def test_invalid_file_type(self, client):
         """Test with invalid file type."""
@@ -0,0 +1,122 @@
+"""
+Unit tests for batch input discovery
+"""
+
+import pytest
+import numpy as np
+import cv2
+import os
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import batch_discovery
+from batch_discovery import discover_images
+from batch_process import batch_process_images
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """Create a nested folder of images in date folders."""
+    root = tmp_path / "input"
+    image = np.full((24, 32, 3), 128, dtype=np.uint8)
+    cv2.rectangle(image, (8, 6), (24, 18), (255, 255, 255), -1)
+    for relative in ["top.png",
+                     "2024-01-01/a.jpg", "2024-01-01/b.png",
+                     "2024-01-02/c.png", "2024-01-02/thumbnails/c_small.png",
+                     "2024-01-02/nested/deep/d.bmp"]:
+        path = root / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        cv2.imwrite(str(path), image)
+    (root / "2024-01-01" / "notes.txt").write_text("not an image")
+    return root
+
+
+def _posix(paths):
+    return [path.replace(os.sep, '/') for path in paths]
+
+
+class TestDiscoverImages:
+    """Test cases for discover_images."""
+    
+    def test_recursive_order(self, tree):
+        """Test that every image is found, files first, folders in name order."""
+        assert _posix(discover_images(str(tree))) == [
+            "top.png", "2024-01-01/a.jpg", "2024-01-01/b.png", "2024-01-02/c.png",
+            "2024-01-02/nested/deep/d.bmp", "2024-01-02/thumbnails/c_small.png"]
+    
+    def test_filters(self, tree):
+        """Test include and exclude globs, and that excluded folders are pruned."""
+        assert _posix(discover_images(str(tree), include=["2024-01-01/*"])) == [
+            "2024-01-01/a.jpg", "2024-01-01/b.png"]
+        assert _posix(discover_images(str(tree), include=["*.png"],
+                                      exclude=["*/thumbnails", "top.*"])) == [
+            "2024-01-01/b.png", "2024-01-02/c.png"]
+        assert _posix(discover_images(str(tree), recursive=False)) == ["top.png"]
+    
+    def test_skip_folders(self, tree, tmp_path):
+        """Test that skipped folders under the root are pruned and others ignored."""
+        assert _posix(discover_images(str(tree), skip_folders=[str(tree / "2024-01-02"),
+                                                               str(tmp_path), str(tree)])) == [
+            "top.png", "2024-01-01/a.jpg", "2024-01-01/b.png"]
+    
+    def test_lazy(self, tree, monkeypatch):
+        """Test that the first image is yielded before the rest of the tree is listed."""
+        scanned = []
+        scandir = os.scandir
+        
+        def counting_scandir(path):
+            scanned.append(path)
+            return scandir(path)
+        
+        monkeypatch.setattr(batch_discovery.os, 'scandir', counting_scandir)
+        images = discover_images(str(tree))
+        assert next(images) == "top.png"
+        assert len(scanned) == 1
+
+
+class TestMirroredBatch:
+    """Test that batch runs mirror the input tree into the output."""
+    
+    @pytest.mark.parametrize('engine', [{'workers': 1}, {'workers': 2},
+                                        {'workers': 2, 'pipeline': True}])
+    def test_mirrored_outputs(self, tree, tmp_path, engine):
+        """Test that results land in the same subfolders as their inputs."""
+        output = tmp_path / "output"
+        summary = batch_process_images(str(tree), str(output), outputs='canny',
+                                       exclude=["*/thumbnails"], **engine)
+        
+        assert summary == {'total': 5, 'successful': 5, 'failed': 0, 'skipped': 0}
+        written = sorted(path.relative_to(output).as_posix()
+                         for path in output.rglob('*_canny.png'))
+        assert written == ["2024-01-01/a_canny.png", "2024-01-01/b_canny.png",
+                           "2024-01-02/c_canny.png", "2024-01-02/nested/deep/d_canny.png",
+                           "top_canny.png"]
+    
+    @pytest.mark.parametrize('engine', [{'workers': 1}, {'queue': True}])
+    def test_output_inside_input(self, tree, tmp_path, engine):
+        """Test that a rerun does not read back results written under the input folder."""
+        output = tree / "edges"
+        for run in range(2):
+            options = dict(engine)
+            if options.pop('queue', False):
+                options['queue_path'] = str(tmp_path / f"queue_{run}.db")
+            summary = batch_process_images(str(tree), str(output), outputs='canny',
+                                           exclude=["*/thumbnails"], **options)
+            assert summary['total'] == 5
+        
+        assert not (output / "edges").exists()
+        assert not list(output.rglob('*_canny_canny.png'))
+    
+    def test_empty_folder(self, tmp_path):
+        """Test that a folder without images gives an empty summary."""
+        (tmp_path / "empty").mkdir()
+        summary = batch_process_images(str(tmp_path / "empty"), str(tmp_path / "output"),
+                                       workers=1)
+        assert summary == {'total': 0, 'successful': 0, 'failed': 0, 'skipped': 0}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
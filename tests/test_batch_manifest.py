@@ -0,0 +1,128 @@
+"""
+Unit tests for the batch manifest
+"""
+
+import pytest
+import numpy as np
+import cv2
+import os
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import batch_manifest
+from batch_manifest import BatchManifest, parameter_fingerprint
+from batch_process import batch_process_images
+
+
+@pytest.fixture
+def input_folder(tmp_path):
+    """Create a folder of small test images and one unreadable file."""
+    folder = tmp_path / "input"
+    folder.mkdir()
+    rng = np.random.default_rng(2)
+    for i in range(4):
+        image = rng.integers(0, 256, size=(32, 48, 3), dtype=np.uint8)
+        cv2.imwrite(str(folder / f"image_{i}.png"), image)
+    (folder / "broken.jpg").write_bytes(b'not an image')
+    return folder
+
+
+class TestBatchManifest:
+    """Test cases for BatchManifest."""
+    
+    def test_fingerprint(self):
+        """Test that fingerprints change with any setting."""
+        base = parameter_fingerprint(outputs=['canny'], decode='color')
+        assert base == parameter_fingerprint(decode='color', outputs=['canny'])
+        assert base != parameter_fingerprint(outputs=['canny'], decode='grayscale')
+        assert base != parameter_fingerprint(outputs=['canny'], decode='color',
+                                             params={'sigma': 2.0})
+    
+    def test_is_current(self, input_folder, tmp_path):
+        """Test the conditions under which a recorded input is up to date."""
+        image = input_folder / "image_0.png"
+        result = tmp_path / "image_0_canny.png"
+        result.write_bytes(b'result')
+        
+        with BatchManifest(str(tmp_path)) as manifest:
+            assert not manifest.is_current(str(image), 'a')
+            manifest.record(str(image), 'a', [str(result)])
+            assert len(manifest) == 1
+            assert manifest.is_current(str(image), 'a')
+            assert not manifest.is_current(str(image), 'b')
+            
+            # Touched but unchanged content is still current
+            stat = image.stat()
+            os.utime(image, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+            assert manifest.is_current(str(image), 'a')
+            assert manifest.entry(str(image))['mtime_ns'] == stat.st_mtime_ns + 10**9
+            
+            # Changed content is not
+            image.write_bytes(image.read_bytes() + b'\0')
+            assert not manifest.is_current(str(image), 'a')
+            
+            # Nor are inputs whose results were deleted
+            manifest.record(str(image), 'a', [str(result)])
+            result.unlink()
+            assert not manifest.is_current(str(image), 'a')
+            
+            manifest.forget(str(image))
+            assert manifest.entry(str(image)) is None
+    
+    def test_unreadable_input(self, input_folder, tmp_path, monkeypatch):
+        """Test that an input that cannot be checked is processed, not a crash."""
+        output = str(tmp_path / "output")
+        assert batch_process_images(str(input_folder), output, outputs='canny',
+                                    workers=1)['successful'] == 4
+        
+        file_sha256 = batch_manifest.file_sha256
+        checked = []
+        
+        def unreadable_once(path):
+            # Readable again by the time it is processed and recorded
+            if not checked:
+                checked.append(path)
+                raise PermissionError(f"Permission denied: '{path}'")
+            return file_sha256(path)
+        
+        # A touched input is hashed, which fails
+        monkeypatch.setattr(batch_manifest, 'file_sha256', unreadable_once)
+        image = input_folder / "image_1.png"
+        stat = image.stat()
+        os.utime(image, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert batch_process_images(str(input_folder), output, outputs='canny',
+                                    workers=1) == {'total': 5, 'successful': 1, 'failed': 1,
+                                                   'skipped': 3}
+        
+        with BatchManifest(output) as manifest:
+            image.unlink()
+            assert not manifest.is_current(str(image), manifest.entry(str(image))['fingerprint'])
+    
+    @pytest.mark.parametrize('engine', [{'workers': 1}, {'workers': 2},
+                                        {'workers': 2, 'pipeline': True}])
+    def test_incremental_batch(self, input_folder, tmp_path, engine):
+        """Test that reruns skip unchanged images with every processing engine."""
+        output = str(tmp_path / "output")
+        
+        def run(**kwargs):
+            return batch_process_images(str(input_folder), output, outputs='canny',
+                                        **engine, **kwargs)
+        
+        assert run() == {'total': 5, 'successful': 4, 'failed': 1, 'skipped': 0}
+        # Failed images are retried
+        assert run() == {'total': 5, 'successful': 0, 'failed': 1, 'skipped': 4}
+        
+        cv2.imwrite(str(input_folder / "image_2.png"), np.zeros((32, 48, 3), dtype=np.uint8))
+        assert run() == {'total': 5, 'successful': 1, 'failed': 1, 'skipped': 3}
+        
+        # New settings reprocess everything
+        assert run(canny_auto='otsu')['successful'] == 4
+        assert run(force=True, canny_auto='otsu')['skipped'] == 0
+        assert run(manifest=False)['skipped'] == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,127 @@
+"""
+Unit tests for the streaming batch pipeline
+"""
+
+import pytest
+import numpy as np
+import cv2
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from batch_pipeline import PixelBudget, run_pipeline
+from batch_process import batch_process_images
+
+
+@pytest.fixture
+def image_paths(tmp_path):
+    """Write images of mixed sizes and one unreadable file."""
+    folder = tmp_path / "input"
+    folder.mkdir()
+    rng = np.random.default_rng(1)
+    paths = []
+    for i, (height, width) in enumerate([(30, 40), (120, 160), (30, 40), (60, 80), (120, 160)]):
+        paths.append(str(folder / f"image_{i}.png"))
+        cv2.imwrite(paths[-1], rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8))
+    paths.append(str(folder / "broken.png"))
+    Path(paths[-1]).write_bytes(b'not an image')
+    return paths
+
+
+class TestPixelBudget:
+    """Test cases for PixelBudget."""
+    
+    def test_blocks_until_released(self):
+        """Test that acquire waits for room in the budget."""
+        budget = PixelBudget(100)
+        budget.acquire(80)
+        acquired = threading.Event()
+        thread = threading.Thread(target=lambda: (budget.acquire(30), acquired.set()))
+        thread.start()
+        
+        assert not acquired.wait(0.05)
+        budget.release(80)
+        assert acquired.wait(1)
+        thread.join()
+        assert budget.in_flight == 30
+        assert budget.peak == 80
+    
+    def test_oversized_image(self):
+        """Test that an image larger than the budget runs alone instead of deadlocking."""
+        budget = PixelBudget(10)
+        budget.acquire(50)
+        budget.release(50)
+        assert budget.in_flight == 0
+        with pytest.raises(ValueError):
+            PixelBudget(0)
+
+
+class TestRunPipeline:
+    """Test cases for run_pipeline."""
+    
+    def test_results(self, image_paths, tmp_path):
+        """Test that every image is processed once and failures are reported."""
+        output = tmp_path / "output"
+        results = run_pipeline(iter(image_paths), str(output), outputs='canny',
+                               canny_auto='median', readers=2, workers=2, writers=2)
+        
+        assert sorted(result['path'] for result in results) == sorted(image_paths)
+        failed = [result for result in results if result['error'] is not None]
+        assert [Path(result['path']).name for result in failed] == ['broken.png']
+        assert all(result['thresholds'] for result in results if result['error'] is None)
+        assert len(list(output.iterdir())) == 5
+    
+    def test_backpressure(self, image_paths, tmp_path, monkeypatch):
+        """Test that slow writes stall the readers at the pixel budget."""
+        from edge_detection import EdgeDetector
+        
+        save_results = EdgeDetector.save_results
+        
+        def slow_save(self, *args, **kwargs):
+            time.sleep(0.02)
+            return save_results(self, *args, **kwargs)
+        
+        monkeypatch.setattr(EdgeDetector, 'save_results', slow_save)
+        budget = PixelBudget(120 * 160)
+        results = run_pipeline(image_paths, str(tmp_path), outputs='canny', readers=3,
+                               workers=2, writers=1, budget=budget)
+        
+        assert len(results) == len(image_paths)
+        assert budget.peak <= 120 * 160
+        assert budget.in_flight == 0
+    
+    def test_failing_callback(self, image_paths, tmp_path):
+        """Test that an on_result error fails that image without hanging the run."""
+        def on_result(result):
+            if result['path'] == image_paths[1]:
+                raise OSError("manifest is read-only")
+        
+        budget = PixelBudget(120 * 160)
+        thread = threading.Thread(target=lambda: results.extend(run_pipeline(
+            image_paths, str(tmp_path), outputs='canny', readers=2, workers=1, writers=1,
+            budget=budget, on_result=on_result)))
+        results = []
+        thread.start()
+        thread.join(timeout=30)
+        
+        assert not thread.is_alive(), "Pipeline hung"
+        assert len(results) == len(image_paths)
+        errors = {result['path']: result['error'] for result in results if result['error']}
+        assert errors[image_paths[1]] == "on_result failed: manifest is read-only"
+        assert len(errors) == 2
+        assert budget.in_flight == 0
+    
+    def test_batch_process_pipeline(self, image_paths, tmp_path):
+        """Test the --pipeline mode of batch_process_images."""
+        summary = batch_process_images(str(Path(image_paths[0]).parent), str(tmp_path / "out"),
+                                       outputs='canny', workers=2, pipeline=True,
+                                       max_megapixels=0.05)
+        assert summary == {'total': 6, 'successful': 5, 'failed': 1, 'skipped': 0}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
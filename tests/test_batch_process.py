@@ -0,0 +1,106 @@
+"""
+Unit tests for batch processing
+"""
+
+import pytest
+import numpy as np
+import cv2
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from batch_process import batch_process_images, _run_engine, _process_folder
+from batch_report import RunReport
+
+
+@pytest.fixture
+def input_folder(tmp_path):
+    """Create a folder of small test images and one unreadable file."""
+    folder = tmp_path / "input"
+    folder.mkdir()
+    rng = np.random.default_rng(0)
+    for i in range(5):
+        image = rng.integers(0, 256, size=(40, 60, 3), dtype=np.uint8)
+        cv2.imwrite(str(folder / f"image_{i}.png"), image)
+    (folder / "broken.jpg").write_bytes(b'not an image')
+    return folder
+
+
+class TestBatchProcess:
+    """Test cases for batch_process_images."""
+    
+    @pytest.mark.parametrize('workers', [1, 2])
+    def test_summary(self, input_folder, tmp_path, workers):
+        """Test that results and failures are counted in serial and parallel runs."""
+        output = tmp_path / "output"
+        summary = batch_process_images(str(input_folder), str(output), outputs='canny',
+                                       workers=workers)
+        
+        assert summary == {'total': 6, 'successful': 5, 'failed': 1, 'skipped': 0}
+        assert sorted(path.name for path in output.glob('image_*')) == [
+            f"image_{i}_canny.png" for i in range(5)]
+    
+    def test_parallel_matches_serial(self, input_folder, tmp_path):
+        """Test that worker processes write the same results."""
+        for workers in (1, 3):
+            batch_process_images(str(input_folder), str(tmp_path / str(workers)),
+                                 outputs='canny,laplacian', canny_auto='otsu', bundle=True,
+                                 workers=workers)
+        
+        for i in range(5):
+            serial = np.load(tmp_path / "1" / f"image_{i}.npz")
+            parallel = np.load(tmp_path / "3" / f"image_{i}.npz")
+            assert serial.files == parallel.files
+            for name in serial.files:
+                np.testing.assert_array_equal(serial[name], parallel[name])
+    
+    def test_progress_lines(self, input_folder, tmp_path, capsys):
+        """Test that parallel progress is one whole line per image."""
+        batch_process_images(str(input_folder), str(tmp_path / "output"), outputs='canny',
+                             workers=2)
+        
+        lines = [line for line in capsys.readouterr().out.splitlines() if line.startswith('[')]
+        assert [line.split(']')[0] for line in lines] == [f"[{i}" for i in range(1, 7)]
+        # In discovery (name) order
+        assert lines[0].endswith('broken.jpg')
+    
+    @pytest.mark.parametrize('engine', [{'workers': 1}, {'workers': 2},
+                                        {'workers': 2, 'pipeline': True}])
+    def test_engine(self, input_folder, tmp_path, engine):
+        """Test each processing engine on its own, with a fixed list of images."""
+        images = sorted(path.name for path in input_folder.iterdir())
+        recorded = []
+        report = RunReport()
+        
+        counts = _run_engine(images, str(input_folder), str(tmp_path / "output"),
+                             record=lambda path, paths: recorded.append(path), report=report,
+                             outputs=('canny',), writer_threads=1, **engine)
+        
+        assert counts == (5, 1)
+        assert sorted(recorded) == [str(input_folder / f"image_{i}.png") for i in range(5)]
+        assert report.build()['failures'][0]['path'] == str(input_folder / "broken.jpg")
+    
+    def test_process_folder(self, input_folder, tmp_path):
+        """Test that discovery filtered by the manifest counts skipped images."""
+        engine = {'outputs': ('canny',), 'decode': 'color', 'canny_auto': None, 'bundle': False,
+                  'workers': 1}
+        discovery = {'include': ['image_*'], 'exclude': None, 'recursive': False}
+        output = str(tmp_path / "output")
+        
+        assert _process_folder(str(input_folder), output, engine, discovery) == {
+            'found': 5, 'skipped': 0, 'successful': 5, 'failed': 0}
+        assert _process_folder(str(input_folder), output, engine, discovery) == {
+            'found': 5, 'skipped': 5, 'successful': 0, 'failed': 0}
+        assert _process_folder(str(input_folder), output, engine, discovery,
+                               force=True)['successful'] == 5
+    
+    def test_invalid_workers(self, input_folder, tmp_path):
+        """Test that a worker count below one is rejected."""
+        with pytest.raises(ValueError):
+            batch_process_images(str(input_folder), str(tmp_path), workers=0)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,273 @@
+"""
+Unit tests for the batch work queue
+"""
+
+import pytest
+import numpy as np
+import cv2
+import json
+import os
+import threading
+import time
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from batch_queue import WorkQueue
+from batch_process import batch_process_images, _process_queue
+from batch_report import RunReport
+
+
+@pytest.fixture
+def queue_path(tmp_path):
+    """Path of a queue file on the 'shared volume'."""
+    return str(tmp_path / "shared" / "queue.sqlite")
+
+
+@pytest.fixture
+def input_folder(tmp_path):
+    """Create a folder tree with five images and one unreadable file."""
+    folder = tmp_path / "input"
+    image = np.full((24, 32, 3), 128, dtype=np.uint8)
+    cv2.rectangle(image, (8, 6), (24, 18), (255, 255, 255), -1)
+    for relative in ["a.png", "b.png", "day1/c.png", "day1/d.png", "day2/e.png"]:
+        path = folder / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        cv2.imwrite(str(path), image)
+    (folder / "day2" / "broken.jpg").write_bytes(b'not an image')
+    return folder
+
+
+def _paths(count):
+    return [f"image_{i:02d}.png" for i in range(count)]
+
+
+def _killed_populator(queue, paths, owner="dead:1"):
+    """Populate part of a queue, as a populator that is killed mid-discovery."""
+    def discovery():
+        yield from paths
+        raise KeyboardInterrupt  # The process dies here
+    
+    assert queue.start_populating(owner)
+    with pytest.raises(KeyboardInterrupt):
+        queue.populate(discovery(), owner, chunk_size=1)
+
+
+class TestWorkQueue:
+    """Test cases for WorkQueue."""
+    
+    def test_claim_and_finish(self, queue_path):
+        """Test chunked claims, outcomes and global progress."""
+        with WorkQueue(queue_path) as queue:
+            assert queue.start_populating("host-a:1")
+            assert not queue.start_populating("host-b:1")
+            assert queue.populate(_paths(5), "host-a:1", chunk_size=2) == 5
+            # Populating again only adds new images
+            assert queue.populate(_paths(6), "host-a:1", chunk_size=2) == 1
+            
+            chunk_id, paths = queue.claim("host-a:1")
+            assert paths == ["image_00.png", "image_01.png"]
+            queue.finish(paths[0], "host-a:1")
+            queue.finish(paths[1], "host-a:1", error="Could not read image")
+            
+            progress = queue.progress()
+            assert progress['total'] == 6
+            assert (progress['done'], progress['failed'], progress['pending']) == (1, 1, 4)
+            assert progress['populated']
+            
+            _, paths = queue.claim("host-b:1")
+            assert paths == ["image_02.png", "image_03.png"]
+            assert queue.progress()['workers'] == ["host-b:1"]
+    
+    def test_expired_lease(self, queue_path):
+        """Test that a crashed worker's chunk goes to another, minus finished images."""
+        with WorkQueue(queue_path, lease_seconds=0.05) as queue:
+            queue.populate(_paths(3), "host-a:1", chunk_size=3)
+            _, paths = queue.claim("host-a:1")
+            queue.finish(paths[0], "host-a:1")
+            assert queue.claim("host-b:1") is None
+            
+            time.sleep(0.1)
+            _, paths = queue.claim("host-b:1")
+            assert paths == ["image_01.png", "image_02.png"]
+            # The crashed worker's late outcome is ignored
+            assert not queue.finish(paths[0], "host-a:1", error="Interrupted")
+            assert queue.finish(paths[0], "host-b:1")
+            assert queue.progress()['failed'] == 0
+    
+    def test_wait(self, queue_path):
+        """Test waiting for other workers: until they finish, or until a lease expires."""
+        with WorkQueue(queue_path, lease_seconds=0.1) as queue:
+            assert not queue.populated()
+            queue.populate(_paths(2), "host-a:1", chunk_size=1)
+            assert queue.populated()
+            queue.claim("host-a:1")
+            _, (path,) = queue.claim("host-b:1")
+            # host-a stops responding; host-b finishes and waits
+            queue.finish(path, "host-b:1")
+            assert queue.wait("host-b:1", poll=0.01)
+            assert list(queue.work("host-b:1")) == ["image_00.png"]
+            queue.finish("image_00.png", "host-b:1")
+            assert not queue.wait("host-b:1", poll=0.01)
+            
+            stop = threading.Event()
+            stop.set()
+            queue.populate(_paths(3), "host-a:1")
+            queue.claim("host-a:1")
+            assert not queue.wait("host-b:1", poll=10, stop=stop)
+    
+    def test_renewal(self, queue_path):
+        """Test that a live worker keeps its chunk past the lease time."""
+        with WorkQueue(queue_path, lease_seconds=0.1) as queue:
+            queue.populate(_paths(2), "host-a:1", chunk_size=2)
+            queue.claim("host-a:1")
+            with queue.keep_alive("host-a:1", interval=0.02):
+                time.sleep(0.3)
+                assert queue.claim("host-b:1") is None
+            assert queue.renew("host-b:1") == 0
+    
+    def test_abandoned_chunk(self, queue_path):
+        """Test that a chunk claimed max_attempts times fails instead of looping."""
+        with WorkQueue(queue_path, lease_seconds=0.02, max_attempts=2) as queue:
+            queue.populate(_paths(2), "host-a:1", chunk_size=2)
+            for _ in range(2):
+                assert queue.claim("host-a:1") is not None
+                time.sleep(0.05)
+            
+            assert queue.claim("host-a:1") is None
+            progress = queue.progress()
+            assert progress['failed'] == 2 and progress['pending'] == 0
+    
+    def test_populator_killed(self, queue_path):
+        """Test that a worker resumes discovery when the populator dies mid-run."""
+        with WorkQueue(queue_path, lease_seconds=0.1) as queue:
+            _killed_populator(queue, _paths(2))
+            assert not queue.populator_stale()
+            
+            # Without a way to populate, the worker fails instead of polling forever
+            claimed = []
+            with pytest.raises(RuntimeError, match="stopped responding"):
+                for path in queue.work("host-b:1", poll=0.01):
+                    claimed.append(path)
+                    queue.finish(path, "host-b:1")
+            assert claimed == _paths(2)
+            
+            resumed = []
+            
+            def populate():
+                resumed.append(True)
+                queue.populate(_paths(5), "host-b:1")
+            
+            for path in queue.work("host-b:1", poll=0.01, populate=populate):
+                claimed.append(path)
+                queue.finish(path, "host-b:1")
+            assert sorted(claimed) == _paths(5)
+            assert resumed == [True]
+            assert queue.progress()['populated']
+    
+    def test_populator_heartbeat(self, queue_path):
+        """Test that a live populator's lease is renewed even between chunks."""
+        with WorkQueue(queue_path, lease_seconds=0.1) as queue:
+            assert queue.start_populating("host-a:1")
+            with queue.keep_alive("host-a:1", interval=0.02):
+                time.sleep(0.3)
+                assert not queue.populator_stale()
+            time.sleep(0.15)
+            assert queue.populator_stale()
+    
+    def test_hosts_share_work(self, queue_path):
+        """Test that workers on separate connections split the queue between them."""
+        with WorkQueue(queue_path) as queue:
+            queue.populate(_paths(40), "host-a:1", chunk_size=3)
+        
+        processed = {}
+        
+        def worker(owner):
+            with WorkQueue(queue_path) as queue:
+                processed[owner] = list(queue.work(owner, poll=0.01))
+                for path in processed[owner]:
+                    queue.finish(path, owner)
+        
+        threads = [threading.Thread(target=worker, args=(f"host-{i}:1",)) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        everything = [path for paths in processed.values() for path in paths]
+        assert sorted(everything) == _paths(40)
+        with WorkQueue(queue_path) as queue:
+            assert queue.progress()['done'] == 40
+
+
+class TestQueuedBatch:
+    """Test batch runs that take their images from a work queue."""
+    
+    @pytest.mark.parametrize('engine', [{'workers': 1}, {'workers': 2},
+                                        {'workers': 2, 'pipeline': True}])
+    def test_queued_batch(self, input_folder, tmp_path, queue_path, engine):
+        """Test that a run drains the queue and a second run finds nothing left."""
+        output = tmp_path / "output"
+        summary = batch_process_images(str(input_folder), str(output), outputs='canny',
+                                       queue_path=queue_path, chunk_size=2, **engine)
+        
+        assert summary == {'total': 6, 'successful': 5, 'failed': 1, 'skipped': 0}
+        assert len(list(output.rglob('*_canny.png'))) == 5
+        assert not (output / '.edge_manifest.sqlite').exists()
+        report, = output.glob('batch_report_*.json')
+        assert json.loads(report.read_text())['settings']['queue'] == queue_path
+        
+        with WorkQueue(queue_path) as queue:
+            progress = queue.progress()
+        assert (progress['done'], progress['failed'], progress['pending']) == (5, 1, 0)
+        
+        summary = batch_process_images(str(input_folder), str(output), outputs='canny',
+                                       queue_path=queue_path, **engine)
+        assert summary['total'] == 0
+    
+    def test_process_queue(self, input_folder, tmp_path, queue_path):
+        """Test the queue engine on its own: failures the report collects reach the queue."""
+        report = RunReport()
+        summary = _process_queue(queue_path, "host-a:1", str(input_folder),
+                                 str(tmp_path / "output"), {'outputs': ('canny',)},
+                                 {'include': None, 'exclude': None, 'recursive': True},
+                                 report, chunk_size=4)
+        
+        progress = summary.pop('progress')
+        assert summary == {'found': 6, 'skipped': 0, 'successful': 5, 'failed': 1}
+        assert (progress['done'], progress['failed'], progress['pending']) == (5, 1, 0)
+        assert report.build()['images']['failed'] == 1
+    
+    def test_takes_over_crashed_host(self, input_folder, tmp_path, queue_path):
+        """Test that a run finishes the chunk a crashed host had claimed."""
+        with WorkQueue(queue_path, lease_seconds=0.01) as queue:
+            queue.populate(["a.png", "b.png"], "crashed:1", chunk_size=2)
+            queue.claim("crashed:1")
+            queue.finish("a.png", "crashed:1")
+        time.sleep(0.05)
+        
+        summary = batch_process_images(str(input_folder), str(tmp_path / "output"),
+                                       outputs='canny', workers=1, queue_path=queue_path)
+        
+        assert summary['total'] == 1
+        assert os.path.exists(tmp_path / "output" / "b_canny.png")
+    
+    def test_takes_over_killed_populator(self, input_folder, tmp_path, queue_path):
+        """Test that a run finishes discovery for a populator killed mid-run."""
+        with WorkQueue(queue_path, lease_seconds=0.5) as queue:
+            _killed_populator(queue, ["a.png"])
+        
+        summary = batch_process_images(str(input_folder), str(tmp_path / "output"),
+                                       outputs='canny', workers=1, queue_path=queue_path,
+                                       lease_seconds=0.5)
+        
+        assert summary == {'total': 6, 'successful': 5, 'failed': 1, 'skipped': 0}
+        with WorkQueue(queue_path) as queue:
+            progress = queue.progress()
+        assert progress['populated'] and progress['pending'] == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,104 @@
+"""
+Unit tests for batch run reports
+"""
+
+import pytest
+import numpy as np
+import cv2
+import json
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from batch_report import RunReport
+from batch_process import batch_process_images
+
+
+@pytest.fixture
+def input_folder(tmp_path):
+    """Create a folder with images of two sizes and one unreadable file."""
+    folder = tmp_path / "input"
+    folder.mkdir()
+    rng = np.random.default_rng(3)
+    for i, shape in enumerate([(40, 50), (40, 50), (100, 200)]):
+        cv2.imwrite(str(folder / f"image_{i}.png"),
+                    rng.integers(0, 256, size=(*shape, 3), dtype=np.uint8))
+    (folder / "broken.jpg").write_bytes(b'not an image')
+    return folder
+
+
+class TestRunReport:
+    """Test cases for RunReport."""
+    
+    def test_build(self, tmp_path):
+        """Test percentiles, throughput, bytes and the slowest list."""
+        report = RunReport({'engine': 'serial'})
+        for i in range(100):
+            report.add(f"image_{i}", pixels=1_000_000,
+                       timings={'decode': 1.0, 'total': float(i + 1)}, bytes_read=50,
+                       bytes_written=100)
+        report.add("broken", error="Could not read image", bytes_read=10)
+        report.fail("image_0", "write failed")
+        
+        run = report.build(skipped=5, slowest=3)
+        
+        assert run['images'] == {'total': 106, 'successful': 99, 'failed': 2, 'skipped': 5}
+        # image_0 failed after it was timed, so its timing still counts
+        assert run['latency_ms']['total']['p50'] == pytest.approx(50.5)
+        assert run['latency_ms']['total']['p99'] == pytest.approx(99.01)
+        assert run['latency_ms']['decode']['max'] == 1.0
+        assert [entry['path'] for entry in run['slowest']] == ['image_99', 'image_98', 'image_97']
+        assert run['bytes'] == {'read': 100 * 50 + 10, 'written': 100 * 100}
+        # One megapixel per image, image_0's included
+        assert run['throughput']['megapixels_per_s'] == pytest.approx(
+            run['throughput']['images_per_s'] * 100 / 99, rel=0.01)
+        assert {entry['path'] for entry in run['failures']} == {'broken', 'image_0'}
+        json.dumps(run)
+    
+    def test_bounded(self):
+        """Test that a long run keeps a bounded sample, slowest list and failure list."""
+        report = RunReport(slowest=5, samples=1000, max_failures=3)
+        rng = np.random.default_rng(0)
+        latencies = rng.uniform(0, 100, size=20_000)
+        for i, ms in enumerate(latencies):
+            report.add(f"image_{i}", pixels=10, timings={'total': float(ms)})
+        for i in range(10):
+            report.add(f"broken_{i}", error="Could not read image")
+        
+        assert len(report._stages['total'][3]) == 1000 and len(report._slowest) == 5
+        run = report.build()
+        assert run['images']['successful'] == 20_000 and run['images']['failed'] == 10
+        assert len(run['failures']) == 3
+        assert run['latency_ms']['total']['p50'] == pytest.approx(50, abs=5)
+        assert run['latency_ms']['total']['mean'] == pytest.approx(latencies.mean(), abs=1e-3)
+        assert run['latency_ms']['total']['max'] == pytest.approx(latencies.max(), abs=1e-3)
+        slowest = sorted(latencies, reverse=True)[:5]
+        assert [entry['latency_ms'] for entry in run['slowest']] == pytest.approx(slowest,
+                                                                                   abs=1e-3)
+    
+    @pytest.mark.parametrize('engine', [{'workers': 1}, {'workers': 2},
+                                        {'workers': 2, 'pipeline': True}])
+    def test_batch_report(self, input_folder, tmp_path, engine):
+        """Test the report written by every batch engine."""
+        output = tmp_path / "output"
+        batch_process_images(str(input_folder), str(output), outputs='canny', slowest=2,
+                             **engine)
+        
+        run = json.loads((output / "batch_report.json").read_text())
+        assert run['images'] == {'total': 4, 'successful': 3, 'failed': 1, 'skipped': 0}
+        assert run['throughput']['images_per_s'] > 0
+        assert {'decode', 'canny', 'total'} <= set(run['latency_ms'])
+        # The unreadable file is not counted
+        assert run['bytes']['read'] == sum(path.stat().st_size
+                                           for path in input_folder.glob('image_*.png'))
+        assert run['bytes']['written'] == sum(path.stat().st_size
+                                              for path in output.glob('*_canny.png'))
+        assert len(run['slowest']) == 2
+        assert run['peak_rss_bytes']['self'] > 0
+        assert run['settings']['outputs'] == ['canny']
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
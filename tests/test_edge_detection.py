@@ -12,7 +12,8 @@ from pathlib import Path
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from edge_detection import EdgeDetector
+from edge_detection import (EdgeDetector, Workspace, OUTPUTS, DEFAULT_OUTPUTS, parse_outputs,
+                            auto_canny_thresholds)
 
 
 @pytest.fixture
@@ -35,6 +36,67 @@ class TestEdgeDetector:
         assert detector.original_image is not None
         assert detector.original_rgb is not None
     
+    def test_in_memory_constructors(self, test_image_path):
+        """Test from_array, from_bytes and from_stream match loading from disk."""
+        import io
+        
+        from_path = EdgeDetector(test_image_path, outputs={'canny'})
+        with open(test_image_path, 'rb') as f:
+            data = f.read()
+        
+        detectors = [
+            EdgeDetector.from_array(cv2.imread(test_image_path), outputs={'canny'}),
+            EdgeDetector.from_bytes(data, outputs={'canny'}, name='upload.jpg'),
+            EdgeDetector.from_stream(io.BytesIO(data), outputs={'canny'}),
+        ]
+        for detector in detectors:
+            np.testing.assert_array_equal(detector.compute()['canny'],
+                                          from_path.compute()['canny'])
+        assert detectors[1].image_path == 'upload.jpg'
+    
+    def test_from_array_grayscale(self):
+        """Test that a 2-D array is used directly as the grayscale stage."""
+        gray = np.zeros((40, 40), dtype=np.uint8)
+        gray[10:30, 10:30] = 255
+        detector = EdgeDetector.from_array(gray)
+        
+        assert detector.get_output('grayscale') is gray
+        assert detector.original_rgb.shape == (40, 40, 3)
+    
+    def test_invalid_in_memory_input(self):
+        """Test that undecodable bytes and unsupported arrays are rejected."""
+        with pytest.raises(ValueError):
+            EdgeDetector.from_bytes(b'not an image')
+        with pytest.raises(ValueError):
+            EdgeDetector.from_array(np.zeros((10, 10, 3), dtype=np.float32))
+    
+    def test_decode_modes(self, test_image_path):
+        """Test grayscale and DCT-scaled decoding."""
+        gray = EdgeDetector(test_image_path, decode='grayscale')
+        assert gray.original_image.shape == (100, 100)
+        assert gray.get_output('grayscale') is gray.original_image
+        
+        reduced = EdgeDetector(test_image_path, decode='reduced_4')
+        assert reduced.original_image.shape == (25, 25)
+        assert reduced.compute({'canny'})['canny'].shape == (25, 25)
+        
+        with open(test_image_path, 'rb') as f:
+            from_bytes = EdgeDetector.from_bytes(f.read(), decode='reduced_2')
+        assert from_bytes.original_image.shape == (50, 50)
+        
+        with pytest.raises(ValueError):
+            EdgeDetector(test_image_path, decode='reduced_3')
+    
+    def test_original_rgb_is_lazy(self, test_image_path):
+        """Test that the RGB copy is only built when asked for."""
+        detector = EdgeDetector(test_image_path)
+        detector.compute()
+        assert detector._original_rgb is None
+        
+        rgb = detector.original_rgb
+        np.testing.assert_array_equal(rgb, detector.original_image[:, :, ::-1])
+        assert detector.original_rgb is rgb
+    
     def test_invalid_image_path(self):
         """Test with invalid image path."""
         with pytest.raises(ValueError):
@@ -101,7 +163,8 @@ class TestEdgeDetector:
         # Check if files were created
         assert os.path.exists(f"{output_dir}/test_image_grayscale.jpg")
         assert os.path.exists(f"{output_dir}/test_image_sobel_x.jpg")
-        assert os.path.exists(f"{output_dir}/test_image_canny.jpg")
+        # Binary masks are saved as lossless PNG
+        assert os.path.exists(f"{output_dir}/test_image_canny.png")
     
     def test_complete_pipeline(self, test_image_path, tmp_path):
         """Test complete processing pipeline."""
@@ -117,6 +180,236 @@ class TestEdgeDetector:
         assert detector.sobel_combined is not None
         assert detector.laplacian is not None
         assert detector.canny is not None
+    
+    
+    def test_requested_outputs_only(self, test_image_path):
+        """Test that only the dependency chain of requested outputs is computed."""
+        detector = EdgeDetector(test_image_path, outputs={'canny'})
+        results = detector.compute()
+        
+        assert list(results) == ['canny']
+        assert detector.blurred_image is not None
+        assert detector.sobel_x is None
+        assert detector.sobel_combined is None
+        assert detector.laplacian is None
+    
+    def test_intermediates_are_memoized(self, test_image_path):
+        """Test that later requests reuse already computed stages."""
+        detector = EdgeDetector(test_image_path)
+        detector.compute({'sobel_x'})
+        blurred = detector.blurred_image
+        
+        detector.compute({'laplacian'})
+        assert detector.blurred_image is blurred
+        assert detector.sobel_y is None
+    
+    def test_param_change_invalidates_dependents(self, test_image_path):
+        """Test that changing a parameter recomputes only affected stages."""
+        detector = EdgeDetector(test_image_path)
+        detector.compute({'canny', 'laplacian'})
+        gray = detector.gray_image
+        laplacian = detector.laplacian
+        
+        detector.compute({'canny', 'laplacian'}, blur_kernel_size=(7, 7))
+        assert detector.gray_image is gray
+        assert detector.laplacian is not laplacian
+        
+        canny = detector.canny
+        detector.compute({'canny', 'laplacian'}, canny_threshold1=10)
+        assert detector.canny is not canny
+        assert detector.params['canny_threshold1'] == 10
+    
+    def test_lazy_matches_eager(self, test_image_path):
+        """Test that demand-driven results match the step-by-step pipeline."""
+        eager = EdgeDetector(test_image_path)
+        eager.preprocess()
+        eager.apply_sobel()
+        eager.apply_laplacian()
+        eager.apply_canny()
+        
+        lazy = EdgeDetector(test_image_path)
+        for name, image in lazy.compute(OUTPUTS).items():
+            np.testing.assert_array_equal(image, eager.get_output(name))
+    
+    def test_shared_gradients_feed_canny(self, test_image_path):
+        """Test that Canny from shared gradients matches cv2.Canny on the image."""
+        detector = EdgeDetector(test_image_path, outputs={'canny'})
+        detector.compute(canny_threshold1=30, canny_threshold2=90)
+        
+        assert detector.gradients[0].dtype == np.int16
+        expected = cv2.Canny(detector.blurred_image, 30, 90)
+        np.testing.assert_array_equal(detector.canny, expected)
+    
+    def test_magnitude_and_orientation(self, test_image_path):
+        """Test the L2 magnitude and orientation outputs."""
+        detector = EdgeDetector(test_image_path, outputs={'magnitude', 'orientation'})
+        detector.compute()
+        
+        dx, dy = (g.astype(np.float64) for g in detector.gradients)
+        expected = np.clip(np.rint(np.hypot(dx, dy)), 0, 255)
+        assert np.abs(detector.magnitude.astype(np.float64) - expected).max() <= 1
+        assert detector.orientation.dtype == np.uint8
+        assert detector.orientation.max() <= 180
+        assert detector.sobel_x is None
+    
+    def test_precision_modes_agree(self, test_image_path):
+        """Test that int16, float32 and float64 derivatives give the same outputs."""
+        outputs = {'sobel_x', 'sobel_y', 'laplacian', 'canny'}
+        results = {}
+        for precision in ('int16', 'float32', 'float64'):
+            detector = EdgeDetector(test_image_path, outputs=outputs)
+            results[precision] = detector.compute(precision=precision)
+        
+        assert EdgeDetector(test_image_path).compute({'sobel_x'})['sobel_x'].dtype == np.uint8
+        for name in outputs:
+            np.testing.assert_array_equal(results['int16'][name], results['float32'][name])
+            np.testing.assert_array_equal(results['int16'][name], results['float64'][name])
+    
+    def test_derivatives_saturate(self):
+        """Test that strong responses clamp to 255 instead of wrapping."""
+        image = np.zeros((20, 20), dtype=np.uint8)
+        image[:, 10:] = 255
+        detector = EdgeDetector.from_array(image, outputs={'sobel_x', 'laplacian'})
+        results = detector.compute(blur_kernel_size=(1, 1))
+        
+        # 3x3 Sobel response to a 0->255 step is 1020, which used to wrap to 252
+        assert results['sobel_x'].max() == 255
+        assert results['laplacian'].max() == 255
+    
+    def test_large_aperture_matches_float(self):
+        """Test that ksize 7, which overflows int16, matches float precision."""
+        # Steep edge at a shallow angle: dx and dy both overflow int16, unequally
+        image = np.zeros((64, 64), dtype=np.uint8)
+        cv2.fillPoly(image, [np.array([[0, 64], [64, 40], [64, 64]])], 255)
+        outputs = {'sobel_x', 'sobel_y', 'magnitude', 'orientation', 'laplacian'}
+        params = dict(blur_kernel_size=(1, 1), sobel_kernel=7, laplacian_kernel=7)
+        
+        results = {precision: EdgeDetector.from_array(image, outputs=outputs).compute(
+                       precision=precision, **params)
+                   for precision in ('int16', 'float32', 'float64')}
+        
+        for name in outputs:
+            np.testing.assert_array_equal(results['int16'][name], results['float64'][name])
+            np.testing.assert_array_equal(results['int16'][name], results['float32'][name])
+    
+    def test_invalid_precision(self, test_image_path):
+        """Test that unknown precision modes are rejected."""
+        detector = EdgeDetector(test_image_path)
+        with pytest.raises(ValueError):
+            detector.compute(precision='int8')
+    
+    def test_workspace_matches_fresh_buffers(self, test_image_path):
+        """Test that results computed into a workspace match freshly allocated ones."""
+        workspace = Workspace()
+        for precision in ('int16', 'float32'):
+            expected = EdgeDetector(test_image_path, outputs=OUTPUTS).compute(precision=precision)
+            detector = EdgeDetector(test_image_path, outputs=OUTPUTS, workspace=workspace)
+            results = detector.compute(precision=precision)
+            for name in OUTPUTS:
+                np.testing.assert_array_equal(results[name], expected[name])
+    
+    def test_workspace_reuses_buffers(self, test_image_path):
+        """Test that a second same-size image allocates no new buffers."""
+        workspace = Workspace()
+        first = EdgeDetector(test_image_path, outputs=OUTPUTS, workspace=workspace)
+        canny = first.compute()['canny']
+        allocations = workspace.allocations
+        assert allocations > 0
+        
+        second = EdgeDetector(test_image_path, outputs=OUTPUTS, workspace=workspace)
+        assert second.compute()['canny'] is canny
+        assert workspace.allocations == allocations
+    
+    def test_workspace_bounded_for_mixed_sizes(self):
+        """Test that a workspace holds one image's buffers, whatever sizes it has seen."""
+        workspace = Workspace()
+        rng = np.random.default_rng(8)
+        for shape in [(120, 160), (300, 200), (64, 64), (300, 200), (90, 250)]:
+            image = rng.integers(0, 256, size=(*shape, 3), dtype=np.uint8)
+            fresh = Workspace()
+            EdgeDetector.from_array(image, outputs=OUTPUTS, workspace=fresh,
+                                    verbose=False).compute()
+            result = EdgeDetector.from_array(image, outputs=OUTPUTS, workspace=workspace,
+                                             verbose=False).compute()
+            assert result['canny'].shape == shape
+            assert workspace.nbytes == fresh.nbytes
+    
+    def test_canny_sweep(self, test_image_path):
+        """Test that a threshold sweep matches separate cv2.Canny calls."""
+        detector = EdgeDetector(test_image_path)
+        thresholds = [(50, 150), (10, 30), (30, 10), (80, 80), (20.7, 200)]
+        masks, densities = detector.canny_sweep(thresholds)
+        
+        blurred = detector.get_output('blurred')
+        assert masks.shape == (len(thresholds),) + blurred.shape
+        for mask, density, (t1, t2) in zip(masks, densities, thresholds):
+            expected = cv2.Canny(blurred, t1, t2)
+            np.testing.assert_array_equal(mask, expected)
+            assert density == pytest.approx(np.mean(expected > 0))
+        
+        with pytest.raises(ValueError):
+            detector.canny_sweep([])
+    
+    def test_auto_canny_thresholds(self):
+        """Test median and Otsu thresholds derived from a histogram."""
+        image = np.full((40, 40), 60, dtype=np.uint8)
+        image[:, 20:] = 180
+        histogram = cv2.calcHist([image], [0], None, [256], [0, 256])
+        otsu, _ = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        
+        assert auto_canny_thresholds(histogram, 'otsu') == (int(otsu) // 2, int(otsu))
+        assert auto_canny_thresholds(histogram, 'median', sigma=0.5) == (30, 90)
+        with pytest.raises(ValueError):
+            auto_canny_thresholds(histogram, 'mean')
+    
+    def test_auto_canny_in_pipeline(self, test_image_path):
+        """Test that auto thresholds are applied, reported and invalidated."""
+        detector = EdgeDetector(test_image_path, outputs={'canny'})
+        canny = detector.compute(canny_auto='median')['canny']
+        threshold1, threshold2 = detector.canny_thresholds
+        
+        histogram = cv2.calcHist([detector.blurred_image], [0], None, [256], [0, 256])
+        assert (threshold1, threshold2) == auto_canny_thresholds(histogram, 'median')
+        np.testing.assert_array_equal(canny, cv2.Canny(detector.blurred_image,
+                                                       threshold1, threshold2))
+        
+        detector.compute(canny_auto=None)
+        assert detector.canny_thresholds == (50, 150)
+        with pytest.raises(ValueError):
+            detector.compute(canny_auto='mean')
+    
+    def test_stage_timings(self, test_image_path, tmp_path):
+        """Test per-stage timings, the hook and silent mode."""
+        calls = []
+        detector = EdgeDetector(test_image_path, outputs={'canny'}, verbose=False,
+                                hook=lambda stage, elapsed: calls.append((stage, elapsed)))
+        detector.apply_canny()
+        detector.save_results(str(tmp_path))
+        
+        for stage in ('decode', 'grayscale', 'blurred', 'canny', 'encode', 'write'):
+            assert detector.timings[stage] >= 0
+        assert [stage for stage, _ in calls] == list(detector.timings)
+        summary = detector.timing_summary()
+        assert summary['total'] == pytest.approx(sum(detector.timings.values()) / 1e6)
+    
+    def test_silent_mode(self, test_image_path, capsys):
+        """Test that silent detectors print nothing."""
+        detector = EdgeDetector(test_image_path, verbose=False)
+        detector.preprocess()
+        detector.apply_sobel()
+        assert capsys.readouterr().out == ''
+        
+        EdgeDetector(test_image_path).preprocess()
+        assert 'Preprocessing' in capsys.readouterr().out
+    
+    def test_parse_outputs(self):
+        """Test output name parsing and validation."""
+        assert parse_outputs(None) == DEFAULT_OUTPUTS
+        assert parse_outputs('canny, sobel_x') == ('sobel_x', 'canny')
+        with pytest.raises(ValueError):
+            parse_outputs({'hough'})
+        with pytest.raises(ValueError):
+            parse_outputs('')
 
 
 if __name__ == "__main__":
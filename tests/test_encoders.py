@@ -0,0 +1,80 @@
+"""
+Unit tests for the result image encoders
+"""
+
+import pytest
+import numpy as np
+import cv2
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from edge_detection import EdgeDetector
+from encoders import ImageEncoder
+
+
+@pytest.fixture
+def detector():
+    """Create a detector on a synthetic image with a few strong edges."""
+    image = np.zeros((120, 160, 3), dtype=np.uint8)
+    cv2.rectangle(image, (20, 20), (140, 100), (255, 255, 255), -1)
+    cv2.circle(image, (80, 60), 25, (64, 64, 64), -1)
+    return EdgeDetector.from_array(image, name='sample', verbose=False)
+
+
+class TestImageEncoder:
+    """Test cases for ImageEncoder."""
+    
+    def test_extensions(self):
+        """Test that masks use the mask format and other outputs the main format."""
+        encoder = ImageEncoder(format='webp')
+        assert encoder.extension('grayscale') == '.webp'
+        assert encoder.extension('canny') == '.png'
+        assert encoder.mimetype('canny') == 'image/png'
+        assert ImageEncoder(format='jpeg', mask_format=None).extension('canny') == '.jpg'
+    
+    def test_invalid_settings(self):
+        """Test that unknown formats and compression levels are rejected."""
+        with pytest.raises(ValueError):
+            ImageEncoder(format='gif')
+        with pytest.raises(ValueError):
+            ImageEncoder(mask_format='bmp')
+        with pytest.raises(ValueError):
+            ImageEncoder(png_compression=10)
+    
+    @pytest.mark.parametrize('mask_format', ['png', 'webp'])
+    def test_mask_is_lossless(self, detector, mask_format):
+        """Test that binary masks round-trip exactly."""
+        canny = detector.compute(outputs={'canny'})['canny']
+        encoded = ImageEncoder(mask_format=mask_format).encode(canny, 'canny')
+        np.testing.assert_array_equal(cv2.imdecode(encoded, cv2.IMREAD_GRAYSCALE), canny)
+    
+    def test_quality(self, detector):
+        """Test that a lower JPEG quality gives a smaller file."""
+        gray = detector.compute(outputs={'grayscale'})['grayscale']
+        high = ImageEncoder(quality=95).encode(gray, 'grayscale')
+        low = ImageEncoder(quality=30).encode(gray, 'grayscale')
+        assert low.size < high.size
+    
+    def test_save_results_formats(self, detector, tmp_path):
+        """Test that save_results follows the encoder's formats."""
+        paths = detector.save_results(str(tmp_path), encoder=ImageEncoder(format='png'))
+        
+        assert {Path(path).suffix for path in paths.values()} == {'.png'}
+        for name, image in detector.compute().items():
+            np.testing.assert_array_equal(cv2.imread(paths[name], cv2.IMREAD_GRAYSCALE), image)
+    
+    def test_from_config(self):
+        """Test that the config's output section is honoured."""
+        from config_manager import ConfigManager
+        
+        config = ConfigManager()
+        encoder = ImageEncoder.from_config(config)
+        assert encoder.format == config.get('output.format')
+        assert encoder.quality == config.get('output.quality')
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,218 @@
+"""
+Unit tests for the asynchronous job store and runner
+"""
+
+import pytest
+import os
+import threading
+import time
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from job_store import JobStore, JobRunner
+
+
+@pytest.fixture
+def store(tmp_path):
+    """Empty job store."""
+    with JobStore(str(tmp_path / "jobs"), lease_seconds=0.1) as store:
+        yield store
+
+
+def _uploads(count):
+    return [(f"image_{i}.png", f"data {i}".encode()) for i in range(count)]
+
+
+def _handler(data, filename, settings):
+    """Handler that 'encodes' the upload as its layers."""
+    if data == b'bad':
+        raise ValueError("Could not read image")
+    return {name: data.upper() for name in settings['layers']}, {'size': len(data)}
+
+
+def _wait(store, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while store.status(job_id)['state'] in ('queued', 'running'):
+        assert time.time() < deadline, "Job did not finish"
+        time.sleep(0.01)
+    return store.status(job_id)
+
+
+class TestJobStore:
+    """Test cases for JobStore."""
+    
+    def test_lifecycle(self, store):
+        """Test a job from creation to results."""
+        job_id = store.create(_uploads(2), {'layers': ['canny']})
+        status = store.status(job_id)
+        assert (status['state'], status['total'], status['progress']) == ('queued', 2, 0)
+        
+        claimed_id, settings = store.claim("host:1:0")
+        assert (claimed_id, settings) == (job_id, {'layers': ['canny']})
+        assert store.claim("host:2:0") is None
+        
+        (index, filename, path), _ = store.pending(job_id)
+        assert filename == "image_0.png" and open(path, 'rb').read() == b'data 0'
+        assert store.finish_file(job_id, index, "host:1:0", {'canny': b'EDGES'}, {'size': 6})
+        assert not os.path.exists(path)
+        assert store.status(job_id)['progress'] == 0.5
+        
+        store.finish_file(job_id, 1, "host:1:0", error="Could not read image")
+        store.complete(job_id, "host:1:0")
+        
+        status = store.status(job_id)
+        assert (status['state'], status['completed'], status['failed']) == ('done', 2, 1)
+        assert status['expires'] == status['finished'] + store.retention_seconds
+        first, second = store.results(job_id)
+        assert first['layers'] == ['canny'] and first['details'] == {'size': 6}
+        assert store.read_layer(job_id, 0, 'canny') == b'EDGES'
+        assert second['state'] == 'failed' and second['error'] == "Could not read image"
+        with pytest.raises(KeyError):
+            store.read_layer(job_id, 1, 'canny')
+    
+    def test_resume_after_worker_dies(self, store):
+        """Test that a job whose lease expires resumes on another worker."""
+        job_id = store.create(_uploads(3), {'layers': ['canny']})
+        store.claim("dead:1:0")
+        store.finish_file(job_id, 0, "dead:1:0", {'canny': b'A'})
+        time.sleep(0.15)
+        
+        assert store.claim("live:1:0")[0] == job_id
+        assert [index for index, _, _ in store.pending(job_id)] == [1, 2]
+        # The old worker has lost the job and cannot record into it
+        assert not store.finish_file(job_id, 1, "dead:1:0", {'canny': b'B'})
+        assert store.status(job_id)['completed'] == 1
+    
+    def test_survives_reopen(self, tmp_path, store):
+        """Test that jobs are still there after the store is reopened (a restart)."""
+        job_id = store.create(_uploads(1), {'layers': ['canny']})
+        with JobStore(store.folder) as reopened:
+            assert reopened.status(job_id)['state'] == 'queued'
+            assert reopened.claim("host:1:0")[0] == job_id
+    
+    def test_abandoned_job(self, tmp_path):
+        """Test that a job claimed max_attempts times fails instead of looping."""
+        with JobStore(str(tmp_path), lease_seconds=0.02, max_attempts=2) as store:
+            job_id = store.create(_uploads(1), {})
+            for _ in range(2):
+                assert store.claim("host:1:0") is not None
+                time.sleep(0.05)
+            
+            assert store.claim("host:1:0") is None
+            status = store.status(job_id)
+            assert status['state'] == 'failed' and 'Abandoned' in status['error']
+    
+    def test_expire(self, tmp_path):
+        """Test that finished jobs are deleted after the retention period."""
+        with JobStore(str(tmp_path), retention_seconds=0.05) as store:
+            done = store.create(_uploads(1), {})
+            store.claim("host:1:0")
+            store.complete(done, "host:1:0")
+            queued = store.create(_uploads(1), {})
+            time.sleep(0.1)
+            
+            # Gone as soon as it expires, even before expire() deletes it
+            assert store.status(done) is None and store.results(done) == []
+            with pytest.raises(KeyError):
+                store.read_layer(done, 0, 'canny')
+            assert store.expire() == 1
+            assert store.status(done) is None
+            assert not os.path.exists(os.path.join(store.folder, done))
+            assert store.status(queued)['state'] == 'queued'
+
+
+class TestJobRunner:
+    """Test cases for JobRunner."""
+    
+    def test_runs_jobs(self, store):
+        """Test that jobs from several submitters are processed in the background."""
+        runner = JobRunner(store, _handler, workers=2, poll=0.01)
+        runner.start()
+        try:
+            jobs = [store.create(_uploads(3) + [("broken.jpg", b'bad')], {'layers': ['a', 'b']})
+                    for _ in range(3)]
+            for job_id in jobs:
+                status = _wait(store, job_id)
+                assert (status['state'], status['completed'], status['failed']) == ('done', 4, 1)
+        finally:
+            runner.stop()
+        
+        results = store.results(jobs[0])
+        assert store.read_layer(jobs[0], 2, 'b') == b'DATA 2'
+        assert results[3]['error'] == "Could not read image"
+    
+    def test_worker_survives_failed_job(self, store):
+        """Test that a job whose run raises is failed and the worker carries on."""
+        runner = JobRunner(store, _handler, workers=1, poll=0.01)
+        run = runner.run
+        
+        def run_once_broken(job_id, settings, owner):
+            if settings.get('broken'):
+                raise RuntimeError("Handler setup failed")
+            run(job_id, settings, owner)
+        
+        runner.run = run_once_broken
+        runner.start()
+        try:
+            broken = store.create(_uploads(1), {'layers': ['a'], 'broken': True})
+            status = _wait(store, broken)
+            assert (status['state'], status['error']) == ('failed', "Handler setup failed")
+            assert _wait(store, store.create(_uploads(2), {'layers': ['a']}))['completed'] == 2
+        finally:
+            runner.stop()
+    
+    def test_unstored_results_fail_the_upload(self, store, monkeypatch):
+        """Test that an upload whose results cannot be written is recorded as failed."""
+        finish_file = store.finish_file
+        
+        def disk_full(job_id, index, owner, layers=None, details=None, error=None):
+            if layers and index == 0:
+                raise OSError("No space left on device")
+            return finish_file(job_id, index, owner, layers, details, error)
+        
+        monkeypatch.setattr(store, 'finish_file', disk_full)
+        runner = JobRunner(store, _handler, workers=1, poll=0.01)
+        runner.start()
+        try:
+            job_id = store.create(_uploads(2), {'layers': ['a']})
+            status = _wait(store, job_id)
+        finally:
+            runner.stop()
+        
+        assert (status['state'], status['completed'], status['failed']) == ('done', 2, 1)
+        assert store.results(job_id)[0]['error'] == "Could not store results: No space left on device"
+    
+    def test_stop_leaves_job_for_another_worker(self, store):
+        """Test that a stopped runner's job is finished by another runner."""
+        release = threading.Event()
+        
+        def slow(data, filename, settings):
+            release.wait(5)
+            return _handler(data, filename, settings)
+        
+        job_id = store.create(_uploads(2), {'layers': ['a']})
+        first = JobRunner(store, slow, workers=1, poll=0.01)
+        first.start()
+        while store.status(job_id)['state'] != 'running':
+            time.sleep(0.01)
+        stopper = threading.Thread(target=first.stop)
+        stopper.start()
+        while not first._stop.is_set():
+            time.sleep(0.01)
+        release.set()
+        stopper.join()
+        assert store.status(job_id)['completed'] == 1
+        
+        second = JobRunner(store, _handler, workers=1, poll=0.01)
+        second.start()
+        try:
+            assert _wait(store, job_id)['completed'] == 2
+        finally:
+            second.stop()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,106 @@
+"""
+Unit tests for result bundles
+"""
+
+import pytest
+import numpy as np
+import cv2
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from edge_detection import EdgeDetector, Workspace, DEFAULT_OUTPUTS
+from encoders import ImageEncoder
+from result_bundle import ResultBundle, write_bundle, read_layer
+from result_writer import ResultWriter
+
+
+@pytest.fixture
+def detector():
+    """Create a detector on a synthetic image."""
+    image = np.zeros((90, 120, 3), dtype=np.uint8)
+    cv2.rectangle(image, (15, 15), (100, 70), (200, 180, 160), -1)
+    return EdgeDetector.from_array(image, name='sample', verbose=False)
+
+
+class TestResultBundle:
+    """Test cases for result bundles."""
+    
+    def test_save_bundle(self, detector, tmp_path):
+        """Test that save_results writes a single file with every output."""
+        encoder = ImageEncoder(format='png')
+        paths = detector.save_results(str(tmp_path), encoder=encoder, bundle=True)
+        
+        assert set(paths) == set(DEFAULT_OUTPUTS)
+        assert {Path(path).name for path in paths.values()} == {'sample.npz'}
+        assert [path.name for path in tmp_path.iterdir()] == ['sample.npz']
+        
+        with ResultBundle(paths['canny']) as bundle:
+            assert set(bundle.layers) == set(DEFAULT_OUTPUTS)
+            assert bundle.metadata['source'] == 'sample'
+            assert bundle.metadata['params']['canny_threshold2'] == 150
+            assert bundle.metadata['layers']['canny']['encoding'] == '.png'
+            for name, image in detector.compute().items():
+                np.testing.assert_array_equal(bundle.read(name), image)
+    
+    def test_read_single_layer(self, detector, tmp_path):
+        """Test reading one layer without decoding the others."""
+        path = tmp_path / "sample.npz"
+        results = detector.compute()
+        write_bundle(path, results, encoder=ImageEncoder())
+        np.testing.assert_array_equal(read_layer(path, 'canny'), results['canny'])
+        with pytest.raises(KeyError):
+            read_layer(path, 'missing')
+        
+        # A corrupt layer only fails when it is the one being read
+        with np.load(path) as archive:
+            members = dict(archive)
+        members['grayscale'] = np.frombuffer(b'not an image', dtype=np.uint8)
+        with open(path, 'wb') as stream:
+            np.savez(stream, **members)
+        
+        np.testing.assert_array_equal(read_layer(path, 'canny'), results['canny'])
+        with pytest.raises(ValueError):
+            read_layer(path, 'grayscale')
+    
+    def test_raw_layers(self, detector, tmp_path):
+        """Test bundles without an encoder store exact arrays."""
+        path = tmp_path / "raw.npz"
+        results = detector.compute()
+        header = write_bundle(path, results, metadata={'note': 'raw'})
+        
+        assert header['layers']['grayscale']['encoding'] == 'raw'
+        with ResultBundle(path) as bundle:
+            assert bundle.metadata['note'] == 'raw'
+            np.testing.assert_array_equal(bundle.read('grayscale'), results['grayscale'])
+    
+    def test_not_a_bundle(self, tmp_path):
+        """Test that plain .npz files and missing files are rejected."""
+        path = tmp_path / "plain.npz"
+        np.savez(path, data=np.zeros(3))
+        with pytest.raises(ValueError):
+            ResultBundle(path)
+        with pytest.raises(FileNotFoundError):
+            ResultBundle(tmp_path / "missing.npz")
+    
+    def test_background_bundle(self, detector, tmp_path):
+        """Test bundles queued on a ResultWriter with reused buffers."""
+        workspace = Workspace()
+        image = detector.original_image
+        with ResultWriter() as writer:
+            first = EdgeDetector.from_array(image, name='first', workspace=workspace,
+                                            verbose=False)
+            path = first.save_results(str(tmp_path), writer=writer, bundle=True)['canny']
+            expected = first.compute()['canny'].copy()
+            EdgeDetector.from_array(255 - image, name='second', workspace=workspace,
+                                    verbose=False).save_results(str(tmp_path), writer=writer,
+                                                                bundle=True)
+        
+        np.testing.assert_array_equal(read_layer(path, 'canny'), expected)
+        assert writer.written == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,137 @@
+"""
+Unit tests for the result cache
+"""
+
+import pytest
+import numpy as np
+import cv2
+import os
+import time
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from result_cache import ResultCache, detect_encoded
+from encoders import ImageEncoder
+
+
+@pytest.fixture
+def upload():
+    """Encoded test image."""
+    image = np.full((60, 80, 3), 200, dtype=np.uint8)
+    cv2.circle(image, (40, 30), 15, (20, 20, 20), -1)
+    return cv2.imencode('.png', image)[1].tobytes()
+
+
+def _layers(size):
+    return {'canny': b'c' * size, 'laplacian': b'l' * size}
+
+
+class TestResultCache:
+    """Test cases for ResultCache."""
+    
+    def test_key(self, upload):
+        """Test that keys depend on the content and every setting, not on the order."""
+        key = ResultCache.key(upload, layers=['canny'], params={'sigma': 1.4, 'sobel_kernel': 3})
+        assert key == ResultCache.key(upload, params={'sobel_kernel': 3, 'sigma': 1.4},
+                                      layers=['canny'])
+        assert key != ResultCache.key(upload, layers=['canny'], params={'sigma': 2.0,
+                                                                        'sobel_kernel': 3})
+        assert key != ResultCache.key(upload + b'x', layers=['canny'],
+                                      params={'sigma': 1.4, 'sobel_kernel': 3})
+    
+    def test_memory_and_disk_tiers(self, tmp_path):
+        """Test that another process (a second cache on the folder) hits the disk tier."""
+        cache = ResultCache(str(tmp_path))
+        assert cache.get('ab-1') is None
+        cache.put('ab-1', _layers(10), {'shape': [60, 80]})
+        
+        assert cache.get('ab-1') == (_layers(10), {'shape': [60, 80]})
+        other = ResultCache(str(tmp_path))
+        assert other.get('ab-1') == (_layers(10), {'shape': [60, 80]})
+        assert other.get('ab-1') is not None
+        
+        assert (cache.counters['memory_hits'], cache.counters['misses']) == (1, 1)
+        assert (other.counters['disk_hits'], other.counters['memory_hits']) == (1, 1)
+        stats = other.stats()
+        assert stats['hit_rate'] == 1.0
+        assert stats['disk']['entries'] == 1 and stats['memory']['entries'] == 1
+    
+    def test_memory_eviction(self, tmp_path):
+        """Test that the memory tier evicts the least recently used entries."""
+        # Room for two entries (200 bytes of layers plus a header each)
+        cache = ResultCache(str(tmp_path), memory_bytes=700, disk_bytes=0)
+        for key in ('aa-1', 'aa-2', 'aa-3'):
+            cache.put(key, _layers(100))
+            if key == 'aa-2':
+                cache.get('aa-1')
+        
+        assert cache.get('aa-1') is not None and cache.get('aa-3') is not None
+        assert cache.get('aa-2') is None
+        assert cache.counters['memory_evictions'] == 1
+        assert cache.stats()['memory']['bytes'] <= 700
+    
+    def test_disk_trim(self, tmp_path):
+        """Test that the disk tier is trimmed to size, least recently used first."""
+        writer = ResultCache(str(tmp_path), memory_bytes=0)
+        for i in range(8):
+            writer.put(f"{i:02d}-x", _layers(1000))
+            path = os.path.join(writer.folder, f"{i:02d}", f"{i:02d}-x.bin")
+            os.utime(path, (time.time() - 100 + i, time.time() - 100 + i))
+        # Room for three entries
+        cache = ResultCache(str(tmp_path), memory_bytes=0, disk_bytes=7000)
+        cache.get('00-x')  # Used again, so kept
+        
+        cache.trim()
+        
+        kept = {os.path.basename(path) for path, _, _ in cache._disk_entries()}
+        assert kept == {'00-x.bin', '06-x.bin', '07-x.bin'}
+        assert cache.counters['disk_evictions'] == 5
+    
+    def test_ttl(self, tmp_path):
+        """Test that entries expire in both tiers."""
+        cache = ResultCache(str(tmp_path), ttl_seconds=0.05)
+        cache.put('ab-1', _layers(10))
+        time.sleep(0.1)
+        
+        assert cache.get('ab-1') is None
+        assert ResultCache(str(tmp_path), ttl_seconds=0.05).get('ab-1') is None
+        assert cache.counters['expired'] == 2
+        assert cache.stats()['disk']['entries'] == 0
+    
+    def test_corrupt_entry(self, tmp_path):
+        """Test that a damaged disk entry is a miss and is removed."""
+        cache = ResultCache(str(tmp_path), memory_bytes=0)
+        cache.put('ab-1', _layers(10))
+        path = os.path.join(cache.folder, 'ab', 'ab-1.bin')
+        with open(path, 'r+b') as stream:
+            stream.truncate(30)
+        
+        assert cache.get('ab-1') is None
+        assert not os.path.exists(path)
+    
+    def test_detect_encoded(self, tmp_path, upload):
+        """Test that an identical request is served from the cache."""
+        cache = ResultCache(str(tmp_path))
+        encoder = ImageEncoder()
+        
+        encoded, details, cached = detect_encoded(upload, ('canny',), encoder, cache,
+                                                  decode='grayscale')
+        assert not cached
+        assert details['shape'] == [60, 80]
+        assert details['canny_thresholds'] == [50, 150]
+        assert 0 < details['edge_density']['canny'] < 1
+        
+        again, details_again, cached = detect_encoded(upload, ('canny',), encoder, cache,
+                                                      decode='grayscale')
+        assert cached and again == encoded and details_again == details
+        
+        _, details, cached = detect_encoded(upload, ('canny',), encoder, cache,
+                                            decode='grayscale', canny_threshold1=10)
+        assert not cached and details['canny_thresholds'] == [10, 150]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,76 @@
+"""
+Unit tests for the background result writer
+"""
+
+import pytest
+import numpy as np
+import cv2
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from edge_detection import EdgeDetector, Workspace
+from result_writer import ResultWriter
+
+
+@pytest.fixture
+def test_image():
+    """Create a test image."""
+    image = np.ones((60, 80, 3), dtype=np.uint8) * 255
+    cv2.rectangle(image, (20, 15), (60, 45), (0, 0, 0), -1)
+    return image
+
+
+class TestResultWriter:
+    """Test cases for ResultWriter."""
+    
+    def test_writes_files(self, test_image, tmp_path):
+        """Test that queued images are written like cv2.imwrite would."""
+        with ResultWriter(max_workers=2, max_pending=1) as writer:
+            for i in range(5):
+                writer.submit(tmp_path / f"image_{i}.png", test_image)
+        
+        assert writer.written == 5
+        for i in range(5):
+            np.testing.assert_array_equal(cv2.imread(str(tmp_path / f"image_{i}.png")),
+                                          test_image)
+    
+    def test_errors_raised_on_flush(self, test_image, tmp_path):
+        """Test that failed writes are raised by flush and recorded."""
+        writer = ResultWriter(max_workers=2)
+        writer.submit(tmp_path / "ok.png", test_image)
+        writer.submit(tmp_path / "missing" / "bad.png", test_image)
+        
+        with pytest.raises(RuntimeError):
+            writer.flush()
+        writer.flush()  # each failure is raised once
+        writer.close()
+        
+        assert writer.written == 1
+        assert [Path(path).name for path, _ in writer.failures] == ['bad.png']
+        with pytest.raises(RuntimeError):
+            writer.submit(tmp_path / "late.png", test_image)
+    
+    def test_save_results_with_workspace(self, test_image, tmp_path):
+        """Test that background saves are not clobbered by reused buffers."""
+        workspace = Workspace()
+        other = 255 - test_image
+        with ResultWriter() as writer:
+            first = EdgeDetector.from_array(test_image, name='first', workspace=workspace,
+                                            verbose=False)
+            paths = first.save_results(str(tmp_path), writer=writer)
+            expected = {name: image.copy() for name, image in first.compute().items()}
+            
+            second = EdgeDetector.from_array(other, name='second', workspace=workspace,
+                                             verbose=False)
+            second.save_results(str(tmp_path), writer=writer)
+        
+        for name, path in paths.items():
+            decoded = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+            _, encoded = cv2.imencode(Path(path).suffix, expected[name])
+            np.testing.assert_array_equal(decoded, cv2.imdecode(encoded, cv2.IMREAD_GRAYSCALE))
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
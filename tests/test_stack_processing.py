@@ -0,0 +1,94 @@
+"""
+Unit tests for stack processing
+"""
+
+import pytest
+import numpy as np
+import cv2
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from edge_detection import EdgeDetector, Workspace, OUTPUTS
+from stack_processing import StackDetector, process_stack
+
+
+@pytest.fixture
+def test_stack():
+    """Create a stack of textured BGR images."""
+    rng = np.random.default_rng(0)
+    images = []
+    for _ in range(4):
+        small = (rng.random((12, 16)) * 255).astype(np.uint8)
+        gray = cv2.resize(small, (64, 48), interpolation=cv2.INTER_CUBIC)
+        images.append(cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR))
+    return np.stack(images)
+
+
+class TestStackProcessing:
+    """Test cases for stacked processing."""
+    
+    @pytest.mark.parametrize('params', [
+        {},
+        {'sobel_kernel': 5, 'precision': 'float32'},
+        {'blur_kernel_size': (7, 7), 'laplacian_kernel': 5},
+        # Overflows int16, so both fall back to float32
+        {'blur_kernel_size': (1, 1), 'sobel_kernel': 7, 'laplacian_kernel': 7}
+    ])
+    def test_matches_single_images(self, test_stack, params):
+        """Test that every stacked output matches processing images one by one."""
+        results = process_stack(test_stack, outputs=OUTPUTS, **params)
+        
+        for i, image in enumerate(test_stack):
+            expected = EdgeDetector.from_array(image, outputs=OUTPUTS).compute(**params)
+            for name in OUTPUTS:
+                assert results[name].shape == test_stack.shape[:3]
+                np.testing.assert_array_equal(results[name][i], expected[name])
+    
+    def test_grayscale_stack(self, test_stack):
+        """Test that (N, H, W) stacks are accepted."""
+        gray = test_stack[..., 0]
+        results = process_stack(gray, outputs=('grayscale', 'canny'))
+        np.testing.assert_array_equal(results['grayscale'], gray)
+        np.testing.assert_array_equal(results['canny'][2],
+                                      EdgeDetector.from_array(gray[2]).compute({'canny'})['canny'])
+    
+    def test_workers_and_workspace(self, test_stack):
+        """Test that threaded filters and a reused workspace give the same stacks."""
+        expected = process_stack(test_stack, outputs=OUTPUTS)
+        workspace = Workspace()
+        process_stack(test_stack, outputs=OUTPUTS, workers=3, workspace=workspace)
+        allocations = workspace.allocations
+        
+        results = process_stack(test_stack, outputs=OUTPUTS, workers=3, workspace=workspace)
+        assert workspace.allocations == allocations
+        for name in OUTPUTS:
+            np.testing.assert_array_equal(results[name], expected[name])
+    
+    def test_canny_sweep(self, test_stack):
+        """Test that sweeps never join edges across neighbouring images."""
+        thresholds = [(20, 60), (40, 40), (5, 200)]
+        masks, densities = StackDetector(test_stack).canny_sweep(thresholds)
+        assert masks.shape == (3,) + test_stack.shape[:3]
+        assert densities.shape == (3, test_stack.shape[0])
+        
+        for i, image in enumerate(test_stack):
+            expected, expected_densities = EdgeDetector.from_array(image).canny_sweep(thresholds)
+            np.testing.assert_array_equal(masks[:, i], expected)
+            np.testing.assert_allclose(densities[:, i], expected_densities)
+    
+    def test_invalid_stacks(self, test_stack):
+        """Test that non-stack input is rejected."""
+        with pytest.raises(ValueError):
+            StackDetector(test_stack[0, ..., 0])
+        with pytest.raises(ValueError):
+            StackDetector(test_stack.astype(np.float32))
+        with pytest.raises(ValueError):
+            StackDetector(test_stack[..., :2])
+        with pytest.raises(ValueError):
+            StackDetector(test_stack[:0])
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,164 @@
+"""
+Unit tests for out-of-core strip processing
+"""
+
+import pytest
+import numpy as np
+import cv2
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from edge_detection import EdgeDetector, OUTPUTS
+from strip_processing import open_source, process_in_strips, process_in_tiles
+
+
+@pytest.fixture
+def test_image():
+    """Create a textured BGR test image."""
+    rng = np.random.default_rng(0)
+    small = (rng.random((30, 40)) * 255).astype(np.uint8)
+    gray = cv2.resize(small, (160, 120), interpolation=cv2.INTER_CUBIC)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+
+@pytest.fixture
+def serpentine_image():
+    """Faint band snaking up and down the image, bright only at its far end."""
+    image = np.zeros((120, 100), dtype=np.uint8)
+    for i, x in enumerate(range(10, 90, 12)):
+        cv2.line(image, (x, 10), (x, 110), 60, 4)
+        y = 110 if i % 2 == 0 else 10
+        if x + 12 < 90:
+            cv2.line(image, (x, y), (x + 12, y), 60, 4)
+    cv2.rectangle(image, (80, 55), (90, 65), 255, -1)
+    return image
+
+
+class TestStripProcessing:
+    """Test cases for band-wise processing."""
+    
+    @pytest.mark.parametrize('band_height', [1, 7, 32, 500])
+    def test_matches_whole_image(self, test_image, tmp_path, band_height):
+        """Test that every output matches whole-image processing exactly."""
+        expected = EdgeDetector.from_array(test_image).compute(OUTPUTS)
+        paths = process_in_strips(test_image, str(tmp_path), outputs=OUTPUTS,
+                                  band_height=band_height)
+        
+        for name in OUTPUTS:
+            np.testing.assert_array_equal(np.load(paths[name]), expected[name])
+    
+    def test_custom_parameters(self, test_image, tmp_path):
+        """Test that halo rows grow with kernel sizes."""
+        params = dict(blur_kernel_size=(9, 9), sigma=2.0, sobel_kernel=7, laplacian_kernel=5)
+        expected = EdgeDetector.from_array(test_image).compute(OUTPUTS, **params)
+        paths = process_in_strips(test_image, str(tmp_path), outputs=OUTPUTS,
+                                  band_height=5, **params)
+        
+        for name in OUTPUTS:
+            np.testing.assert_array_equal(np.load(paths[name]), expected[name])
+    
+    def test_auto_thresholds(self, test_image, tmp_path):
+        """Test that automatic Canny thresholds come from the whole image, not each band."""
+        expected = EdgeDetector.from_array(test_image).compute({'canny'}, canny_auto='median')
+        paths = process_in_strips(test_image, str(tmp_path), band_height=16,
+                                  canny_auto='median')
+        
+        np.testing.assert_array_equal(np.load(paths['canny']), expected['canny'])
+    
+    def test_hysteresis_across_bands(self, serpentine_image, tmp_path):
+        """Test Canny hysteresis that has to travel back up through many bands."""
+        params = dict(blur_kernel_size=(1, 1), canny_threshold1=100, canny_threshold2=600)
+        expected = EdgeDetector.from_array(serpentine_image).compute({'canny'}, **params)
+        paths = process_in_strips(serpentine_image, str(tmp_path), band_height=8, **params)
+        
+        canny = np.load(paths['canny'])
+        assert canny[:, :20].any()
+        np.testing.assert_array_equal(canny, expected['canny'])
+    
+    def test_npy_source_is_memory_mapped(self, test_image, tmp_path):
+        """Test that .npy inputs are opened as memmaps."""
+        path = tmp_path / 'scan.npy'
+        np.save(path, test_image)
+        
+        source = open_source(str(path))
+        assert isinstance(source, np.memmap)
+        
+        paths = process_in_strips(source, str(tmp_path / 'out'), base_name='scan',
+                                  band_height=16)
+        assert Path(paths['canny']).name == 'scan_canny.npy'
+    
+    @pytest.mark.parametrize('extension', ['.pgm', '.ppm'])
+    def test_netpbm_source_is_memory_mapped(self, test_image, tmp_path, extension):
+        """Test that binary PGM/PPM inputs are memory-mapped and read as OpenCV would."""
+        path = str(tmp_path / f'scan{extension}')
+        cv2.imwrite(path, test_image if extension == '.ppm' else test_image[:, :, 0])
+        
+        source = open_source(path)
+        assert isinstance(source, np.memmap)
+        np.testing.assert_array_equal(source, cv2.imread(path, cv2.IMREAD_UNCHANGED))
+        
+        expected = EdgeDetector.from_array(np.array(source)).compute({'canny'})
+        paths = process_in_strips(source, str(tmp_path / 'out'), band_height=16)
+        np.testing.assert_array_equal(np.load(paths['canny']), expected['canny'])
+    
+    def test_refuses_full_decode(self, test_image, tmp_path):
+        """Test that formats that cannot be read in bands need full_read."""
+        path = str(tmp_path / 'scan.png')
+        cv2.imwrite(path, test_image)
+        
+        with pytest.raises(ValueError, match="cannot be read in bands"):
+            open_source(path)
+        assert open_source(path, full_read=True).shape == test_image.shape[:2]
+    
+    def test_invalid_band_height(self, test_image, tmp_path):
+        """Test that band height must be positive."""
+        with pytest.raises(ValueError):
+            process_in_strips(test_image, str(tmp_path), band_height=0)
+
+
+
+class TestTileProcessing:
+    """Test cases for parallel tile processing."""
+    
+    @pytest.mark.parametrize('tile_height', [1, 9, 40])
+    def test_matches_serial(self, test_image, tile_height):
+        """Test that stitched tiles match single-threaded processing exactly."""
+        expected = EdgeDetector.from_array(test_image).compute(OUTPUTS)
+        results = process_in_tiles(test_image, outputs=OUTPUTS, workers=4,
+                                   tile_height=tile_height)
+        
+        for name in OUTPUTS:
+            np.testing.assert_array_equal(results[name], expected[name])
+    
+    def test_hysteresis_across_tiles(self, serpentine_image):
+        """Test Canny edges that are only connected through other tiles."""
+        params = dict(blur_kernel_size=(1, 1), canny_threshold1=100, canny_threshold2=600)
+        expected = EdgeDetector.from_array(serpentine_image).compute({'canny'}, **params)
+        results = process_in_tiles(serpentine_image, workers=4, tile_height=8, **params)
+        
+        assert results['canny'][:, :20].any()
+        np.testing.assert_array_equal(results['canny'], expected['canny'])
+    
+    def test_auto_thresholds(self, test_image):
+        """Test that tiles share the whole image's automatic Canny thresholds."""
+        expected = EdgeDetector.from_array(test_image).compute({'canny'}, canny_auto='otsu')
+        results = process_in_tiles(test_image, workers=3, tile_height=20, canny_auto='otsu')
+        
+        np.testing.assert_array_equal(results['canny'], expected['canny'])
+    
+    def test_detector_workers(self, test_image):
+        """Test that EdgeDetector.compute(workers=...) tiles large images."""
+        large = cv2.resize(test_image, (2000, 2000))
+        expected = EdgeDetector.from_array(large).compute({'canny', 'laplacian'})
+        
+        detector = EdgeDetector.from_array(large)
+        results = detector.compute({'canny', 'laplacian'}, workers=3)
+        assert detector.blurred_image is None  # produced per tile, never whole
+        for name in expected:
+            np.testing.assert_array_equal(results[name], expected[name])
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -8,24 +8,74 @@ import matplotlib.pyplot as plt
 import sys
 import os
 
+from encoders import FORMATS
+from result_bundle import BUNDLE_EXTENSION, ResultBundle
+
+
+def find_result(output_dir, base_name, name):
+    """
+    Find a saved result whatever format it was written in.
+    
+    Returns:
+        str: Path of the result file, or None if it does not exist
+    """
+    for extension in dict.fromkeys(FORMATS.values()):
+        path = f'{output_dir}/{base_name}_{name}{extension}'
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def load_results(output_dir, base_name, names):
+    """
+    Load result layers from a bundle, or from separate files if there is none.
+    
+    Only the requested layers are read; a bundle decodes nothing else.
+    
+    Returns:
+        dict: Layer name -> grayscale image, or None where it is missing
+    """
+    bundle_path = f'{output_dir}/{base_name}{BUNDLE_EXTENSION}'
+    if os.path.exists(bundle_path):
+        with ResultBundle(bundle_path) as bundle:
+            return {name: bundle.read(name) if name in bundle else None for name in names}
+    
+    paths = {name: find_result(output_dir, base_name, name) for name in names}
+    return {name: cv2.imread(path, cv2.IMREAD_GRAYSCALE) if path else None
+            for name, path in paths.items()}
+
+
+def view_layer(base_name, name, output_dir='output'):
+    """
+    View a single result layer.
+    """
+    image = load_results(output_dir, base_name, [name])[name]
+    if image is None:
+        print(f"[ERROR] No '{name}' result for {base_name} in {output_dir}/")
+        return
+    
+    plt.figure(figsize=(8, 6))
+    plt.imshow(image, cmap='gray')
+    plt.title(f'{base_name} - {name}', fontweight='bold')
+    plt.axis('off')
+    plt.tight_layout()
+    print("[OK] Displaying result window...")
+    plt.show()
+
+
 def view_results(base_name='test_image'):
     """
     View all edge detection results for a given image.
     """
     output_dir = 'output'
     
-    # Check if files exist
-    required_files = [
-        f'{output_dir}/{base_name}_grayscale.jpg',
-        f'{output_dir}/{base_name}_blurred.jpg',
-        f'{output_dir}/{base_name}_sobel_x.jpg',
-        f'{output_dir}/{base_name}_sobel_y.jpg',
-        f'{output_dir}/{base_name}_sobel_combined.jpg',
-        f'{output_dir}/{base_name}_laplacian.jpg',
-        f'{output_dir}/{base_name}_canny.jpg'
-    ]
-    
-    missing_files = [f for f in required_files if not os.path.exists(f)]
+    names = ['grayscale', 'blurred', 'sobel_x', 'sobel_y', 'sobel_combined', 'laplacian', 'canny']
+    
+    # Load images (from a bundle or files in any configured output format)
+    print("Loading results...")
+    images = load_results(output_dir, base_name, names)
+    missing_files = [f'{output_dir}/{base_name}_{name}.*' for name, image in images.items()
+                     if image is None]
     if missing_files:
         print(f"[ERROR] Missing result files:")
         for f in missing_files:
@@ -34,15 +84,8 @@ def view_results(base_name='test_image'):
         print(f"  python run_edge_detection_quick.py")
         return
     
-    # Load images
-    print("Loading results...")
-    grayscale = cv2.imread(f'{output_dir}/{base_name}_grayscale.jpg', cv2.IMREAD_GRAYSCALE)
-    blurred = cv2.imread(f'{output_dir}/{base_name}_blurred.jpg', cv2.IMREAD_GRAYSCALE)
-    sobel_x = cv2.imread(f'{output_dir}/{base_name}_sobel_x.jpg', cv2.IMREAD_GRAYSCALE)
-    sobel_y = cv2.imread(f'{output_dir}/{base_name}_sobel_y.jpg', cv2.IMREAD_GRAYSCALE)
-    sobel_combined = cv2.imread(f'{output_dir}/{base_name}_sobel_combined.jpg', cv2.IMREAD_GRAYSCALE)
-    laplacian = cv2.imread(f'{output_dir}/{base_name}_laplacian.jpg', cv2.IMREAD_GRAYSCALE)
-    canny = cv2.imread(f'{output_dir}/{base_name}_canny.jpg', cv2.IMREAD_GRAYSCALE)
+    grayscale, blurred, sobel_x, sobel_y, sobel_combined, laplacian, canny = (
+        images[name] for name in names)
     
     # Create figure with subplots
     fig, axes = plt.subplots(2, 4, figsize=(16, 8))
@@ -90,23 +133,31 @@ def view_results(base_name='test_image'):
     
     print("\n[OK] Results displayed successfully!")
 
+
 def main():
     base_name = 'test_image'
+    layer = None
     
     if len(sys.argv) > 1:
         base_name = sys.argv[1]
+    if len(sys.argv) > 2:
+        layer = sys.argv[2]
     
     print("\n" + "=" * 60)
     print("EDGE DETECTION RESULTS VIEWER")
     print("=" * 60)
     print(f"\nViewing results for: {base_name}")
     
-    view_results(base_name)
+    if layer:
+        view_layer(base_name, layer)
+    else:
+        view_results(base_name)
     
     print("\n" + "=" * 60)
     print("All result files are saved in: output/")
     print("=" * 60 + "\n")
 
+
 if __name__ == "__main__":
     try:
         main()